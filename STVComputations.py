@@ -1,10 +1,15 @@
 from dataclasses import dataclass
-from typing import List, Dict, Optional, Set
-import re
+from typing import List, Dict, Generator, Optional, Set, Tuple, Union
+import os
+import math
 import itertools
+from fractions import Fraction
+from multiprocessing import Pool
 from copy import deepcopy, copy
 from pprint import pprint
 
+from utils import ballot_classes, monotone
+
 # from utils import jitdataclass
 # from numba.experimental import jitclass
 
@@ -47,63 +52,292 @@ def tot_votes(ps: List[Profile]) -> int:
 
 
 def format_ballot(ballot: str) -> list:
-    """extract good format for ballot from a string"""
+    """extract good format for ballot from a string
+    "1,{2,3},4" -> [[1], [2, 3], [4]]
+    """
 
     my_list = []
-    for x in re.findall(r"\d+|\{[^}]*\}", ballot):
-        if "{" in x:
-            sub_list = [int(y) for y in x.strip("{}").split(",")]
-            my_list.append(sub_list)
+    tie = None  # the cell being filled while inside {...}
+    for tok in ballot.split(","):
+        tok = tok.strip()
+        if tok.startswith("{"):
+            tie = []
+            tok = tok[1:]
+        closing = tok.endswith("}")
+        if closing:
+            tok = tok[:-1]
+
+        if tie is None:
+            if tok:
+                my_list.append([int(tok)])
         else:
-            my_list.append([int(x)])
+            if tok:
+                tie.append(int(tok))
+            if closing:
+                my_list.append(tie)
+                tie = None
 
     return my_list
 
 
 def line_extract(line: str) -> Profile:
     "Build Profile from `toi` text line"
-    data_parts = line.split(":")  # split count from ballot
-    count = int(data_parts[0])
-    ballot = data_parts[1]
-    ballot = format_ballot(ballot)
-    return Profile(ballot, count)
+    count, ballot = line.split(":", 1)  # split count from ballot
+    return Profile(format_ballot(ballot), int(count))
 
 
-def extract_data(path: str = "./data/city-council.txt") -> List[Profile]:
-    """function to read and extract data from the dataset
-    :return dictionary containing nr of votes as key, and ballot as value"""
+def is_data_line(line: str) -> bool:
+    "Metadata (`# KEY: VALUE`) and empty lines carry no ballots"
+    return not line.startswith("#") and bool(line.strip())
 
-    votes = list()
+
+def read_metadata(path: str) -> Dict[str, str]:
+    """Read the PrefLib metadata header of a toi/soi file,
+    the `# KEY: VALUE` lines at the top of the file, i.e.
+    {"NUMBER ALTERNATIVES": "5", "ALTERNATIVE NAME 1": "...", ...}
+    """
+    meta = {}
     with open(path, "r") as file:
-        return [
-            line_extract(line)
-            for line in file
-            if not line.startswith("#")
-            or not line.strip()  # skip comments and empty lines
-        ]
+        for line in file:
+            if not line.startswith("#"):
+                break
+            key, _, value = line[1:].partition(":")
+            meta[key.strip()] = value.strip()
+    return meta
+
+
+def iter_profiles(
+    path: str, batch_size: int = 10_000
+) -> Generator[List[Profile], None, None]:
+    """Stream the Profiles of a toi/soi file in batches of (at most) `batch_size`,
+    so that only one batch at a time is held in memory.
+    Ballots are not merged.
+    """
+    batch = []
+    with open(path, "r") as file:
+        for line in file:
+            if is_data_line(line):
+                batch.append(line_extract(line))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+# files smaller than this are not worth splitting across processes
+MIN_CHUNK_BYTES = 1 << 20
+
+
+def _parse_chunk(args: Tuple[str, int, int, bool]) -> List[Profile]:
+    """Parse the lines of the file starting in the [start, end) byte range.
+    The line crossing `start` belongs to the previous chunk.
+    Merging within the chunk already cuts what has to be sent back to the parent
+    """
+    path, start, end, merge = args
+    votes = []
+    with open(path, "rb") as file:
+        if start > 0:
+            # move to the first line starting at or after start
+            file.seek(start - 1)
+            file.readline()
+        while file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            line = line.decode()
+            if is_data_line(line):
+                votes.append(line_extract(line))
+    return merge_profiles(votes) if merge else votes
+
+
+def _parse_parallel(path: str, procs: int, merge: bool) -> List[Profile]:
+    "Split the file in byte ranges and parse them on `procs` processes"
+    size = os.path.getsize(path)
+    n_chunks = max(1, min(procs, size // MIN_CHUNK_BYTES))
+    bounds = [size * i // n_chunks for i in range(n_chunks + 1)]
+    chunks = [(path, lo, hi, merge) for lo, hi in zip(bounds, bounds[1:])]
+
+    if n_chunks == 1:
+        return _parse_chunk(chunks[0])
+
+    with Pool(procs) as pool:
+        return list(itertools.chain(*pool.map(_parse_chunk, chunks)))
+
+
+def extract_data(
+    path: str = "./data/city-council.txt",
+    merge: bool = True,
+    procs: int = 1,
+    cache: bool = False,
+) -> List[Profile]:
+    """function to read and extract data from the dataset
+    if `merge` the ballots are canonicalized and identical ones are merged (see `merge_profiles`)
+    if `procs` > 1 large files are parsed in chunks on that many processes
+    if `cache` the parsed data is stored in (and reloaded from) a binary sidecar, see `datacache`
+    :return list of Profile, one per (distinct) ballot"""
+
+    if cache:
+        import datacache  # imported here as it depends on this module
+
+        return datacache.load_profiles(path, merge, procs=procs)
+
+    if procs > 1:
+        votes = _parse_parallel(path, procs, merge)
+    else:
+        votes = list(itertools.chain(*iter_profiles(path)))
+
+    return merge_profiles(votes) if merge else votes
+
+
+BallotKey = Tuple[Tuple[int, ...], ...]
+
+# a plurality score, exact even when a vote is split over a tie (see `plurality_round`)
+Score = Union[int, Fraction]
+
+
+def canonical_ballot(ballot: List[List[int]]) -> List[List[int]]:
+    "Same linear order with the alts of each tie cell sorted: [[2], [4, 3]] -> [[2], [3, 4]]"
+    return [sorted(cell) for cell in ballot]
+
+
+def ballot_key(ballot: List[List[int]]) -> BallotKey:
+    "Hashable canonical form of a ballot, equal for orders that differ only in the order of ties"
+    return tuple(tuple(sorted(cell)) for cell in ballot)
+
+
+def merge_profiles(ps: List[Profile]) -> List[Profile]:
+    """Collapse the Profiles with the same (canonical) ballot in a single
+    Profile counting all their voters.
+    Profiles keep the position of the first occurrence of their ballot,
+    the given Profiles are not modified.
+    """
+    merged: Dict[BallotKey, Profile] = {}
+    for p in ps:
+        key = ballot_key(p.ballot)
+        if key in merged:
+            merged[key].count += p.count
+        else:
+            merged[key] = Profile(canonical_ballot(p.ballot), p.count)
+    return list(merged.values())
 
 
 def plurality_round(
     votes: List[Profile], available_alternatives: Set[int]
-) -> Dict[int, float]:
-    """does 1 round of plurality, then returns a dictionary containing alternative:nr of votes (plurality)"""
+) -> Dict[int, Score]:
+    """does 1 round of plurality, then returns a dictionary containing alternative:nr of votes (plurality)
+    NOTE: a ballot splits its count equally among the alternatives of its top cell,
+    the scores are exact: ints, or Fractions when a split does not divide the count
+    """
+
+    # the live top cells, and a multiple of all their sizes to split the votes in ints
+    # (exhausted ballots count for nobody)
+    tops = [
+        (p.count, top)
+        for p in votes
+        if (top := live_top_cell(p, available_alternatives))
+    ]
+    scale = math.lcm(*set(len(top) for _, top in tops))
 
     alternative_count = dict()
     for alternative in available_alternatives:
         alternative_count[alternative] = 0
 
-    for profile in votes:
-        # NOTE: we can do this version any way, still works if
-        # len(profile.ballot[0]) == 1, then divisor is 1 and we add the simple count
-        # if it's '{x,y,..}' case then we split the count equally
-        for idx, alt in enumerate(profile.ballot[0]):
-            alternative_count[profile.ballot[0][idx]] += profile.count * (
-                1 / len(profile.ballot[0])
-            )
+    for count, top in tops:
+        if len(top) == 1:
+            alternative_count[top[0]] += count * scale
+        else:
+            # if it's '{x,y,..}' case then we split the count equally
+            share = count * scale // len(top)
+            for alt in top:
+                alternative_count[alt] += share
 
-    return alternative_count
+    return {
+        a: v // scale if v % scale == 0 else Fraction(v, scale)
+        for a, v in alternative_count.items()
+    }
 
 
+def live_top_cell(profile: Profile, available_alternatives: Set[int]) -> List[int]:
+    """The first cell of the ballot that contains available alternatives,
+    restricted to those. Empty if the ballot ranks none of them.
+    This lets us skip eliminated alternatives without removing them from the ballot.
+    """
+    for cell in profile.ballot:
+        live = [a for a in cell if a in available_alternatives]
+        if live:
+            return live
+    return []
+
+
+# ==========================================
+# Ballot equivalence classes
+#
+# For a manipulation search: given the ballots of the other voters and a coalition
+# of up to `n_max` voters, these yield one ordering of the given `cells` per class of
+# orderings that always lead the SCF to the same outcome, whatever the number
+# of coalition voters submitting it.
+
+
+def plurality_ballot_classes(
+    others: List[Profile], n_max: int, cells: List[List[int]]
+) -> Generator[List[List[int]], None, None]:
+    "Plurality only looks at the top cell: one ordering per top cell"
+    for i, top in enumerate(cells):
+        yield [top] + cells[:i] + cells[i + 1 :]
+
+
+def forced_eliminations(
+    others: List[Profile], n_max: int, alts: Set[int]
+) -> List[int]:
+    """The alternatives that STV eliminates one by one in the first rounds
+    whatever the ballots of `n_max` more voters: in each round the alternative
+    whose score plus `n_max` is still below the score of any other live one.
+    """
+    forced: List[int] = []
+    live = set(alts)
+    while len(live) > 1:
+        scores = plurality_round(others, live)
+        low = min(live, key=lambda a: scores[a])
+        rest = min([scores[a] for a in live if a != low])
+        if not scores[low] + n_max < rest:
+            break
+        forced.append(low)
+        live.remove(low)
+    return forced
+
+
+def stv_ballot_classes(
+    others: List[Profile], n_max: int, cells: List[List[int]]
+) -> Generator[List[List[int]], None, None]:
+    """The alternatives in `forced_eliminations` are dropped in the first rounds
+    before any other, so the forced cells ahead of the non forced ones only tell
+    after which of those rounds the ballot starts counting for a non forced one:
+    the last forced alternative (in elimination order) it ranks first.
+    The orderings yielded are: the first j forced cells in elimination order (for
+    each j), then any ordering of the non forced cells, then the remaining forced
+    cells in reverse elimination order (where they never matter).
+    """
+    alts = all_alts(others) | set(itertools.chain(*cells))
+    order = {a: i for i, a in enumerate(forced_eliminations(others, n_max, alts))}
+
+    forced = sorted(
+        [c for c in cells if len(c) == 1 and c[0] in order], key=lambda c: order[c[0]]
+    )
+    free = [c for c in cells if not (len(c) == 1 and c[0] in order)]
+
+    for j in range(len(forced) + 1):
+        rest = forced[j:][::-1]
+        # with no free cells the last forced one always matters: only all the
+        # forced cells in elimination order
+        if not free and rest:
+            continue
+        for perm in itertools.permutations(free):
+            yield forced[:j] + list(perm) + rest
+
+
+@monotone
+@ballot_classes(plurality_ballot_classes)
 def plurality(votes: List[Profile]) -> Set[int]:
     alts = all_alts(votes)
     p_scores = plurality_round(votes, alts)
@@ -111,10 +345,11 @@ def plurality(votes: List[Profile]) -> Set[int]:
     return set([a for a in alts if p_scores[a] == max_p])
 
 
-def top_rank_majority(votes: List[Profile], p_scores: Dict[int, float]) -> Set[int]:
-    tot = sum([p.count for p in votes])
-    fifty_percent_plus_one = (tot * 0.5) + 1
-    return set([a for a in p_scores.keys() if p_scores[a] >= fifty_percent_plus_one])
+def top_rank_majority(votes: List[Profile], p_scores: Dict[int, Score]) -> Set[int]:
+    # only ballots that still rank some of the scored alternatives are counted
+    tot = sum([p.count for p in votes if live_top_cell(p, p_scores.keys())])
+    # score >= (tot * 0.5) + 1, kept exact
+    return set([a for a in p_scores.keys() if 2 * p_scores[a] >= tot + 2])
 
 
 def remove_alternative(
@@ -145,7 +380,7 @@ def remove_alternative(
 
 
 def print_recap(
-    p_scores: Dict[int, float], alternatives: Set[int], vote_round: int
+    p_scores: Dict[int, Score], alternatives: Set[int], vote_round: int
 ) -> None:
     print(
         f"\t____________________________ vote round: {vote_round} ________________________________________\n"
@@ -190,13 +425,15 @@ def stv_computations(votes: List[Profile], nr_of_alt: int, printing: bool) -> Li
     return [0]
 
 
+@ballot_classes(stv_ballot_classes)
 def stv(
     votes: List[Profile], verbose: bool = False, break_on_majority=True
 ) -> Set[int]:
     """
     Slightly changed stv computation function.
     - Auto computes alternatives from the given List[Profile]
-    - Does not modify the input objects, creates a deepcopy
+    - Does not modify nor copy the input objects, eliminated alternatives are
+      just skipped when looking for the top cell of each ballot
     - Uses and returns sets instead of lists (should be faster too)
     - Loops untill all alts are removed and returns last non-empty alt-set instead of fixed # of rounds
     """
@@ -208,7 +445,6 @@ def stv(
         print("STV start: init_alts =", full_alts)
 
     _alts_hist = []
-    _votes = deepcopy(votes)  # don't modify original votes
     _alts = full_alts.copy()  # the working set of alts
 
     if not _alts:
@@ -218,20 +454,18 @@ def stv(
 
         _alts_hist.append(_alts.copy())  # store history of remaining alternatives
 
-        p_scores = plurality_round(_votes, _alts)  # run plurality round
+        p_scores = plurality_round(votes, _alts)  # run plurality round
 
         # added break in case of a majority earlier in rounds based
         # on walsh's paper
         if break_on_majority:
-            if maj := top_rank_majority(_votes, p_scores):
+            if maj := top_rank_majority(votes, p_scores):
                 return maj
 
         min_value = min(p_scores.values())  # find minimal score
         # find alts with minimal score
         min_alts = set([k for k, v in p_scores.items() if v == min_value])
 
-        remove_alternative(_votes, min_alts)
-
         _alts = _alts - min_alts  # remove the dropped alts
 
         if verbose:
@@ -246,6 +480,97 @@ def stv(
     return _alts_hist[-1]
 
 
+@ballot_classes(stv_ballot_classes)
+def stv_incremental(
+    votes: List[Profile], verbose: bool = False, break_on_majority=True
+) -> Set[int]:
+    """
+    Same SCF as `stv` but the tally is kept live across rounds instead of being
+    recomputed from scratch.
+    - Each ballot has a cursor on its current top cell (the first one with live alts)
+    - An index maps each alternative to the ballots currently counting for it
+    - Eliminating an alternative only visits the ballots it held, their weight moves
+      to the next cell with surviving alternatives (or the ballot is exhausted)
+    - Scores are integers (votes scaled by the lcm of the cell sizes) so splitting
+      a vote over a tie stays exact
+    - Never modifies the given profiles
+    """
+
+    full_alts = all_alts(votes)
+
+    if not full_alts:
+        raise ValueError("There are no alternatives...")
+
+    max_cell = max([len(cell) for p in votes for cell in p.ballot], default=1)
+    scale = math.lcm(*range(1, max_cell + 1))
+
+    _alts = full_alts.copy()
+    cursor = [0] * len(votes)  # current top cell of each ballot
+    members: List[List[int]] = [[] for _ in votes]  # live alts of that cell
+    holders: Dict[int, Set[int]] = {a: set() for a in full_alts}
+    tally: Dict[int, int] = {a: 0 for a in full_alts}
+    tot = 0  # votes of the non exhausted ballots
+
+    def _count(i: int, p: Profile):
+        "Move the cursor of the ith ballot to its first live cell and count it"
+        nonlocal tot
+        while cursor[i] < len(p.ballot):
+            live = [a for a in p.ballot[cursor[i]] if a in _alts]
+            if live:
+                members[i] = live
+                share = p.count * scale // len(live)
+                for a in live:
+                    tally[a] += share
+                    holders[a].add(i)
+                return
+            cursor[i] += 1
+        members[i] = []
+        tot -= p.count  # ballot exhausted
+
+    for i, p in enumerate(votes):
+        tot += p.count
+        _count(i, p)
+
+    _alts_hist = []
+    round = 1
+
+    while _alts:
+        _alts_hist.append(_alts.copy())
+
+        if break_on_majority:
+            # tally / scale >= (tot * 0.5) + 1
+            maj = set([a for a in _alts if 2 * tally[a] >= (tot + 2) * scale])
+            if maj:
+                return maj
+
+        min_value = min([tally[a] for a in _alts])
+        min_alts = set([a for a in _alts if tally[a] == min_value])
+
+        if verbose:
+            print_recap({a: tally[a] / scale for a in _alts}, min_alts, round)
+
+        # the ballots whose top cell loses at least one alternative
+        moved = set()
+        for a in min_alts:
+            moved.update(holders.pop(a))
+            del tally[a]
+
+        _alts = _alts - min_alts
+
+        for i in moved:
+            p = votes[i]
+            share = p.count * scale // len(members[i])
+            for a in members[i]:
+                if a in _alts:
+                    tally[a] -= share
+                    holders[a].discard(i)
+            _count(i, p)
+
+        round += 1
+
+    return _alts_hist[-1]
+
+
 if __name__ == "__main__":
     # votes = extract_data()
     # print(f"winner: {stv_computations(votes, 11, printing=True)}")
@@ -0,0 +1,6 @@
+"""
+Benchmark suite, see suite.py. Run it from the repo root:
+
+    python -m benchmarks run [--spec stv_optim_perm] [--bench search] ...
+    python -m benchmarks compare <old report>.json <new report>.json
+"""
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+CLI of the benchmark suite, run from the repo root with `python -m benchmarks`.
+"""
+import glob
+
+import click
+
+import synthetic
+from benchmarks import suite
+
+
+def echo_timing(t: suite.Timing):
+    extra = "".join(f"\t{k}={v:.3g}" for k, v in t.extra.items())
+    click.echo(
+        f"{t.bench:<18}{t.spec or '-':<40}{t.election:<20}"
+        f"{t.ops:>8} ops\t{t.seconds:8.3f}s\t{t.rate:12.1f} ops/s{extra}"
+    )
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(help="run the benchmarks and save the report")
+@click.option(
+    "-d",
+    "--dataset",
+    "datasets",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="datasets to run on, all of ./data by default",
+)
+@click.option(
+    "--size",
+    "sizes",
+    multiple=True,
+    type=int,
+    default=suite.SYNTHETIC_SIZES,
+    show_default=True,
+    help="number of voters of the synthetic elections",
+)
+@click.option("--alts", type=int, default=suite.SYNTHETIC_ALTS, show_default=True)
+@click.option(
+    "--model",
+    type=click.Choice(list(synthetic.MODELS)),
+    default=suite.SYNTHETIC_MODEL,
+    show_default=True,
+    help="model of the synthetic elections",
+)
+@click.option("--seed", type=int, default=0)
+@click.option(
+    "-s",
+    "--spec",
+    "specs",
+    multiple=True,
+    help="specs of the manipulation benchmarks, all the configs by default",
+)
+@click.option(
+    "-b",
+    "--bench",
+    "benches",
+    multiple=True,
+    type=click.Choice(suite.BENCHES),
+    help="benchmarks to run, all by default",
+)
+@click.option("--min-time", type=float, default=suite.MIN_TIME, show_default=True)
+@click.option(
+    "--budget",
+    type=float,
+    default=suite.BUDGET,
+    show_default=True,
+    help="seconds of each manipulation benchmark",
+)
+@click.option(
+    "-o",
+    "--out-dir",
+    type=click.Path(file_okay=False, dir_okay=True),
+    default=suite.RESULTS_DIR,
+)
+def run(datasets, sizes, alts, model, seed, specs, benches, min_time, budget, out_dir):
+    # imported here, the other commands do not need the configs deps
+    from configs import configs
+
+    for s in specs:
+        if s not in configs:
+            raise click.BadParameter(f"unknown spec {s}", param_hint="--spec")
+    specs = {s: configs[s] for s in specs or configs}
+    datasets = list(datasets) or sorted(glob.glob("./data/*.txt"))
+    benches = list(benches) or suite.BENCHES
+
+    def run_on(elections):
+        return suite.run_suite(elections, specs, benches, min_time, budget, echo_timing)
+
+    timings = run_on(suite.dataset_elections(datasets))
+    scaled = run_on(suite.synthetic_elections(sizes, alts, seed, model))
+
+    params = {
+        "datasets": datasets,
+        "sizes": list(sizes),
+        "alts": alts,
+        "model": model,
+        "seed": seed,
+        "specs": list(specs),
+        "benches": benches,
+        "min_time": min_time,
+        "budget": budget,
+    }
+    rep = suite.report(timings + scaled, scaled, params)
+
+    click.echo("\nscaling (seconds per op ~ voters^exponent):")
+    for name, curve in rep["scaling"].items():
+        click.echo(f"\t{name:<58}{curve['exponent']:6.2f}")
+
+    click.echo(f"\nsaved {suite.save_report(rep, out_dir)}")
+
+
+@cli.command(help="compare the rates of two reports")
+@click.argument("old", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False))
+def compare(old, new):
+    old_rep, new_rep = suite.load_report(old), suite.load_report(new)
+    click.echo(f"{old_rep['commit']} -> {new_rep['commit']}")
+    for name, old_rate, new_rate, speedup in suite.compare(old_rep, new_rep):
+        click.echo(f"{name:<80}{old_rate:12.1f}{new_rate:12.1f}\tx{speedup:.2f}")
+
+
+if __name__ == "__main__":
+    cli()
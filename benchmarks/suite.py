@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the data loading, the scfs and the manipulation search.
+
+Each benchmark times a number of operations on an election:
+
+- `extract`: parsing a dataset file (ops: ballot lines)
+- `plurality`, `stv`: the scf on the truthful election (ops: scf evaluations)
+- `test_manipulation`: `manip.test_manipulation` of the candidates of a spec, in
+  search order (ops: candidates)
+- `search`: `manip.search_steps` of a spec (ops: candidates)
+
+on the datasets and on synthetic elections of growing size, to get the scaling
+curves of the scfs and of the search. The search benchmarks stop after a time
+budget: their rate is comparable between runs, their `done` field tells how much of
+the search was covered, and `scf_per_s` the elections evaluated by the scf per
+second (see `manip.SearchMetrics`).
+
+A run of the suite is a report (see `report`) saved as json, named after the git
+commit, so reports of two commits can be compared (see `compare`).
+"""
+import contextlib
+import json
+import math
+import os
+import platform
+import subprocess
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from timeit import default_timer as timer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import STVComputations as stv
+import manip
+import synthetic
+from STVComputations import Profile
+
+BENCHES = ["extract", "plurality", "stv", "test_manipulation", "search"]
+
+# the default synthetic elections: number of voters, with SYNTHETIC_ALTS alternatives
+# drawn from the SYNTHETIC_MODEL (see synthetic.MODELS)
+SYNTHETIC_SIZES = [1_000, 10_000, 100_000]
+SYNTHETIC_ALTS = 5
+SYNTHETIC_MODEL = "ic"
+
+# default seconds spent repeating a benchmark (at least one run)
+MIN_TIME = 1.0
+# default seconds of search of the manipulation benchmarks
+BUDGET = 5.0
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+@dataclass
+class Election:
+    name: str
+    votes: List[Profile]
+    # the dataset file, None for synthetic elections
+    path: Optional[str] = None
+
+    @property
+    def shape(self) -> Dict[str, int]:
+        return {
+            "voters": stv.tot_votes(self.votes),
+            "ballots": len(self.votes),
+            "alts": len(stv.all_alts(self.votes)),
+        }
+
+
+@dataclass
+class Timing:
+    "`ops` operations of the benchmark `bench` in `seconds`"
+
+    bench: str
+    election: str
+    # the spec (see configs.py) of the manipulation benchmarks
+    spec: Optional[str]
+    ops: int
+    seconds: float
+    # voters, ballots and alts of the election
+    shape: Dict[str, int]
+    # e.g. the results found and the fraction of the coalitions searched
+    extra: dict = field(default_factory=dict)
+
+    @property
+    def rate(self) -> float:
+        "Operations per second"
+        return self.ops / self.seconds if self.seconds > 0 else math.inf
+
+
+def dataset_elections(paths: Iterable[str]) -> List[Election]:
+    return [
+        Election(os.path.splitext(os.path.basename(p))[0], stv.extract_data(p), p)
+        for p in paths
+    ]
+
+
+def synthetic_elections(
+    sizes: Iterable[int],
+    n_alts: int = SYNTHETIC_ALTS,
+    seed: int = 0,
+    model: str = SYNTHETIC_MODEL,
+    **params,
+) -> List[Election]:
+    "Elections of the given model and sizes (number of voters), see synthetic.py"
+    return [
+        Election(
+            f"{model}-{n}x{n_alts}",
+            synthetic.generate(model, n, n_alts, seed=seed, **params),
+        )
+        for n in sizes
+    ]
+
+
+def repeat(f: Callable[[], int], min_time: float) -> Tuple[int, float]:
+    "Call `f` (returning its number of ops) until `min_time` seconds passed"
+    ops, start = 0, timer()
+    while True:
+        ops += f()
+        elapsed = timer() - start
+        if elapsed >= min_time:
+            return ops, elapsed
+
+
+def bench_extract(election: Election, min_time: float = MIN_TIME) -> Timing:
+    def run():
+        return len(stv.extract_data(election.path, merge=False))
+
+    ops, seconds = repeat(run, min_time)
+    return Timing("extract", election.name, None, ops, seconds, election.shape)
+
+
+def bench_scf(name: str, election: Election, min_time: float = MIN_TIME) -> Timing:
+    scf = {"plurality": stv.plurality, "stv": stv.stv}[name]
+
+    def run():
+        scf(election.votes)
+        return 1
+
+    ops, seconds = repeat(run, min_time)
+    return Timing(name, election.name, None, ops, seconds, election.shape)
+
+
+def scf_throughput(conf: manip.ManipulatorConfig, seconds: float) -> dict:
+    "The elections evaluated by the scf in a manipulation benchmark, and per second"
+    elections = conf.metrics.scf_elections
+    return {"scf_elections": elections, "scf_per_s": elections / seconds}
+
+
+def bench_test_manipulation(
+    spec_name: str, spec: dict, election: Election, budget: float = BUDGET
+) -> Timing:
+    conf = manip.ManipulatorConfig(trueballs=election.votes, **spec)
+    ops = results = 0
+    done = 0.0
+    start = timer()
+    for i, _, cand in manip.coalition_tasks(conf):
+        results += len(list(manip.test_manipulation(conf, i, cand)))
+        ops += 1
+        done = (i + 1) / len(conf.trueballs)
+        if timer() - start >= budget:
+            break
+    else:
+        done = 1.0
+    seconds = timer() - start
+    extra = {"results": results, "done": done, **scf_throughput(conf, seconds)}
+    return Timing(
+        "test_manipulation",
+        election.name,
+        spec_name,
+        ops,
+        seconds,
+        election.shape,
+        extra,
+    )
+
+
+def bench_search(
+    spec_name: str, spec: dict, election: Election, budget: float = BUDGET
+) -> Timing:
+    conf = manip.ManipulatorConfig(trueballs=election.votes, **spec)
+    ops = results = 0
+    done = 0.0
+    start = timer()
+    steps = manip.search_steps(conf, disable_progess=True)
+    with contextlib.closing(steps):
+        for (i, _), step_results in steps:
+            results += len(step_results)
+            ops += 1
+            done = (i + 1) / len(conf.trueballs)
+            if timer() - start >= budget:
+                break
+        else:
+            done = 1.0
+    seconds = timer() - start
+    extra = {"results": results, "done": done, **scf_throughput(conf, seconds)}
+    shape = election.shape
+    return Timing("search", election.name, spec_name, ops, seconds, shape, extra)
+
+
+def run_suite(
+    elections: List[Election],
+    specs: Dict[str, dict],
+    benches: Iterable[str] = BENCHES,
+    min_time: float = MIN_TIME,
+    budget: float = BUDGET,
+    on_timing: Callable[[Timing], None] = lambda t: None,
+) -> List[Timing]:
+    "Run the benchmarks on each election, calling `on_timing` as they are done"
+    timings = []
+
+    def add(t: Timing):
+        timings.append(t)
+        on_timing(t)
+
+    for election in elections:
+        if "extract" in benches and election.path is not None:
+            add(bench_extract(election, min_time))
+        for name in ["plurality", "stv"]:
+            if name in benches:
+                add(bench_scf(name, election, min_time))
+        for spec_name, spec in specs.items():
+            if "test_manipulation" in benches:
+                add(bench_test_manipulation(spec_name, spec, election, budget))
+            if "search" in benches:
+                add(bench_search(spec_name, spec, election, budget))
+    return timings
+
+
+def scaling(timings: List[Timing], size: str = "voters") -> Dict[str, dict]:
+    """The scaling curves of the benchmarks run on at least 2 elections of different
+    sizes (e.g. the synthetic ones): seconds per op against the election size, and
+    the exponent of the power law fit (1 is linear in the size)
+    """
+    curves: Dict[str, List[Tuple[int, float]]] = {}
+    for t in timings:
+        if t.ops:
+            name = t.bench if t.spec is None else f"{t.bench}/{t.spec}"
+            curves.setdefault(name, []).append((t.shape[size], t.seconds / t.ops))
+    out = {}
+    for name, points in curves.items():
+        points.sort()
+        sizes = [s for s, _ in points]
+        if len(set(sizes)) < 2:
+            continue
+        per_op = [p for _, p in points]
+        exponent, _ = np.polyfit(np.log(sizes), np.log(per_op), 1)
+        out[name] = {"sizes": sizes, "sec_per_op": per_op, "exponent": float(exponent)}
+    return out
+
+
+def git_commit() -> str:
+    "The short hash of HEAD (with a + if the tree has changes), 'unknown' out of git"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        head = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return head + ("+" if dirty else "")
+
+
+def report(timings: List[Timing], synthetic: List[Timing], params: dict) -> dict:
+    "The json report of a run, `synthetic` are the timings of the scaling curves"
+    return {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "timings": [{**asdict(t), "rate": t.rate} for t in timings],
+        "scaling": scaling(synthetic),
+    }
+
+
+def save_report(rep: dict, out_dir: str = RESULTS_DIR) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    date = rep["date"].replace(":", "").replace("-", "")
+    path = os.path.join(out_dir, f"{rep['commit']}-{date}.json")
+    with open(path, "w") as f:
+        json.dump(rep, f, indent=1)
+    return path
+
+
+def load_report(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(old: dict, new: dict) -> List[Tuple[str, float, float, float]]:
+    """The benchmarks in both reports: (name, old rate, new rate, speedup),
+    a speedup > 1 means the new report is faster
+    """
+    def rates(rep: dict) -> Dict[str, float]:
+        return {
+            "/".join(p for p in [t["bench"], t["spec"], t["election"]] if p): t["rate"]
+            for t in rep["timings"]
+        }
+
+    old_rates, new_rates = rates(old), rates(new)
+    return [
+        (name, old_rates[name], rate, rate / old_rates[name])
+        for name, rate in new_rates.items()
+        if old_rates.get(name)
+    ]
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+SQLite catalog of the search runs.
+
+`ResultsExporter` records every run it exports in `<out_dir>/catalog.sqlite`: one
+row in `runs` (dataset and its content hash, spec, options, timing and result
+counts) and one row per result in `results`, so runs can be filtered, compared and
+aggregated with SQL (see `manip_main.py query`) without loading the result files.
+
+Runs are never overwritten: a spec run again (e.g. with `--force`) gets a new row,
+`latest` filters the last run of each (dataset, spec, result dir).
+"""
+import contextlib
+import json
+import os
+import sqlite3
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import datacache
+import manip
+from utils import aka_or_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    dataset_hash TEXT,
+    spec TEXT NOT NULL,
+    result_dir TEXT NOT NULL,
+    scf TEXT,
+    comparator TEXT,
+    manip_gen TEXT,
+    minimal_n_stop INTEGER,
+    -- the [config] section of the summary, as json
+    options TEXT,
+    start TEXT,
+    end TEXT,
+    dur REAL,
+    count INTEGER,
+    n_from INTEGER,
+    n_to INTEGER,
+    n_from_to INTEGER
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    i INTEGER NOT NULL,
+    coalition INTEGER,
+    from_ord TEXT,
+    to_ord TEXT,
+    n INTEGER,
+    orig_outcome TEXT,
+    new_outcome TEXT,
+    PRIMARY KEY (run_id, i)
+);
+CREATE INDEX IF NOT EXISTS runs_dataset_spec ON runs (dataset, spec);
+"""
+
+# the last run of each (dataset, spec, result dir)
+LATEST = """
+id IN (SELECT MAX(id) FROM runs GROUP BY dataset, spec, result_dir)
+"""
+
+# the run columns `stats` can group by
+GROUP_BY = ["dataset", "spec", "scf", "comparator", "manip_gen"]
+
+
+@contextlib.contextmanager
+def connect(path: str) -> Iterator[sqlite3.Connection]:
+    "A connection to the catalog, in a transaction committed on exit"
+    db = sqlite3.connect(path)
+    try:
+        db.row_factory = sqlite3.Row
+        db.executescript(SCHEMA)
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def _json(x) -> str:
+    return json.dumps(sorted(x) if isinstance(x, set) else x, default=int)
+
+
+def record_run(
+    path: str,
+    dataset: str,
+    spec: str,
+    result_dir: str,
+    config: manip.ManipulatorConfig,
+    summary: dict,
+    dur: float,
+    results: Iterable[manip.ManipResult],
+) -> int:
+    """Add a run with its results to the catalog at `path`: `summary` is the parsed
+    summary.ini of the run (see `export.parse_summary`) and `dur` its duration in
+    seconds. Returns the id of the run.
+    """
+    dataset_name, _ = os.path.splitext(os.path.basename(dataset))
+    dataset_hash = datacache.file_digest(dataset) if os.path.isfile(dataset) else None
+    tally, execution = summary["results"], summary["execution"]
+    with connect(path) as db:
+        cur = db.execute(
+            """INSERT INTO runs (dataset, dataset_hash, spec, result_dir, scf,
+            comparator, manip_gen, minimal_n_stop, options, start, end, dur, count,
+            n_from, n_to, n_from_to) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+            (
+                dataset_name,
+                dataset_hash,
+                spec,
+                result_dir,
+                aka_or_name(config.scf),
+                aka_or_name(config.comparator),
+                aka_or_name(config.manip_gen),
+                config.minimal_n_stop,
+                json.dumps(summary["config"]),
+                execution["start"],
+                execution["end"],
+                dur,
+                int(tally["count"]),
+                int(tally["n_from"]),
+                int(tally["n_to"]),
+                int(tally["n_from_to"]),
+            ),
+        )
+        run_id = cur.lastrowid
+        db.executemany(
+            "INSERT INTO results VALUES (?,?,?,?,?,?,?,?)",
+            (
+                (
+                    run_id,
+                    i,
+                    r.i_coalition,
+                    _json(r.from_ord),
+                    _json(r.to_ord),
+                    r.n,
+                    _json(r.orig_outcome),
+                    _json(r.new_outcome),
+                )
+                for i, r in enumerate(results)
+            ),
+        )
+    return run_id
+
+
+def _where(filters: dict, latest: bool) -> tuple:
+    "WHERE clause (and its params) of the runs with the given column values"
+    conds = [f"{col} = ?" for col, v in filters.items() if v is not None]
+    params = [v for v in filters.values() if v is not None]
+    if latest:
+        conds.append(LATEST)
+    return (" WHERE " + " AND ".join(conds) if conds else ""), params
+
+
+def runs(path: str, latest: bool = False, **filters) -> List[sqlite3.Row]:
+    "The runs with the given column values (e.g. dataset=, spec=, scf=)"
+    where, params = _where(filters, latest)
+    with connect(path) as db:
+        return db.execute(
+            "SELECT id, dataset, spec, scf, comparator, manip_gen, minimal_n_stop, "
+            f"start, dur, count FROM runs{where} ORDER BY id",
+            params,
+        ).fetchall()
+
+
+def results(
+    path: str,
+    run_id: int,
+    min_n: Optional[int] = None,
+    max_n: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> List[sqlite3.Row]:
+    "The results of a run, by number of switchers"
+    conds, params = ["run_id = ?"], [run_id]
+    if min_n is not None:
+        conds.append("n >= ?")
+        params.append(min_n)
+    if max_n is not None:
+        conds.append("n <= ?")
+        params.append(max_n)
+    with connect(path) as db:
+        return db.execute(
+            "SELECT i, coalition, from_ord, to_ord, n, orig_outcome, new_outcome "
+            f"FROM results WHERE {' AND '.join(conds)} ORDER BY n, i LIMIT ?",
+            params + [-1 if limit is None else limit],
+        ).fetchall()
+
+
+def stats(
+    path: str, by: Sequence[str], latest: bool = True, **filters
+) -> List[sqlite3.Row]:
+    """Number of runs, of results and of manipulable runs, search time and fewest
+    switchers of the runs (the latest ones by default) grouped by the `by` columns
+    """
+    for col in by:
+        if col not in GROUP_BY:
+            raise ValueError(f"Cannot group runs by {col}, only by {GROUP_BY}")
+    where, params = _where(filters, latest)
+    group = f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}" if by else ""
+    with connect(path) as db:
+        return db.execute(
+            f"""SELECT {"".join(col + ", " for col in by)}COUNT(*) AS runs,
+            SUM(count) AS results, SUM(count > 0) AS manipulable,
+            ROUND(SUM(dur), 3) AS dur, MIN(min_n) AS min_n
+            FROM runs LEFT JOIN
+                (SELECT run_id, MIN(n) AS min_n FROM results GROUP BY run_id)
+                ON run_id = id
+            {where}{group}""",
+            params,
+        ).fetchall()
+
+
+def query(path: str, sql: str) -> List[sqlite3.Row]:
+    "Any (read only) SQL query on the catalog"
+    with connect(path) as db:
+        db.execute("PRAGMA query_only = ON")
+        return db.execute(sql).fetchall()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Checkpoints of long manipulation searches.
+
+The search runs one candidate at a time (see `manip.search_steps`), and the
+position of the next candidate to test is a `manip.Cursor`. Every `interval`
+seconds, and when the search is interrupted, the cursor is saved together with the
+results found so far (or, when they go to an `export.ResultsSink`, where the sink got
+to), so an interrupted search can be resumed from there instead of
+from the first coalition.
+
+A checkpoint is only resumed by the same search: same dataset size, scf, comparator,
+manip generator and stop options (see `config_key`).
+"""
+import os
+import pickle
+from dataclasses import dataclass, field
+from datetime import timedelta
+from timeit import default_timer as timer
+from typing import Generator, List, Optional
+
+import STVComputations as stv
+import manip
+import workers
+from export import ResultsSink, SinkState
+from manip import Cursor, ManipResult, ManipulatorConfig
+from utils import aka_or_name
+
+# default seconds between two checkpoints
+INTERVAL = 300
+
+
+@dataclass
+class Checkpoint:
+    key: str
+    # the next candidate to test
+    cursor: Cursor
+    # the results of the candidates before the cursor (without a sink)
+    results: List[ManipResult]
+    # search time spent until the checkpoint
+    elapsed: timedelta
+    # where the results sink was at the cursor, when the results go to a sink
+    sink_state: SinkState = field(default_factory=SinkState)
+    # the search metrics until the checkpoint
+    metrics: manip.SearchMetrics = field(default_factory=manip.SearchMetrics)
+
+
+def config_key(conf: ManipulatorConfig) -> str:
+    "What a checkpoint must match to be resumed by a search"
+    return " ".join(
+        str(x)
+        for x in [
+            len(conf.trueballs),
+            stv.tot_votes(conf.trueballs),
+            aka_or_name(conf.scf),
+            aka_or_name(conf.comparator),
+            aka_or_name(conf.manip_gen),
+            aka_or_name(conf.branch_prune),
+            conf.minimal_n_stop,
+        ]
+    )
+
+
+def save(path: str, ckpt: Checkpoint):
+    "Atomically write the checkpoint"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(ckpt, f)
+    os.replace(tmp, path)
+
+
+def load(path: str, conf: ManipulatorConfig) -> Optional[Checkpoint]:
+    "The checkpoint at `path`, None if missing or of another search"
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        ckpt = pickle.load(f)
+    if ckpt.key != config_key(conf):
+        return None
+    return ckpt
+
+
+def search_manips(
+    conf: ManipulatorConfig,
+    path: str,
+    interval: float = INTERVAL,
+    resume: bool = False,
+    disable_progess=False,
+    pool: Optional[workers.SearchPool] = None,
+    sink: Optional[ResultsSink] = None,
+    ckpt: Optional[Checkpoint] = None,
+) -> Generator[ManipResult, None, None]:
+    """Same as `manip.search_manips`, saving a checkpoint at `path` every `interval`
+    seconds and when interrupted (an exception or the generator closed before the
+    end). With `resume` the search continues from the checkpoint at `path`, if any,
+    or from `ckpt` when the caller already loaded it (see `load`).
+
+    Without a sink the checkpoint holds the results found so far, and a resumed
+    search first yields them again. With a sink the results are appended to it and
+    the checkpoint only holds where the sink got to: a resumed search drops what the
+    sink got after the checkpoint and only yields the new results.
+    NOTE: the checkpoint is left in place at the end, the caller removes it once the
+    results are stored
+    """
+    if ckpt is None and resume:
+        ckpt = load(path, conf)
+    if ckpt is None:
+        ckpt = Checkpoint(config_key(conf), (0, 0), [], timedelta(), SinkState())
+    else:
+        # the search goes on from the checkpoint (no metrics in older versions)
+        conf.metrics = getattr(ckpt, "metrics", manip.SearchMetrics())
+
+    results = ckpt.results[: conf.max_results]
+    for r in results:
+        r.base = conf
+    if sink is not None:
+        sink.restore(ckpt.sink_state)
+    yield from results
+
+    def found() -> int:
+        return sink.tally.count if sink is not None else len(results)
+
+    if conf.max_results is not None and found() >= conf.max_results:
+        return
+
+    start = timer() - ckpt.elapsed.total_seconds()
+    last_save = timer()
+
+    # `results` (or the sink at `done_state`) holds the results of all the
+    # candidates before `done`
+    done = ckpt.cursor
+    done_state = sink.state() if sink is not None else None
+
+    def checkpoint():
+        if sink is not None:
+            sink.flush()
+        elapsed = timedelta(seconds=timer() - start)
+        save(
+            path,
+            Checkpoint(
+                ckpt.key, done, list(results), elapsed, done_state, conf.metrics
+            ),
+        )
+
+    steps = manip.search_steps(conf, disable_progess, pool, done)
+    try:
+        for cursor, step_results in steps:
+            for i, r in enumerate(step_results, found() + 1):
+                if sink is not None:
+                    sink.append(r)
+                yield r
+                if i == conf.max_results:
+                    return
+            if sink is None:
+                results.extend(step_results)
+            elif step_results:
+                done_state = sink.state()
+            done = cursor
+            if timer() - last_save >= interval:
+                checkpoint()
+                last_save = timer()
+    except BaseException:
+        # interrupted (or closed) in the middle of a candidate: it is tested again
+        # on resume
+        checkpoint()
+        raise
+    finally:
+        steps.close()
+    checkpoint()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Array backed (compiled) representation of an election.
+
+The `List[Profile]` representation is convenient to build and to read, but every
+SCF evaluation has to walk the nested ballot lists in pure python. Here we build
+once from a `List[Profile]` a `CompiledElection` that holds the very same data as
+numpy arrays:
+
+- `alts`: the sorted ids of the alternatives in play, column `j` of the matrices
+  below refers to alternative `alts[j]`
+- `pos`: a (ballots x alts) matrix with the index of the cell in which each
+  ballot ranks each alternative, `NOT_RANKED` if the ballot does not rank it.
+  Alternatives in a tie share the same cell index, so this matrix is both the
+  (padded) rank matrix and the tie group encoding:
+  [[1], [3, 4], [2]] -> alts [1, 2, 3, 4] -> pos row [0, 2, 1, 1]
+- `counts`: how many voters submitted each ballot
+
+Plurality scores are kept as integers: a ballot whose live top cell holds `k`
+alternatives gives `count * scale / k` points to each of them, where `scale`
+is a multiple of every possible `k`. This keeps ties exact, scores can be
+converted back to the float ones of `STVComputations` dividing by `scale`.
+The scores are int64: with wide tie cells and many voters they can overflow, see
+`fits_int64` (the callers fall back to the `List[Profile]` SCFs then).
+
+The SCFs implemented here (`plurality`, `stv`) return the same outcomes of their
+`STVComputations` counterparts, whose scores are exact too (Fractions).
+
+The SCFs also come in a batched flavour (`plurality_batch`, `stv_batch`) that
+evaluates at once many elections sharing the same ballots but with different counts,
+i.e. a base election plus count deltas such as "k voters moved from ballot i to
+ballot j" (see `move_voters`). That's the shape of the elections tested by the
+manipulation search.
+"""
+import itertools
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+import STVComputations
+from STVComputations import Profile, all_alts
+
+# the cell index used for alternatives a ballot does not rank
+NOT_RANKED = np.iinfo(np.int32).max
+
+
+@dataclass
+class CompiledElection:
+    """Array backed election, see module docstring for the layout."""
+
+    alts: np.ndarray  # (m,) int64, sorted alternative ids
+    pos: np.ndarray  # (n, m) int32, cell index of each alt in each ballot
+    counts: np.ndarray  # (n,) int64, voters per ballot
+    scale: int  # score multiplier that makes split votes integer
+
+    @staticmethod
+    def from_profiles(votes: List[Profile]) -> "CompiledElection":
+        "Build the compiled election from a `List[Profile]`"
+        alts = sorted(all_alts(votes))
+        col = {a: j for j, a in enumerate(alts)}
+
+        # collect the (ballot, alt, cell) triples and fill the matrix at once
+        rows, cols, cells = [], [], []
+        max_cell = 1
+        for i, p in enumerate(votes):
+            for c, cell in enumerate(p.ballot):
+                max_cell = max(max_cell, len(cell))
+                for a in cell:
+                    rows.append(i)
+                    cols.append(col[a])
+                    cells.append(c)
+
+        pos = np.full((len(votes), len(alts)), NOT_RANKED, dtype=np.int32)
+        pos[rows, cols] = cells
+        counts = np.array([p.count for p in votes], dtype=np.int64)
+
+        # cells shrink as alternatives are dropped, so any size up to
+        # the largest cell must divide the scale
+        scale = math.lcm(*range(1, max_cell + 1))
+
+        return CompiledElection(np.array(alts, dtype=np.int64), pos, counts, scale)
+
+    @property
+    def fits_int64(self) -> bool:
+        """Whether the scaled scores can be computed in int64: the largest value
+        is the `(tot + 2) * scale` side of the majority test, doubled
+        """
+        return 2 * (int(self.counts.sum()) + 2) * self.scale < 2**63
+
+    @property
+    def n_ballots(self) -> int:
+        return self.pos.shape[0]
+
+    @property
+    def n_alts(self) -> int:
+        return self.pos.shape[1]
+
+    def alt_set(self, mask: np.ndarray) -> Set[int]:
+        "Convert a boolean mask over the columns into a set of alternative ids"
+        return set(int(a) for a in self.alts[mask])
+
+    def ballot(self, i: int) -> List[List[int]]:
+        "Rebuild the `List[List[int]]` ballot of the i-th row"
+        return _row_ballot(self.pos[i].tolist(), self.alts.tolist())
+
+    def to_profiles(self) -> List[Profile]:
+        "Rebuild the `List[Profile]` this election was compiled from"
+        alts = self.alts.tolist()
+        return [
+            Profile(_row_ballot(row, alts), count)
+            for row, count in zip(self.pos.tolist(), self.counts.tolist())
+        ]
+
+
+def _row_ballot(row: List[int], alts: List[int]) -> List[List[int]]:
+    "Ballot from a row of the position matrix (as a python list)"
+    cells: Dict[int, List[int]] = {}
+    for c, a in sorted(zip(row, alts)):
+        if c != NOT_RANKED:
+            cells.setdefault(c, []).append(a)
+    return list(cells.values())
+
+
+# max number of (election x ballot x alt) cells processed at once by the
+# batched functions, bigger batches are split in chunks
+BATCH_CELLS = 1 << 22
+
+
+def _chunks(ce: CompiledElection, n_elections: int) -> List[slice]:
+    rows = max(1, BATCH_CELLS // max(1, ce.n_ballots * ce.n_alts))
+    return [slice(i, i + rows) for i in range(0, n_elections, rows)]
+
+
+def present_alts(ce: CompiledElection, counts: np.ndarray) -> np.ndarray:
+    """(elections x alts) mask of the alternatives ranked by at least one voter,
+    ballots with a 0 count are as if they were not in the election
+    """
+    ranked = (ce.pos != NOT_RANKED).astype(np.int64)
+    return ((counts > 0).astype(np.int64) @ ranked) > 0
+
+
+def batch_scores(ce: CompiledElection, counts: np.ndarray, live: np.ndarray):
+    """Scaled plurality scores of a batch of elections that share the ballots of
+    `ce` but have their own `counts` (elections x ballots) and set of `live`
+    alternatives (elections x alts).
+    Each ballot counts for its top cell restricted to the live alternatives.
+    :return: the scores (elections x alts, 0 for dead alts) and, for each election,
+    the total of votes of the non exhausted ballots
+    """
+    masked = np.where(live[:, None, :], ce.pos[None, :, :], NOT_RANKED)
+    top = masked.min(axis=2, keepdims=True)
+    tops = (masked == top) & (top != NOT_RANKED)
+    k = tops.sum(axis=2)
+    share = np.where(k > 0, counts * ce.scale // np.maximum(k, 1), 0)
+    scores = np.matmul(share[:, None, :], tops.astype(np.int64))[:, 0, :]
+    tot = (counts * (k > 0)).sum(axis=1)
+    return scores, tot
+
+
+def plurality_scores(ce: CompiledElection, live: np.ndarray) -> np.ndarray:
+    """Scaled plurality scores (int64, one per column) considering only the
+    `live` alternatives, the compiled version of `STVComputations.plurality_round`.
+    Dead alternatives score 0.
+    """
+    scores, _ = batch_scores(ce, ce.counts[None, :], live[None, :])
+    return scores[0]
+
+
+def top_rank_majority(scores: np.ndarray, tot: np.ndarray, scale: int) -> np.ndarray:
+    """Mask of the alternatives holding (50% + 1) of the `tot` non exhausted votes,
+    compiled (and batched) version of `STVComputations.top_rank_majority`.
+    """
+    # scores / scale >= tot * 0.5 + 1, without leaving the integers
+    return 2 * scores >= (tot[..., None] + 2) * scale
+
+
+def plurality_batch(ce: CompiledElection, counts: np.ndarray) -> List[Set[int]]:
+    "Plurality SCF on a batch of elections, see `batch_scores`"
+    outcomes = []
+    for chunk in _chunks(ce, len(counts)):
+        c = counts[chunk]
+        live = present_alts(ce, c)
+        scores, _ = batch_scores(ce, c, live)
+        scores = np.where(live, scores, -1)
+        winners = scores == scores.max(axis=1, keepdims=True)
+        outcomes.extend(ce.alt_set(w) for w in winners)
+    return outcomes
+
+
+def stv_batch(
+    ce: CompiledElection, counts: np.ndarray, break_on_majority: bool = True
+) -> List[Set[int]]:
+    """STV SCF on a batch of elections, see `batch_scores`.
+    All the elections run their rounds together, an election leaves the
+    batch as soon as its outcome is known.
+    """
+    outcomes = []
+    for chunk in _chunks(ce, len(counts)):
+        c = counts[chunk]
+        live = present_alts(ce, c)
+        if not live.any(axis=1).all():
+            raise ValueError("There are no alternatives...")
+
+        result: List[Set[int]] = [set() for _ in range(len(c))]
+        running = np.arange(len(c))  # elections without an outcome yet
+
+        while len(running):
+            lv = live[running]
+            scores, tot = batch_scores(ce, c[running], lv)
+
+            done = np.zeros(len(running), dtype=bool)
+            if break_on_majority:
+                maj = lv & top_rank_majority(scores, tot, ce.scale)
+                done = maj.any(axis=1)
+                for i in np.flatnonzero(done):
+                    result[running[i]] = ce.alt_set(maj[i])
+
+            # drop all the alternatives with the minimal score
+            min_value = np.where(lv, scores, np.iinfo(np.int64).max).min(axis=1)
+            min_alts = lv & (scores == min_value[:, None])
+
+            last = ~done & (min_alts == lv).all(axis=1)
+            for i in np.flatnonzero(last):
+                result[running[i]] = ce.alt_set(lv[i])
+
+            live[running] = lv & ~min_alts
+            running = running[~(done | last)]
+
+        outcomes.extend(result)
+    return outcomes
+
+
+def plurality(ce: CompiledElection) -> Set[int]:
+    "Plurality SCF on a compiled election"
+    return plurality_batch(ce, ce.counts[None, :])[0]
+
+
+def stv(ce: CompiledElection, break_on_majority: bool = True) -> Set[int]:
+    """STV SCF on a compiled election, same semantic as `STVComputations.stv`:
+    all the alternatives with minimal score are dropped together, the last
+    non-empty set of alternatives is returned.
+    """
+    return stv_batch(ce, ce.counts[None, :], break_on_majority)[0]
+
+
+def append_ballot(ce: CompiledElection, ballot: List[List[int]]) -> CompiledElection:
+    """A copy of the election with a new row for `ballot`, with a 0 count.
+    Alternatives not in the election get a new column.
+    """
+    new_alts = sorted(set(itertools.chain(*ballot)) - set(ce.alts.tolist()))
+    alts = np.concatenate([ce.alts, np.array(new_alts, dtype=np.int64)])
+    pos = np.full((ce.n_ballots + 1, len(alts)), NOT_RANKED, dtype=np.int32)
+    pos[:-1, : ce.n_alts] = ce.pos
+
+    col = {a: j for j, a in enumerate(alts.tolist())}
+    for c, cell in enumerate(ballot):
+        for a in cell:
+            pos[-1, col[a]] = c
+
+    # keep the columns sorted by alternative id
+    order = np.argsort(alts, kind="stable")
+    max_cell = max([len(cell) for cell in ballot], default=1)
+    return CompiledElection(
+        alts=alts[order],
+        pos=pos[:, order],
+        counts=np.append(ce.counts, 0),
+        scale=math.lcm(ce.scale, *range(1, max_cell + 1)),
+    )
+
+
+def move_voters(
+    ce: CompiledElection, src: int, dst: int, ns: Iterable[int]
+) -> np.ndarray:
+    """Counts of the batch of elections where, for each `n` in `ns`, `n` voters
+    of the `src` ballot switched to the `dst` ballot
+    :return: (len(ns) x ballots) matrix of counts
+    """
+    ns = np.asarray(list(ns), dtype=np.int64)
+    counts = np.repeat(ce.counts[None, :], len(ns), axis=0)
+    counts[:, src] -= ns
+    counts[:, dst] += ns
+    return counts
+
+
+# batched versions of the `STVComputations` SCFs
+BATCHED = {
+    STVComputations.plurality: plurality_batch,
+    STVComputations.stv: stv_batch,
+}
+
+
+if __name__ == "__main__":
+    from timeit import timeit
+
+    votes = STVComputations.extract_data("./data/city-council.txt")
+    ce = CompiledElection.from_profiles(votes)
+
+    print("city-council STV winner (compiled):", stv(ce))
+
+    t_list = timeit(lambda: STVComputations.stv(votes), number=5) / 5
+    t_comp = timeit(lambda: stv(ce), number=50) / 50
+    print(f"stv on List[Profile]: {t_list * 1e3:.2f}ms")
+    print(f"stv on CompiledElection: {t_comp * 1e3:.2f}ms")
@@ -26,7 +26,12 @@ def gen_configs(options: dict):
 options = {
     "scf": [stv.stv, stv.plurality],
     "comparator": [manip.optimistic_comparator, manip.pessimistic_comparator],
-    "manip_gen": [manip.permut_manip_gen, manip.all_permut_manip_gen],
+    "manip_gen": [
+        manip.permut_manip_gen,
+        manip.all_permut_manip_gen,
+        manip.class_permut_manip_gen,
+        manip.class_all_permut_manip_gen,
+    ],
 }
 
 # generate configs
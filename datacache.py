@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+On-disk binary cache of parsed datasets.
+
+Parsing a toi/soi text file is by far slower than reading back its numbers, so the
+parsed dataset can be stored in a sidecar `.npy` file next to it (in a `.cache`
+subdir) keyed by a hash of the content of the text file: editing the dataset
+changes the key, so a stale sidecar is never read.
+
+The sidecar holds a single int32 matrix with the arrays of a `CompiledElection`:
+
+    [[max_cell, 0, alts[0], alts[1], ...],
+     [hi(counts[0]), lo(counts[0]), pos[0, 0], pos[0, 1], ...],
+     [hi(counts[1]), lo(counts[1]), pos[1, 0], pos[1, 1], ...],
+     ...]
+
+so loading it is a single memory-mapped read. The int64 counts are split in their
+high and low 32 bits words, and the scale (which can exceed int64 with wide tie
+cells) is stored as the largest cell size it is built from, `lcm(1..max_cell)`.
+"""
+import hashlib
+import math
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from compiled import CompiledElection
+from STVComputations import Profile
+import STVComputations as stv
+
+CACHE_DIR_NAME = ".cache"
+# version of the layout, in the sidecar name so sidecars of other versions are unused
+FORMAT = 2
+
+
+def file_digest(path: str) -> str:
+    "sha256 of the content of the file"
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def sidecar_path(
+    path: str, merge: bool = True, cache_dir: Optional[str] = None
+) -> str:
+    "Where the cache of the dataset at `path` is (or would be) stored"
+    cache_dir = cache_dir or os.path.join(os.path.dirname(path), CACHE_DIR_NAME)
+    name = os.path.basename(path)
+    merged = "" if merge else "-lines"
+    digest = file_digest(path)[:16]
+    return os.path.join(cache_dir, f"{name}-{digest}{merged}.v{FORMAT}.npy")
+
+
+def max_cell(scale: int) -> int:
+    "The `k` such that `scale` is lcm(1..k), see `CompiledElection`"
+    k, lcm = 1, 1
+    while lcm != scale:
+        k += 1
+        lcm = math.lcm(lcm, k)
+        if lcm > scale:
+            raise ValueError(f"{scale} is not the lcm of 1..k")
+    return k
+
+
+def encode(ce: CompiledElection) -> np.ndarray:
+    "Pack a compiled election in a single int32 matrix, see module docstring"
+    mat = np.empty((ce.n_ballots + 1, ce.n_alts + 2), dtype=np.int32)
+    mat[0, :2] = [max_cell(ce.scale), 0]
+    mat[0, 2:] = ce.alts
+    mat[1:, 0] = ce.counts >> 32
+    mat[1:, 1] = (ce.counts & 0xFFFFFFFF).astype(np.uint32).view(np.int32)
+    mat[1:, 2:] = ce.pos
+    return mat
+
+
+def decode(mat: np.ndarray) -> CompiledElection:
+    """Unpack a matrix built by `encode`.
+    NOTE: `pos` is a view on the given matrix, so a memory-mapped matrix
+    is not read until needed
+    """
+    hi, lo = mat[1:, 0].astype(np.int64), mat[1:, 1].astype(np.uint32)
+    return CompiledElection(
+        alts=mat[0, 2:].astype(np.int64),
+        pos=mat[1:, 2:],
+        counts=(hi << 32) | lo.astype(np.int64),
+        scale=math.lcm(*range(1, int(mat[0, 0]) + 1)),
+    )
+
+
+def save(path: str, ce: CompiledElection):
+    "Atomically write the sidecar"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, encode(ce))
+    os.replace(tmp, path)
+
+
+def load(path: str) -> CompiledElection:
+    return decode(np.load(path, mmap_mode="r"))
+
+
+def load_compiled(
+    path: str, merge: bool = True, cache_dir: Optional[str] = None, procs: int = 1
+) -> CompiledElection:
+    """Load the dataset at `path` as a CompiledElection, from its sidecar if it
+    exists, else parsing the text file and writing the sidecar for next time.
+    """
+    sidecar = sidecar_path(path, merge, cache_dir)
+    if os.path.exists(sidecar):
+        return load(sidecar)
+
+    ce = CompiledElection.from_profiles(
+        stv.extract_data(path, merge=merge, procs=procs)
+    )
+    save(sidecar, ce)
+    return ce
+
+
+def load_profiles(
+    path: str, merge: bool = True, cache_dir: Optional[str] = None, procs: int = 1
+) -> List[Profile]:
+    """Same as `stv.extract_data` but going through the binary cache.
+    NOTE: alternatives tied in a cell come back sorted
+    """
+    return load_compiled(path, merge, cache_dir, procs).to_profiles()
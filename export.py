@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 
+import configparser
+import json
+from copy import copy
 from datetime import datetime, timedelta
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import catalog
 import manip
+import resultstore
 import pickle
 import os
 
@@ -27,30 +32,99 @@ dur\t=\t{}
         )
 
 
+@dataclass
+class SinkState:
+    "Where a `ResultsSink` got to: size of the store files and tally of the results"
+
+    offsets: Dict[str, int] = field(default_factory=dict)
+    tally: manip.ResultsTally = field(default_factory=manip.ResultsTally)
+
+
+class ResultsSink:
+    """Writes the results of the search of the config to the store at `path` as they
+    are found (see resultstore.py, read them back with `load_results`), and tallies
+    their summary on the way, so they never need to be all in memory.
+    """
+
+    def __init__(self, path: str, conf: manip.ManipulatorConfig):
+        self.path = path
+        self.conf = conf
+        self.tally = manip.ResultsTally()
+        self.writer: Optional[resultstore.StoreWriter] = None
+
+    def append(self, result: manip.ManipResult):
+        if self.writer is None:
+            self.writer = resultstore.StoreWriter(self.path, self.conf)
+        self.writer.append(result)
+        self.tally.add(result)
+
+    def write_through(
+        self, results: Iterable[manip.ManipResult]
+    ) -> Iterator[manip.ManipResult]:
+        "Append the results as they are yielded"
+        for r in results:
+            self.append(r)
+            yield r
+
+    def state(self) -> SinkState:
+        offsets = self.writer.offsets() if self.writer else {}
+        return SinkState(offsets, copy(self.tally))
+
+    def restore(self, state: SinkState):
+        "Drop what was written after the given state (e.g. to resume a search)"
+        self.close()
+        self.writer = resultstore.StoreWriter(self.path, self.conf, state.offsets)
+        self.tally = copy(state.tally)
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
 @dataclass
 class ResultsExporter:
     """Helper class to manage results disk-caching.
     Stores results in the following hierarchy within `out_dir`:
+    - <index_name> (metadata of all the results, see `load_index`)
+    - <catalog_name> (all the runs and their results, see catalog.py)
     - <dataset_name>
       - <alg_name>
-        - <pickle_name>
+        - <store_name> (see resultstore.py, `pickle_name` in older versions)
         - <summary_name>
+        - <checkpoint_name> (while the search runs, see checkpoint.py)
     """
 
     out_dir: str
 
+    store_name: str = "results"
     pickle_name: str = "results.pkl"
     summary_name: str = "summary.ini"
+    checkpoint_name: str = "checkpoint.pkl"
+    index_name: str = "index.json"
+    catalog_name: str = "catalog.sqlite"
 
-    def _save_results(self, path: str, results: List[manip.ManipResult]):
-        with open(path, "wb") as f:
-            pickle.dump(results, f)
+    def _save_results(
+        self,
+        path: str,
+        config: manip.ManipulatorConfig,
+        results: List[manip.ManipResult],
+    ):
+        sink = ResultsSink(path, config)
+        sink.restore(SinkState())
+        for r in results:
+            sink.append(r)
+        sink.close()
 
     def _save_summary(
         self,
         path: str,
         config: manip.ManipulatorConfig,
-        results: List[manip.ManipResult],
+        tally: manip.ResultsTally,
         info: ExecInfo,
     ):
         summary = """\
@@ -60,10 +134,13 @@ class ResultsExporter:
 {}
 [execution]
 {}
+[metrics]
+{}
 """.format(
             config.summary(),
-            manip.ManipResult.results_summary(results),
+            tally.summary(),
             info.summary(),
+            config.metrics.summary(),
         )
 
         with open(path, "w") as f:
@@ -76,29 +153,97 @@ class ResultsExporter:
         return os.path.join(dataset_dir, alg_dir)
 
     def result_exists(self, dataset: str, spec: str, config: manip.ManipulatorConfig):
+        # the summary is written last, a dir with only a checkpoint is not a result
+        the_dir = self._dir_for(dataset, spec, config)
+        return os.path.exists(os.path.join(the_dir, self.summary_name))
+
+    def sink(
+        self, dataset: str, spec: str, config: manip.ManipulatorConfig
+    ) -> ResultsSink:
+        "The sink of the results of the spec, pass it as the results once done"
         the_dir = self._dir_for(dataset, spec, config)
-        return os.path.exists(the_dir)
+        os.makedirs(the_dir, exist_ok=True)
+        return ResultsSink(os.path.join(the_dir, self.store_name), config)
+
+    def checkpoint_path(
+        self, dataset: str, spec: str, config: manip.ManipulatorConfig
+    ) -> str:
+        the_dir = self._dir_for(dataset, spec, config)
+        return os.path.join(the_dir, self.checkpoint_name)
 
     def __call__(
         self,
         dataset: str,
         spec: str,
         config: manip.ManipulatorConfig,
-        results: List[manip.ManipResult],
+        results: Union[List[manip.ManipResult], ResultsSink],
         info: ExecInfo,
     ):
         the_dir = self._dir_for(dataset, spec, config)
 
         os.makedirs(the_dir, exist_ok=True)
-        pickle_path = os.path.join(the_dir, self.pickle_name)
+        store_path = os.path.join(the_dir, self.store_name)
         summary_path = os.path.join(the_dir, self.summary_name)
-        self._save_results(pickle_path, results)
-        self._save_summary(summary_path, config, results, info)
+        if isinstance(results, ResultsSink):
+            # already written, make sure the file exists even with no results
+            if results.writer is None:
+                results.restore(SinkState())
+            results.close()
+            tally = results.tally
+        else:
+            self._save_results(store_path, config, results)
+            tally = manip.ResultsTally()
+            for r in results:
+                tally.add(r)
+        self._save_summary(summary_path, config, tally, info)
+        update_index(self.out_dir, [the_dir])
+        catalog.record_run(
+            os.path.join(self.out_dir, self.catalog_name),
+            dataset,
+            spec,
+            os.path.relpath(the_dir, self.out_dir),
+            config,
+            parse_summary(load_summary(summary_path)),
+            info.dur.total_seconds(),
+            load_results(the_dir),
+        )
 
+        # the search is complete, no need to resume it
+        checkpoint_path = os.path.join(the_dir, self.checkpoint_name)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
 
-def load_result(from_path: str) -> List[manip.ManipResult]:
+
+def load_results(the_dir: str) -> Sequence[manip.ManipResult]:
+    """The results in a result dir, read on demand from the store
+    (or all at once from the pickle of older versions)
+    """
+    store_path = os.path.join(the_dir, ResultsExporter.store_name)
+    if resultstore.is_store(store_path):
+        return resultstore.StoredResults(store_path)
+    return load_result(os.path.join(the_dir, ResultsExporter.pickle_name))
+
+
+def iter_results(from_path: str) -> Iterator[manip.ManipResult]:
+    "The results stored at `from_path` (a store or a pickle), one at a time"
+    if resultstore.is_store(from_path):
+        yield from resultstore.StoredResults(from_path)
+        return
     with open(from_path, "rb") as fi:
-        return pickle.load(fi)
+        while True:
+            try:
+                obj = pickle.load(fi)
+            except EOFError:
+                return
+            # results pickled as a single list by older versions
+            if isinstance(obj, list):
+                yield from obj
+            else:
+                yield obj
+
+
+def load_result(from_path: str) -> List[manip.ManipResult]:
+    return list(iter_results(from_path))
 
 
 def load_summary(from_path: str) -> str:
@@ -106,6 +251,87 @@ def load_summary(from_path: str) -> str:
         return fi.read()
 
 
+def parse_summary(summary: str) -> Dict[str, Dict[str, str]]:
+    "The sections of a summary.ini as dicts"
+    parser = configparser.ConfigParser()
+    parser.read_string(summary)
+    return {name: dict(parser[name]) for name in parser.sections()}
+
+
+# index entries: dataset name -> alg name -> {"mtime": .., "summary": {section: {..}}}
+Index = Dict[str, Dict[str, dict]]
+
+
+def _read_index(out_dir: str) -> Index:
+    path = os.path.join(out_dir, ResultsExporter.index_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_index(out_dir: str, index: Index):
+    path = os.path.join(out_dir, ResultsExporter.index_name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError:
+        # e.g. a read only results dir: the index is rebuilt at every load
+        pass
+
+
+def update_index(out_dir: str, the_dirs: Iterable[str], index: Optional[Index] = None):
+    "Update the index entries of the given result dirs (dropping the missing ones)"
+    index = _read_index(out_dir) if index is None else index
+    for the_dir in the_dirs:
+        dataset_name = os.path.basename(os.path.dirname(the_dir))
+        alg_name = os.path.basename(the_dir)
+        summary_path = os.path.join(the_dir, ResultsExporter.summary_name)
+        entries = index.setdefault(dataset_name, {})
+        if not os.path.exists(summary_path):
+            entries.pop(alg_name, None)
+            continue
+        entries[alg_name] = {
+            "mtime": os.path.getmtime(summary_path),
+            "summary": parse_summary(load_summary(summary_path)),
+        }
+    _write_index(out_dir, {k: v for k, v in index.items() if v})
+
+
+def load_index(out_dir: str) -> Index:
+    """The parsed summaries of all the results in `out_dir`, from its index.
+    The index is kept up to date by `ResultsExporter`, result dirs written otherwise
+    (e.g. by older versions, or lost by concurrent runs) are found by comparing the
+    mtime of the summaries and indexed on the way.
+    """
+    if not os.path.isdir(out_dir):
+        return {}
+    index = _read_index(out_dir)
+    stale = []
+    for dataset_name in sorted(os.listdir(out_dir)):
+        dataset_dir = os.path.join(out_dir, dataset_name)
+        if not os.path.isdir(dataset_dir):
+            continue
+        entries = index.get(dataset_name, {})
+        alg_names = set(os.listdir(dataset_dir)) | set(entries)
+        for alg_name in sorted(alg_names):
+            the_dir = os.path.join(dataset_dir, alg_name)
+            summary_path = os.path.join(the_dir, ResultsExporter.summary_name)
+            mtime = (
+                os.path.getmtime(summary_path) if os.path.exists(summary_path) else None
+            )
+            if mtime != entries.get(alg_name, {}).get("mtime"):
+                stale.append(the_dir)
+    missing = [d for d in index if not os.path.isdir(os.path.join(out_dir, d))]
+    if stale or missing:
+        for d in missing:
+            del index[d]
+        update_index(out_dir, stale, index)
+    return index
+
+
 def parse_time_delta(s: str):
     hms = s.split(":")
     return timedelta(hours=int(hms[0]), minutes=int(hms[1]), seconds=float(hms[2]))
@@ -44,26 +44,38 @@ from typing import (
     Any,
     Callable,
     Dict,
+    FrozenSet,
     Generator,
     Iterable,
+    Iterator,
     List,
     Literal,
     Optional,
+    Sequence,
     Set,
+    Tuple,
     Union,
 )
 import os
-from copy import deepcopy
+import uuid
+from timeit import default_timer as timer
+import numpy as np
+from collections import OrderedDict
 import STVComputations as stv
+import compiled
+import workers
 from STVComputations import Profile, all_alts
 import itertools as itt
 from tqdm import tqdm
-from multiprocessing import Pool
-from utils import aka, aka_or_name
+import contextlib
+from utils import aka, aka_or_name, is_monotone, monotone
 
 
 ProfileList = List[Profile]
 LinOrd = List[List[int]]
+# NOTE: an SCF must treat the given List[Profile] as read only, the search
+# shares the same Profile objects across all the elections it evaluates.
+# The search may also pass a read only Sequence[Profile] (see `ManipulatedVotes`)
 SCF = Callable[[List[Profile]], Set[int]]
 Compared = Union[Literal[-1], Literal[0], Literal[1]]
 BranchPruneFn = Callable[["ManipulatorConfig", int], bool]
@@ -78,11 +90,17 @@ OutcomeComparator = Callable[[Profile, Set[int], Set[int], Set[int]], Compared]
 # NOTE: the
 ManipGen = Callable[[ProfileList, LinOrd], Generator[LinOrd, None, None]]
 
+# The signature of the manip generators that also depend on the scf and on the
+# coalition size, they take the config and the index of the coalition instead
+# (marked with `conf_manip_gen`, see `manip_candidates`)
+ConfManipGen = Callable[["ManipulatorConfig", int], Generator[LinOrd, None, None]]
+
 
 # ==========================================
 # Comparators
 
 
+@monotone
 @aka("optim")
 def optimistic_comparator(
     p: Profile, out_a: Set[int], out_b: Set[int], alts: Set[int]
@@ -106,6 +124,7 @@ def optimistic_comparator(
     return 0  # indifference
 
 
+@monotone
 @aka("pessim")
 def pessimistic_comparator(
     p: Profile, out_a: Set[int], out_b: Set[int], alts: Set[int]
@@ -160,6 +179,193 @@ def all_permut_manip_gen(p: ProfileList, o: LinOrd) -> Generator[LinOrd, None, N
         yield list(perm)
 
 
+def conf_manip_gen(f: ConfManipGen) -> ConfManipGen:
+    f.__conf_manip_gen__ = True
+    return f
+
+
+def scf_class_permutations(
+    conf: "ManipulatorConfig", i_coalition: int, cells: LinOrd
+) -> Generator[LinOrd, None, None]:
+    """One permutation of `cells` per class of permutations that lead the scf to the
+    same outcomes for the i_th coalition, as declared by the scf (see
+    `utils.ballot_classes`), all the permutations if the scf declares none.
+    """
+    classes = getattr(conf.scf, "__ballot_classes__", None)
+    if classes is None:
+        for p in itt.permutations(cells):
+            yield list(p)
+        return
+
+    coalition = conf.trueballs[i_coalition]
+    others = conf.trueballs[:i_coalition] + conf.trueballs[i_coalition + 1 :]
+    yield from classes(others, coalition.count, cells)
+
+
+@aka("perm-class")
+@conf_manip_gen
+def class_permut_manip_gen(
+    conf: "ManipulatorConfig", i_coalition: int
+) -> Generator[LinOrd, None, None]:
+    """
+    Same search of `permut_manip_gen`, but only one permutation of the original ballot
+    is yielded for each class of permutations that give the same outcomes
+    (e.g. one per top cell for plurality)
+    """
+    yield from scf_class_permutations(
+        conf, i_coalition, conf.trueballs[i_coalition].ballot
+    )
+
+
+@aka("perm-all-class")
+@conf_manip_gen
+def class_all_permut_manip_gen(
+    conf: "ManipulatorConfig", i_coalition: int
+) -> Generator[LinOrd, None, None]:
+    """
+    Same search of `all_permut_manip_gen`, but only one permutation of all the alternatives
+    is yielded for each class of permutations that give the same outcomes
+    """
+    alts = [[x] for x in stv.all_alts(conf.trueballs)]
+    yield from scf_class_permutations(conf, i_coalition, alts)
+
+
+# ==========================================
+# SCF outcome cache
+
+# canonical form of a manipulated election: the (ballot, count) entries whose count
+# differs from the truthful election (0 if the ballot is gone), the truthful
+# election is the same for the whole search so this identifies the weighted
+# ballot multiset, and it's cheap to build from a (coalition, candidate, n) triple
+ElectionKey = FrozenSet[Tuple[stv.BallotKey, int]]
+
+
+class OutcomeCache:
+    """Bounded LRU cache of the SCF outcomes of the manipulated elections.
+
+    NOTE: a search tests every manipulated election once (distinct (coalition,
+    candidate, n) triples are distinct elections), so the cache never hits within
+    a single search: it only pays off shared by the configs with the same
+    trueballs and scf (e.g. the specs that only differ by comparator), the keys
+    being relative to the truthful election. That's why it is off by default.
+    The stored entries are not pickled, a copy sent to another process starts
+    empty and each worker fills its own, never merged back (see `ManipTask`).
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.cache_id = uuid.uuid4().hex
+        self._entries: "OrderedDict[ElectionKey, Set[int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getstate__(self):
+        return {**self.__dict__, "_entries": OrderedDict()}
+
+    def get(self, key: ElectionKey) -> Optional[Set[int]]:
+        outcome = self._entries.get(key)
+        if outcome is not None:
+            self._entries.move_to_end(key)
+        return outcome
+
+    def put(self, key: ElectionKey, outcome: Set[int]):
+        self._entries[key] = outcome
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# ==========================================
+# Search instrumentation
+
+# slowest coalitions listed in the summary of the metrics
+SLOWEST_COALITIONS = 10
+
+
+@dataclass
+class SearchMetrics:
+    """Counters and timings of the searches run with a config, summed over the
+    worker processes (see `ManipTask`), written to the [metrics] section of the
+    results summary.
+
+    NOTE: the times are summed over the workers too, so in a parallel search they
+    exceed the wall time of the search (see the [execution] section)
+    """
+
+    # candidates tested, and those skipped as they are the truthful ballot
+    candidates: int = 0
+    candidates_skipped: int = 0
+    # coalitions skipped by the `branch_prune` of the config
+    coalitions_pruned: int = 0
+    # calls to the scf (a batched call evaluates many elections), elections evaluated
+    scf_calls: int = 0
+    scf_elections: int = 0
+    # outcome cache lookups, see `OutcomeCache`
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # seconds in the scf, in the comparator and building the manipulated elections
+    scf_time: float = 0.0
+    comparator_time: float = 0.0
+    copy_time: float = 0.0
+    # seconds testing the candidates of each coalition, by position in trueballs
+    coalition_time: Dict[int, float] = field(default_factory=dict)
+    # False for the searches that do not test the candidates one by one with
+    # `candidate_results` (e.g. `stvtree`): the candidates and the coalitions are
+    # not counted, and left out of the summary
+    counts_candidates: bool = True
+
+    def add(self, other: "SearchMetrics"):
+        for name, value in other.__dict__.items():
+            if name == "counts_candidates":
+                self.counts_candidates = self.counts_candidates and value
+            elif name != "coalition_time":
+                setattr(self, name, getattr(self, name) + value)
+        for i, t in other.coalition_time.items():
+            self.coalition_time[i] = self.coalition_time.get(i, 0.0) + t
+
+    def add_candidate(self, i_coalition: int, seconds: float, tested: bool = True):
+        self.candidates += tested
+        self.coalition_time[i_coalition] = (
+            self.coalition_time.get(i_coalition, 0.0) + seconds
+        )
+
+    def summary(self) -> str:
+        fields = []
+        if self.counts_candidates:
+            worker_time = sum(self.coalition_time.values())
+            slowest = sorted(self.coalition_time.items(), key=lambda x: -x[1])
+            fields += [
+                ("candidates", self.candidates),
+                ("candidates_skipped", self.candidates_skipped),
+                ("coalitions", len(self.coalition_time)),
+                ("worker_time", f"{worker_time:.3f}"),
+                (
+                    "candidates_per_worker_s",
+                    f"{self.candidates / worker_time if worker_time else 0.0:.1f}",
+                ),
+                (
+                    "slowest_coalitions",
+                    " ".join(f"{i}:{t:.3f}" for i, t in slowest[:SLOWEST_COALITIONS]),
+                ),
+            ]
+        fields += [
+            ("coalitions_pruned", self.coalitions_pruned),
+            ("scf_calls", self.scf_calls),
+            ("scf_elections", self.scf_elections),
+            ("cache_hits", self.cache_hits),
+            ("cache_misses", self.cache_misses),
+            ("scf_time", f"{self.scf_time:.3f}"),
+            ("comparator_time", f"{self.comparator_time:.3f}"),
+            ("copy_time", f"{self.copy_time:.3f}"),
+            (
+                "scf_elections_per_s",
+                f"{self.scf_elections / self.scf_time if self.scf_time else 0.0:.1f}",
+            ),
+        ]
+        return "".join(f"{name}\t=\t{value}\n" for name, value in fields)
+
+
 # ==========================================
 # Search alg implem
 
@@ -186,7 +392,7 @@ class ManipulatorConfig:
     trueballs: List[Profile] = field(repr=False)
     scf: SCF
     comparator: OutcomeComparator
-    manip_gen: ManipGen
+    manip_gen: Union[ManipGen, ConfManipGen]
 
     # all alts is inferred if not specified
     all_alts: Set[int] = field(default_factory=set)
@@ -198,15 +404,90 @@ class ManipulatorConfig:
 
     branch_prune: Optional[BranchPruneFn] = None
 
+    # evaluate all the coalition sizes of a manipulation candidate in one
+    # batched call, when the scf has a batched version (see `compiled.BATCHED`)
+    batched: bool = True
+
+    # find the minimal number of switchers by bisection when the scf and the
+    # comparator are `monotone` and minimal_n_stop is set (see `bisect_manipulation`)
+    bisect: bool = True
+
+    # solve plurality searches with the class generators in closed form
+    # (see `plurality_manipulations`)
+    closed_form: bool = True
+
+    # stop the search after this many results (e.g. 1 to know if the election is
+    # manipulable at all), None finds them all
+    max_results: Optional[int] = None
+
+    # max number of scf outcomes kept in the LRU cache (see `OutcomeCache`), 0 disables
+    # it: only useful with a cache shared by specs with the same trueballs and scf
+    cache_size: int = 0
+    # an existing cache to use instead of a new one
+    outcome_cache: Optional[OutcomeCache] = field(default=None, repr=False)
+
     # the true outcome of the non-manip election, inferred
     true_outcome: Set[int] = field(init=False)
 
+    # position of each (canonical) ballot in trueballs, used to merge
+    # the manipulated ballots with the truthful ones
+    ballot_index: Dict[stv.BallotKey, int] = field(init=False, repr=False)
+
+    # the compiled truthful election, only when the batched scf is used
+    election: Optional[compiled.CompiledElection] = field(init=False, repr=False)
+
+    # counters of the searches run with this config
+    metrics: SearchMetrics = field(
+        init=False, default_factory=SearchMetrics, repr=False
+    )
+
+    # the truthful ballots in shared memory, set when searching with a
+    # `workers.SearchPool`: then the config is pickled without its ballots
+    shared: Optional[workers.SharedBallots] = field(
+        init=False, default=None, repr=False
+    )
+
     def __post_init__(self):
         self.true_outcome = self.scf(self.trueballs)
 
+        if self.outcome_cache is None and self.cache_size:
+            self.outcome_cache = OutcomeCache(self.cache_size)
+        if self.outcome_cache is not None:
+            # the empty key is the truthful election
+            self.outcome_cache.put(frozenset(), self.true_outcome)
+
+        self.election = None
+        if self.batched and self.scf in compiled.BATCHED:
+            ce = compiled.CompiledElection.from_profiles(self.trueballs)
+            # else the scaled scores overflow, the List[Profile] scf is used
+            if ce.fits_int64:
+                self.election = ce
+
+        self.ballot_index = {}
+        for i, p in enumerate(self.trueballs):
+            self.ballot_index.setdefault(stv.ballot_key(p.ballot), i)
+
         if not self.all_alts:
             self.all_alts = stv.all_alts(self.trueballs)
 
+    def __getstate__(self):
+        # the workers count their own metrics (see `ManipTask`)
+        state = {**self.__dict__, "metrics": SearchMetrics()}
+        if self.shared is not None:
+            # the workers read them from shared memory
+            state.update(trueballs=None, election=None, ballot_index=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.shared is not None and self.trueballs is None:
+            attached = self.shared.attach()
+            self.trueballs = attached.profiles
+            self.ballot_index = attached.ballot_index
+            batched = self.batched and self.scf in compiled.BATCHED
+            if batched and attached.election.fits_int64:
+                self.election = attached.election
+
     def summary(self) -> str:
         return """\
 trueballs\t=\t{}
@@ -218,6 +499,13 @@ all_alts\t=\t{}
 minimal_n_stop\t=\t{}
 multiproc\t=\t{}
 branch_prune\t=\t{}
+batched\t=\t{}
+bisect\t=\t{}
+closed_form\t=\t{}
+max_results\t=\t{}
+cache_size\t=\t{}
+cache_hits\t=\t{}
+cache_misses\t=\t{}
 """.format(
             stv.tot_votes(self.trueballs),
             aka_or_name(self.scf),
@@ -228,8 +516,41 @@ branch_prune\t=\t{}
             self.minimal_n_stop,
             0 if not self.multiproc else os.cpu_count(),
             aka_or_name(self.branch_prune),
+            self.election is not None,
+            use_bisection(self),
+            use_closed_form(self),
+            self.max_results,
+            self.outcome_cache.maxsize if self.outcome_cache else 0,
+            self.cache_hits,
+            self.cache_misses,
         )
 
+    def compare(self, coalition: Profile, outcome: Set[int]) -> Compared:
+        "The comparator on the true outcome and `outcome` for the coalition, timed"
+        start = timer()
+        compar = self.comparator(coalition, self.true_outcome, outcome, self.all_alts)
+        self.metrics.comparator_time += timer() - start
+        return compar
+
+    @property
+    def cache_hits(self) -> int:
+        return self.metrics.cache_hits
+
+    @property
+    def cache_misses(self) -> int:
+        return self.metrics.cache_misses
+
+    def cached_outcome(self, key: ElectionKey) -> Optional[Set[int]]:
+        "The cached outcome of the election, None if missing (or no cache)"
+        if self.outcome_cache is None:
+            return None
+        outcome = self.outcome_cache.get(key)
+        if outcome is None:
+            self.metrics.cache_misses += 1
+        else:
+            self.metrics.cache_hits += 1
+        return outcome
+
 
 @dataclass
 class ManipResult:
@@ -239,10 +560,17 @@ class ManipResult:
     the manipulated orders, how many voters switched, the original and new outcome,
     and the complete manipulated List[Profile].
 
-    NOTE: in the new List[Profile] the maniuplated Profile entry will be split
-    in 2 new entries (1 if all the voters of that original profile line
-    switched). If the manip row happens to be the same as one of the other truthfuls
-    those will not be merged, so we'll have 2 Profile in the List with the same .ballot
+    NOTE: in the new List[Profile] the voters of the maniuplated Profile entry that
+    did not switch keep its place (the entry is dropped if all the voters of that
+    original profile line switched). If the manip row happens to be the same as one
+    of the other truthfuls the switchers are merged into it, else they are appended
+    in a new entry, so the List never has 2 Profile with the same .ballot
+    (see `manipulated_votes`)
+
+    The new List[Profile] is not stored: only the position of the coalition in the
+    truthful List[Profile] is, and `new_votes` is rebuilt from the `base` election
+    when accessed. The base is not pickled, the search sets it back on the results
+    sent by the workers.
     """
 
     from_ord: LinOrd
@@ -250,24 +578,309 @@ class ManipResult:
     n: int
     orig_outcome: Set[int]
     new_outcome: Set[int]
-    new_votes: List[Profile]
+    # position of the coalition in the truthful List[Profile] (-1 in results
+    # pickled by older versions, which hold the new_votes)
+    i_coalition: int = -1
+    # the truthful election: a ManipulatorConfig, or anything with its
+    # `trueballs` and `ballot_index` (see `ManipulatedVotes`)
+    base: Optional["ManipulatorConfig"] = field(
+        default=None, repr=False, compare=False
+    )
+
+    @property
+    def new_votes(self) -> List[Profile]:
+        if "new_votes" in self.__dict__:
+            # pickled by an older version
+            return self.__dict__["new_votes"]
+        if self.base is None:
+            raise ValueError(
+                "the base election of the result must be set to rebuild its new_votes"
+                " (e.g. `result.base = conf`, it is not pickled)"
+            )
+        return manipulated_votes(self.base, self.i_coalition, self.to_ord, self.n)
+
+    def __getstate__(self):
+        return {**self.__dict__, "base": None}
 
     @staticmethod
-    def results_summary(results: List["ManipResult"]):
-        n_from = len(list(itt.groupby(results, lambda x: x.from_ord)))
-        n_to = len(list(itt.groupby(results, lambda x: x.to_ord)))
-        n_from_to = len(list(itt.groupby(results, lambda x: (x.from_ord, x.to_ord))))
+    def results_summary(results: Iterable["ManipResult"]):
+        tally = ResultsTally()
+        for r in results:
+            tally.add(r)
+        return tally.summary()
+
+
+@dataclass
+class ResultsTally:
+    """The counts of `ManipResult.results_summary` computed one result at a time:
+    the number of results and of runs of consecutive results with the same
+    from_ord / to_ord / both, as `itertools.groupby` would count them
+    """
 
+    count: int = 0
+    n_from: int = 0
+    n_to: int = 0
+    n_from_to: int = 0
+    # from_ord and to_ord of the last result
+    last: Optional[Tuple[LinOrd, LinOrd]] = None
+
+    def add(self, r: ManipResult):
+        last_from, last_to = self.last if self.last else (None, None)
+        self.count += 1
+        self.n_from += r.from_ord != last_from
+        self.n_to += r.to_ord != last_to
+        self.n_from_to += (r.from_ord, r.to_ord) != (last_from, last_to)
+        self.last = (r.from_ord, r.to_ord)
+
+    def summary(self) -> str:
         return """\
 count\t=\t{}
 n_from\t=\t{}
 n_to\t=\t{}
 n_from_to\t=\t{}
 """.format(
-            len(results), n_from, n_to, n_from_to
+            self.count, self.n_from, self.n_to, self.n_from_to
         )
 
 
+class ManipulatedVotes(Sequence[Profile]):
+    """Read only view of the election where `n_manips` voters of the i_th coalition
+    switched to the `manip_cand` linear order: the truthful List[Profile] plus the
+    (at most 2) entries that changed, so it's built in O(1) instead of copying
+    the truthful list. SCFs can consume it as it is, `list()` materializes it.
+
+    Entries are merged as in `stv.merge_profiles`: the switchers are added to the
+    truthful Profile with the same ballot if there is one, else appended in a new Profile.
+    The voters of the coalition that did not switch keep the coalition's place
+    in the list (dropped if all switched).
+    NOTE: the unchanged Profile objects are shared with the truthful ones,
+    SCFs never modify their input
+    """
+
+    def __init__(
+        self,
+        conf: ManipulatorConfig,
+        i_coalition: int,
+        manip_cand: LinOrd,
+        n_manips: int,
+    ):
+        self.base = conf.trueballs
+        # position -> new entry (None if dropped), sorted by position
+        self.changed: List[Tuple[int, Optional[Profile]]] = []
+        self.appended: List[Profile] = []
+
+        orig_coalition = conf.trueballs[i_coalition]
+        i_manip = conf.ballot_index.get(stv.ballot_key(manip_cand))
+        if i_manip == i_coalition:
+            # the candidate is the truthful order itself, nothing changes
+            return
+
+        if i_manip is None:
+            self.appended.append(Profile(manip_cand, n_manips))
+        else:
+            merged = conf.trueballs[i_manip]
+            self.changed.append(
+                (i_manip, Profile(merged.ballot, merged.count + n_manips))
+            )
+
+        # if n_manips is not all of the voters previously using this profile
+        # the we need to keep some as before
+        remaining = None
+        if n_manips < orig_coalition.count:
+            remaining = Profile(orig_coalition.ballot, orig_coalition.count - n_manips)
+        self.changed.append((i_coalition, remaining))
+        self.changed.sort(key=lambda x: x[0])
+
+    def __len__(self) -> int:
+        dropped = sum(1 for _, p in self.changed if p is None)
+        return len(self.base) - dropped + len(self.appended)
+
+    def __iter__(self) -> Iterator[Profile]:
+        parts: List[Iterable[Profile]] = []
+        start = 0
+        for i, p in self.changed:
+            parts.append(itt.islice(self.base, start, i))
+            if p is not None:
+                parts.append([p])
+            start = i + 1
+        parts.append(itt.islice(self.base, start, None))
+        parts.append(self.appended)
+        return itt.chain.from_iterable(parts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("ManipulatedVotes index out of range")
+        # map i to the position in the truthful list, skipping the dropped entry
+        for j, p in self.changed:
+            if p is None and j <= i:
+                i += 1
+        if i >= len(self.base):
+            return self.appended[i - len(self.base)]
+        for j, p in self.changed:
+            if j == i:
+                return p
+        return self.base[i]
+
+
+def manipulated_votes(
+    conf: ManipulatorConfig, i_coalition: int, manip_cand: LinOrd, n_manips: int
+) -> List[Profile]:
+    """The List[Profile] where `n_manips` voters of the i_th coalition switched
+    to the `manip_cand` linear order, see `ManipulatedVotes`.
+    """
+    return list(ManipulatedVotes(conf, i_coalition, manip_cand, n_manips))
+
+
+def election_keys(
+    conf: ManipulatorConfig, i_coalition: int, manip_cand: LinOrd, ns: Iterable[int]
+) -> List[ElectionKey]:
+    """The `ElectionKey` of the elections where `n` voters of the i_th coalition
+    switched to `manip_cand`, for each `n` in `ns` (see `manipulated_votes`)
+    """
+    coalition = conf.trueballs[i_coalition]
+    coal_key = stv.ballot_key(coalition.ballot)
+    manip_key = stv.ballot_key(manip_cand)
+    i_manip = conf.ballot_index.get(manip_key)
+    if i_manip == i_coalition:
+        return [frozenset() for _ in ns]
+
+    base = 0 if i_manip is None else conf.trueballs[i_manip].count
+    return [
+        frozenset([(coal_key, coalition.count - n), (manip_key, base + n)]) for n in ns
+    ]
+
+
+def manip_outcomes(
+    conf: ManipulatorConfig, i_coalition: int, manip_cand: LinOrd, ns: List[int]
+) -> List[Set[int]]:
+    """The outcomes of the elections where `n` voters of the i_th coalition switched
+    to `manip_cand`, for each `n` in `ns` (same elections as `manipulated_votes`).
+    Only the elections missing from the outcome cache (if any) are evaluated, with a
+    single batched scf call on the compiled truthful election when the config has
+    one, else calling the scf on each manipulated List[Profile].
+    """
+    i_manip = conf.ballot_index.get(stv.ballot_key(manip_cand))
+    if i_manip == i_coalition:
+        # the candidate is the truthful order itself, nothing changes
+        return [conf.true_outcome] * len(ns)
+
+    outcomes: List[Optional[Set[int]]] = [None] * len(ns)
+    cache = conf.outcome_cache
+    if cache is not None:
+        keys = election_keys(conf, i_coalition, manip_cand, ns)
+        outcomes = [conf.cached_outcome(k) for k in keys]
+    missing = [i for i, o in enumerate(outcomes) if o is None]
+    if not missing:
+        return outcomes
+
+    metrics = conf.metrics
+    start = timer()
+    ce = conf.election
+    if ce is not None and i_manip is None:
+        # the switchers go to a new (initially empty) row
+        ce = compiled.append_ballot(ce, manip_cand)
+        i_manip = ce.n_ballots - 1
+        if not ce.fits_int64:
+            # its cells grew the scale too much
+            ce = i_manip = None
+    if ce is None:
+        elections = [
+            ManipulatedVotes(conf, i_coalition, manip_cand, ns[i]) for i in missing
+        ]
+        copied = timer()
+        new_outcomes = [conf.scf(votes) for votes in elections]
+        metrics.scf_calls += len(missing)
+    else:
+        counts = compiled.move_voters(ce, i_coalition, i_manip, [ns[i] for i in missing])
+        copied = timer()
+        new_outcomes = compiled.BATCHED[conf.scf](ce, counts)
+        metrics.scf_calls += 1
+    end = timer()
+    metrics.scf_elections += len(missing)
+    metrics.copy_time += copied - start
+    metrics.scf_time += end - copied
+
+    for i, o in zip(missing, new_outcomes):
+        outcomes[i] = o
+        if cache is not None:
+            cache.put(keys[i], o)
+    return outcomes
+
+
+def bisect_manipulation(
+    conf: ManipulatorConfig, i_coalition: int, manip_cand: LinOrd
+) -> Optional[Tuple[int, Set[int]]]:
+    """The minimal number of switchers of the i_th coalition to `manip_cand` that
+    makes a successful manipulation, with its outcome, None if there is none.
+
+    NOTE: only sound if success is monotone in the number of switchers, i.e. if the
+    scf and the comparator are `monotone` (see `use_bisection`), then n is found by
+    galloping (1, 2, 4, ...) up to the first success and bisecting the last gap,
+    O(log count) scf calls instead of O(count).
+    """
+    orig_coalition = conf.trueballs[i_coalition]
+    tried: Dict[int, Set[int]] = {}
+
+    def success(n: int) -> bool:
+        (tried[n],) = manip_outcomes(conf, i_coalition, manip_cand, [n])
+        return conf.compare(orig_coalition, tried[n]) > 0
+
+    # lo always fails (0 switchers is the truthful election), hi succeeds
+    lo, hi = 0, 1
+    while not success(hi):
+        if hi == orig_coalition.count:
+            return None
+        lo, hi = hi, min(2 * hi, orig_coalition.count)
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if success(mid):
+            hi = mid
+        else:
+            lo = mid
+
+    return hi, tried[hi]
+
+
+def found_result(
+    conf: ManipulatorConfig,
+    i_coalition: int,
+    manip_cand: LinOrd,
+    n_manips: int,
+    manip_outcome: Set[int],
+) -> ManipResult:
+    "The ManipResult of a successful manipulation"
+    result = ManipResult(
+        from_ord=conf.trueballs[i_coalition].ballot,
+        to_ord=manip_cand,
+        n=n_manips,
+        orig_outcome=conf.true_outcome,
+        new_outcome=manip_outcome,
+        i_coalition=i_coalition,
+        base=conf,
+    )
+    if conf.print_found:
+        print("\n\nFound! -> ", result)
+        pprint(result.new_votes)
+    return result
+
+
+def use_bisection(conf: ManipulatorConfig) -> bool:
+    """Whether the search for the number of switchers can be done by bisection:
+    only the minimal one is needed and success is monotone in it.
+    """
+    return (
+        conf.bisect
+        and conf.minimal_n_stop
+        and is_monotone(conf.scf)
+        and is_monotone(conf.comparator)
+    )
+
+
 def test_manipulation(
     conf: ManipulatorConfig, i_coalition: int, manip_cand: LinOrd
 ) -> Generator[ManipResult, None, None]:
@@ -294,67 +907,173 @@ def test_manipulation(
     pursued and the generator stop. Else the search contiues producing result also for higher
     number of switchers.
 
+    NOTE: when only the minimal number of switchers is needed and the scf and the comparator
+    are monotone in it (e.g. plurality) it's found by bisection instead (see `bisect_manipulation`).
+
     """
 
     # given the truthful ballot of the ith coalition
     orig_coalition = conf.trueballs[i_coalition]
 
-    # iterate on the number of switchers
-    for n_manips in range(1, orig_coalition.count + 1):
+    if conf.ballot_index.get(stv.ballot_key(manip_cand)) == i_coalition:
+        # the truthful order itself: the outcome does not change
+        conf.metrics.candidates_skipped += 1
+        return
 
-        # ok now clone the List[Profiles] as this will be destructively modified
-        new_balls = deepcopy(conf.trueballs)
+    if use_bisection(conf):
+        found = bisect_manipulation(conf, i_coalition, manip_cand)
+        if found is not None:
+            yield found_result(conf, i_coalition, manip_cand, *found)
+        return
 
-        manip_p = Profile(manip_cand, n_manips)  # build manipulate profile
+    # iterate on the number of switchers, evaluated in blocks (see `switcher_blocks`)
+    for ns in switcher_blocks(conf, orig_coalition.count):
 
-        # if n_manips is not all of the voters previously using this profile
-        # the we need to keep some as before
-        rest_p = None
-        if n_manips < orig_coalition.count:
-            rest_p = Profile(orig_coalition.ballot, orig_coalition.count - n_manips)
+        # check the new result according to our scf
+        outcomes = manip_outcomes(conf, i_coalition, manip_cand, ns)
 
-        # delete the from the cloned List[Profile] the working Profile
+        for n_manips, manip_outcome in zip(ns, outcomes):
 
-        del new_balls[i_coalition]
+            # use the comparator to see if this is positive result WRT to the coalition's original
+            # preference order, the original outcome and the manipulated outcome under the comparator
+            # specified in the scheme
+            compar = conf.compare(orig_coalition, manip_outcome)
 
-        new_balls.append(manip_p)  # add the manipulated profiles
+            if compar > 0:
+                result = found_result(
+                    conf, i_coalition, manip_cand, n_manips, manip_outcome
+                )
+                yield result
 
-        # if present add the rest of non-manip profiles i.e. voters from the
-        # coalition that did not switch
-        if rest_p:
-            new_balls.append(rest_p)
+                # if minimal n stop will change manipulation
+                # candidate if one is found for this order change. If not,
+                # then say the for this candidate 2 switches are enough for the
+                # manipulation to succeed, then 3,4,5 .. N will also be generated
+                if conf.minimal_n_stop:
+                    return
 
-        # check the new result according to our scf
-        manip_outcome = conf.scf(new_balls)
 
-        # use the comparator to see if this is positive result WRT to the coalition's original
-        # preference order, the original outcome and the manipulated outcome under the comparator
-        # specified in the scheme
-        compar = conf.comparator(
-            orig_coalition, conf.true_outcome, manip_outcome, conf.all_alts
-        )
+# the growing blocks of `switcher_blocks`: a batched call costs about the same for a
+# few elections, so small blocks would only add calls
+FIRST_BLOCK = 32
+BLOCK_GROWTH = 4
 
-        if compar > 0:
-            result = ManipResult(
-                from_ord=orig_coalition.ballot,
-                to_ord=manip_cand,
-                n=n_manips,
-                orig_outcome=conf.true_outcome,
-                new_outcome=manip_outcome,
-                new_votes=new_balls,
-            )
-            if conf.print_found:
-                print("\n\nFound! -> ", result)
-                pprint(result.new_votes)
 
-            yield result
+def switcher_blocks(conf: ManipulatorConfig, count: int) -> Iterator[List[int]]:
+    """The numbers of switchers 1..count in the blocks `test_manipulation` evaluates
+    at once: one at a time without a batched scf, else all of them in one batched
+    call, or in growing blocks (see `FIRST_BLOCK`) with `minimal_n_stop` as the
+    search stops at the first success
+    """
+    if conf.election is None:
+        yield from ([n] for n in range(1, count + 1))
+    elif not conf.minimal_n_stop:
+        yield list(range(1, count + 1))
+    else:
+        lo, size = 1, FIRST_BLOCK
+        while lo <= count:
+            yield list(range(lo, min(lo + size, count + 1)))
+            lo, size = lo + size, BLOCK_GROWTH * size
+
+
+# === closed form solvers
+
 
-            # if minimal n stop will change manipulation
-            # candidate if one is found for this order change. If not,
-            # then say the for this candidate 2 switches are enough for the
-            # manipulation to succeed, then 3,4,5 .. N will also be generated
+def plurality_candidates(conf: ManipulatorConfig, i_coalition: int) -> List[LinOrd]:
+    """The manipulated ballots tested by the class generators for plurality,
+    one per top cell (see `stv.plurality_ballot_classes`)
+    """
+    if conf.manip_gen is class_all_permut_manip_gen:
+        cells = [[x] for x in stv.all_alts(conf.trueballs)]
+    else:
+        cells = conf.trueballs[i_coalition].ballot
+    return list(stv.plurality_ballot_classes([], 0, cells))
+
+
+@dataclass
+class PluralityTally:
+    "The (scaled) plurality scores of the truthful election, see `compiled`"
+
+    alts: List[int]
+    scores: List[int]
+    scale: int
+
+    @staticmethod
+    def of(conf: ManipulatorConfig) -> Optional["PluralityTally"]:
+        "The tally, None if the scaled scores overflow int64 (see `compiled`)"
+        ce = conf.election or compiled.CompiledElection.from_profiles(conf.trueballs)
+        if not ce.fits_int64:
+            return None
+        scores = compiled.plurality_scores(ce, np.ones(ce.n_alts, dtype=bool))
+        return PluralityTally(ce.alts.tolist(), scores.tolist(), ce.scale)
+
+
+def plurality_manipulations(
+    conf: ManipulatorConfig,
+    i_coalition: int,
+    manip_cand: LinOrd,
+    tally: PluralityTally,
+) -> Generator[ManipResult, None, None]:
+    """Same results of `test_manipulation` for plurality, without evaluating the scf
+    for each number of switchers.
+
+    With n switchers the (scaled) score of each alternative is a line
+    `score + n * slope`: the alternatives in the coalition's top cell lose votes, those
+    in the new top cell gain them, all the others keep their score. Alternatives
+    with the same slope keep their order so the outcome only changes where the lines
+    of the best alternative of each slope cross (at most 3 points): the outcome is
+    computed (exactly) once per piece between crossings, O(alts) for each candidate.
+    """
+    coalition = conf.trueballs[i_coalition]
+    col = {a: j for j, a in enumerate(tally.alts)}
+
+    scores = tally.scores
+    slopes = [0] * len(tally.alts)
+    for a in coalition.ballot[0]:
+        slopes[col[a]] -= tally.scale // len(coalition.ballot[0])
+    for a in manip_cand[0]:
+        slopes[col[a]] += tally.scale // len(manip_cand[0])
+
+    # the best alternatives of each slope
+    best: Dict[int, List[int]] = {}
+    for j, d in enumerate(slopes):
+        if d not in best or scores[j] > scores[best[d][0]]:
+            best[d] = [j]
+        elif scores[j] == scores[best[d][0]]:
+            best[d].append(j)
+
+    def outcome(n: int) -> Set[int]:
+        lines = {d: scores[js[0]] + n * d for d, js in best.items()}
+        top = max(lines.values())
+        return set(tally.alts[j] for d, js in best.items() if lines[d] == top for j in js)
+
+    # the first n of each piece: 1, each crossing (a tie) and the n right after it
+    starts = {1}
+    for d, e in itt.combinations(best, 2):
+        num, den = scores[best[e][0]] - scores[best[d][0]], d - e
+        q, r = divmod(num, den)
+        starts.update([q, q + 1] if r == 0 else [q + 1])
+    starts = sorted(n for n in starts if 1 <= n <= coalition.count)
+
+    for start, end in zip(starts, starts[1:] + [coalition.count + 1]):
+        manip_outcome = outcome(start)
+        if conf.compare(coalition, manip_outcome) <= 0:
+            continue
+        for n_manips in range(start, end):
+            yield found_result(conf, i_coalition, manip_cand, n_manips, manip_outcome)
             if conf.minimal_n_stop:
-                break
+                return
+
+
+def use_closed_form(conf: ManipulatorConfig) -> bool:
+    """Whether the search can be solved by `plurality_manipulations`:
+    plurality with the class generators, that test one ballot per top cell
+    """
+    return (
+        conf.closed_form
+        and conf.scf is stv.plurality
+        and conf.manip_gen in [class_permut_manip_gen, class_all_permut_manip_gen]
+    )
 
 
 # === utilities to parallelize the search
@@ -363,74 +1082,210 @@ def test_manipulation(
 @dataclass
 class ManipTask:
     conf: ManipulatorConfig
-    i_coalition: int
 
-    def __call__(self, x: LinOrd):
+    def __call__(
+        self, item: Tuple[int, int, LinOrd]
+    ) -> Tuple[int, int, List[ManipResult], SearchMetrics]:
+        i_coalition, k, x = item
+        # the conf is unpickled anew for every chunk of tasks (with an empty cache), so
+        # each worker process keeps its own copy of the cache across the tasks it runs
+        conf = self.conf
+        if conf.outcome_cache is not None:
+            conf.outcome_cache = _worker_caches.setdefault(
+                conf.outcome_cache.cache_id, conf.outcome_cache
+            )
+        # the metrics of this task, summed up in the main process
+        conf.metrics = SearchMetrics()
+
         # unfortunately we cannot return a generator
         # for tasks exectured in subprocess as it needs to be a picklable result
         # so in this case we must exhaustively search.
         # if conf.minimal_n_stop is true this is actually the same thing as
         # if there is a result then that is also the last result, if there is no result
         # then one hast to visti all search paths anyway
-        return list(test_manipulation(self.conf, self.i_coalition, x))
-
-
-def search_manips(conf: ManipulatorConfig, disable_progess=False):
+        results = candidate_results(conf, i_coalition, x)
+        return i_coalition, k, results, conf.metrics
+
+
+def candidate_results(
+    conf: ManipulatorConfig,
+    i_coalition: int,
+    manip_cand: LinOrd,
+    tally: Optional[PluralityTally] = None,
+) -> List[ManipResult]:
+    """The results of the i_th coalition switching to `manip_cand` (see
+    `test_manipulation`, or `plurality_manipulations` given the plurality tally),
+    counted in the metrics of the config
     """
-    Generator of search results.
-
-    Implementation of the search problem described by the given config.
+    skipped = conf.metrics.candidates_skipped
+    start = timer()
+    if tally is not None:
+        # plurality is solved directly, no need to test the coalition sizes
+        results = list(plurality_manipulations(conf, i_coalition, manip_cand, tally))
+    else:
+        results = list(test_manipulation(conf, i_coalition, manip_cand))
+    # the truthful ballot is skipped by `test_manipulation`, not tested
+    tested = conf.metrics.candidates_skipped == skipped
+    conf.metrics.add_candidate(i_coalition, timer() - start, tested)
+    return results
+
+
+# the outcome caches used by a worker process, by cache_id
+_worker_caches: Dict[str, OutcomeCache] = {}
+
+
+def manip_candidates(
+    conf: ManipulatorConfig, i_coalition: int
+) -> Generator[LinOrd, None, None]:
+    "The manipulated ballots to test for the i_th coalition"
+    if getattr(conf.manip_gen, "__conf_manip_gen__", False):
+        return conf.manip_gen(conf, i_coalition)
+    return conf.manip_gen(conf.trueballs, conf.trueballs[i_coalition].ballot)
+
+
+# position of the search: the (coalition, candidate) pair to test next, the
+# candidates of a coalition are numbered in the order of its generator
+Cursor = Tuple[int, int]
+
+
+def coalition_candidates(
+    conf: ManipulatorConfig, i_coalition: int, start: int = 0
+) -> Iterator[LinOrd]:
+    "The candidates of the i_th coalition, from the `start`_th, skipping pruned ones"
+    if conf.branch_prune and conf.branch_prune(conf, i_coalition):
+        conf.metrics.coalitions_pruned += 1
+        return iter(())
+    if use_closed_form(conf):
+        cands = plurality_candidates(conf, i_coalition)
+    else:
+        cands = manip_candidates(conf, i_coalition)
+    return itt.islice(cands, start, None)
+
+
+def coalition_tasks(
+    conf: ManipulatorConfig, start: Cursor = (0, 0)
+) -> Generator[Tuple[int, int, LinOrd], None, None]:
+    "The (coalition, candidate number, manipulated ballot) to test, from `start`"
+    i0, k0 = start
+    for i_prof in range(i0, len(conf.trueballs)):
+        k_start = k0 if i_prof == i0 else 0
+        for k, manip_cand in enumerate(
+            coalition_candidates(conf, i_prof, k_start), k_start
+        ):
+            yield i_prof, k, manip_cand
+
+
+def parallel_search_steps(
+    conf: ManipulatorConfig,
+    disable_progess=False,
+    pool: Optional[workers.SearchPool] = None,
+    start: Cursor = (0, 0),
+) -> Generator[Tuple[Cursor, List[ManipResult]], None, None]:
+    """The multiproc search: the candidates of all the coalitions go in a single
+    queue, so the workers do not wait for a coalition to be done before starting the
+    next one. The results are yielded in the same order as the serial search.
     """
-
-    true_outcome = conf.scf(conf.trueballs)
-
-    _all_alts = stv.all_alts(conf.trueballs)
-
-    pool = Pool()
-
-    with pool:
-        # ok so now for each linear order in the list of Profile
-        # we want to check if by strategic voting we can get a better outcome for this
-        # profile
-        for i_prof, p in tqdm(
-            enumerate(conf.trueballs),
-            desc="outer (coalition)",
-            position=0,
-            total=len(conf.trueballs),
+    with contextlib.ExitStack() as stack:
+        if pool is None:
+            pool = stack.enter_context(workers.SearchPool())
+        conf.shared = pool.share(conf.trueballs)
+        stack.callback(setattr, conf, "shared", None)
+
+        outer = stack.enter_context(
+            tqdm(
+                desc="outer (coalition)",
+                initial=start[0],
+                total=len(conf.trueballs),
+                disable=disable_progess,
+            )
+        )
+        task = ManipTask(conf=conf)
+        # closing it (the caller stopped the search) cancels the queued tasks
+        done = stack.enter_context(
+            contextlib.closing(pool.imap(task, coalition_tasks(conf, start)))
+        )
+        for i_prof, k, results, metrics in done:
+            # results come in order: the coalitions before this one are done
+            outer.update(i_prof - outer.n)
+            conf.metrics.add(metrics)
+            for r in results:
+                r.base = conf
+            yield (i_prof, k + 1), results
+        outer.update(outer.total - outer.n)
+
+
+def search_steps(
+    conf: ManipulatorConfig,
+    disable_progess=False,
+    pool: Optional[workers.SearchPool] = None,
+    start: Cursor = (0, 0),
+) -> Generator[Tuple[Cursor, List[ManipResult]], None, None]:
+    """The search one candidate at a time, from the `start` cursor: yields the
+    results of each candidate with the cursor of the next one, so the search
+    can be resumed from there (see `checkpoint.py`).
+    """
+    if conf.multiproc and not use_closed_form(conf):
+        yield from parallel_search_steps(conf, disable_progess, pool, start)
+        return
+
+    tally = PluralityTally.of(conf) if use_closed_form(conf) else None
+
+    # ok so now for each linear order in the list of Profile
+    # we want to check if by strategic voting we can get a better outcome for this
+    # profile
+    for i_prof in tqdm(
+        range(start[0], len(conf.trueballs)),
+        desc="outer (coalition)",
+        position=0,
+        initial=start[0],
+        total=len(conf.trueballs),
+        disable=disable_progess,
+    ):
+        # generate candidate manipulations, skipping the pruned branches
+        k_start = start[1] if i_prof == start[0] else 0
+        cands = coalition_candidates(conf, i_prof, k_start)
+
+        dec_cands = tqdm(
+            cands,
+            desc=f"mid-{i_prof}",
+            position=1,
+            leave=False,
             disable=disable_progess,
-        ):
-            # generate candidate manipulations
+        )
 
-            # check if this branch should be skipped
-            if conf.branch_prune and conf.branch_prune(conf, i_prof):
-                continue
+        for k, manip_cand in enumerate(dec_cands, k_start):
+            yield (i_prof, k + 1), candidate_results(conf, i_prof, manip_cand, tally)
 
-            cands = conf.manip_gen(conf.trueballs, p.ballot)
 
-            dec_cands = tqdm(
-                cands,
-                desc=f"mid-{i_prof}",
-                position=1,
-                leave=False,
-                disable=disable_progess,
-            )
+def search_manips(
+    conf: ManipulatorConfig,
+    disable_progess=False,
+    pool: Optional[workers.SearchPool] = None,
+):
+    """
+    Generator of search results.
+
+    Implementation of the search problem described by the given config.
+    With `multiproc` the given pool is used (and left open), else one is
+    created for this search (see `parallel_search_steps`).
 
-            # execute on a single processor
-            if not conf.multiproc:
-                for manip_cand in dec_cands:  # for each manipulation hypotesis
-                    # if generator reuturns stuff then yield it
-                    for result in test_manipulation(conf, i_prof, manip_cand):
-                        yield result
-            # execute on all available processors
-            else:
-                # build the task function/callable-object
-                task = ManipTask(conf=conf, i_coalition=i_prof)
-                # ran search along the manipulation hypoteses
-                # in parallel
-                for results in pool.imap(task, dec_cands):
-                    if results:  # if the task returns something not empty
-                        for r in results:  # then yield each result
-                            yield r
+    The search stops after `conf.max_results` results, or as soon as the
+    generator is closed: the pending parallel tasks are then cancelled.
+    """
+    steps = search_steps(conf, disable_progess, pool)
+    with contextlib.closing(steps):
+        results = (r for _, step_results in steps for r in step_results)
+        yield from itt.islice(results, conf.max_results)
+
+
+def first_manipulation(
+    conf: ManipulatorConfig,
+    disable_progess=True,
+    pool: Optional[workers.SearchPool] = None,
+) -> Optional[ManipResult]:
+    "The first result of the search, None if the election is not manipulable"
+    with contextlib.closing(search_manips(conf, disable_progess, pool)) as results:
+        return next(results, None)
 
 
 if __name__ == "__main__":
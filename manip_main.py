@@ -4,10 +4,20 @@ CLI entry point to run the project.
 
 """
 import configparser
-from typing import Callable, List
+import catalog
+import contextlib
+import functools
+import signal
+import sqlite3
+import sys
+from typing import Callable, Iterable, List
 import STVComputations as stv
 from STVComputations import Profile
 import manip
+import checkpoint
+import stvtree
+import synthetic
+import workers
 from pprint import pprint
 import pickle
 import os
@@ -15,24 +25,33 @@ import click
 from configs import configs, spec_to_ManipulatorConfig
 from datetime import datetime
 from dataclasses import dataclass
-from export import ExecInfo, ResultsExporter, load_result, load_summary
+from export import (
+    ExecInfo,
+    ResultsExporter,
+    iter_results,
+    load_results,
+    load_summary,
+)
 import seedir
 import shutil
 
 from utils import aka_or_name
 
 
-def preview_results(results: List[manip.ManipResult]):
-    if len(results) > 0:
-        print()
-        print("=" * 42)
-        for i, r in enumerate(results):
-            print(f"<Result {i}>")
-            pprint(r)
+def preview_results(results: Iterable[manip.ManipResult]):
+    empty = True
+    for i, r in enumerate(results):
+        if empty:
+            print()
+            print("=" * 42)
+            empty = False
+        print(f"<Result {i}>")
+        pprint(r)
+    if empty:
+        print("---- No manipulations found ----")
+    else:
         print("=" * 42)
         print()
-    else:
-        print("---- No manipulations found ----")
 
 
 @click.group()
@@ -66,7 +85,65 @@ def cli():
 @click.option("--stop-n/--no-stop-n", default=True)
 @click.option("--preview/--no-preview", default=True)
 @click.option("--force/--no-force", default=False)
-def run(dataset, spec, out_dir, multi, print_found, stop_n, preview, force):
+@click.option("--cache/--no-cache", default=False)
+@click.option(
+    "--scf-cache",
+    type=click.IntRange(min=0),
+    default=0,
+    help="max number of scf outcomes kept in memory, shared by the specs with the "
+    "same scf (a single search never tests an election twice), 0 disables it",
+)
+@click.option(
+    "--stv-tree/--no-stv-tree",
+    default=False,
+    help="search the STV specs with the elimination tree (see stvtree.py)",
+)
+@click.option(
+    "--chunksize",
+    type=click.IntRange(min=1),
+    default=workers.CHUNKSIZE,
+    help="number of manipulation candidates sent at once to a worker (with --multi)",
+)
+@click.option(
+    "--max-results",
+    type=click.IntRange(min=1),
+    default=None,
+    help="stop each search after this many manipulations (1: is it manipulable?)",
+)
+@click.option(
+    "--checkpoint-every",
+    type=click.IntRange(min=0),
+    default=checkpoint.INTERVAL,
+    help="seconds between checkpoints of the search, 0 disables them",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    help="continue the interrupted searches from their checkpoint "
+    "(needs --checkpoint-every > 0)",
+)
+def run(
+    dataset,
+    spec,
+    out_dir,
+    multi,
+    print_found,
+    stop_n,
+    preview,
+    force,
+    cache,
+    scf_cache,
+    stv_tree,
+    chunksize,
+    max_results,
+    checkpoint_every,
+    resume,
+):
+    if resume and not checkpoint_every:
+        raise click.BadParameter(
+            "--resume needs checkpoints, not --checkpoint-every 0",
+            param_hint="--checkpoint-every",
+        )
 
     exporter = ResultsExporter(out_dir)
 
@@ -76,7 +153,9 @@ def run(dataset, spec, out_dir, multi, print_found, stop_n, preview, force):
 
     # load the dataset
     try:
-        votes = stv.extract_data(dataset)
+        votes = stv.extract_data(
+            dataset, procs=os.cpu_count() if multi else 1, cache=cache
+        )
     except Exception as e:
         raise click.ClickException(f"Could not load dataset [{dataset}] {e}")
 
@@ -87,50 +166,93 @@ def run(dataset, spec, out_dir, multi, print_found, stop_n, preview, force):
     ran = []
     skipped = []
 
-    for _spec in _specs:
-        i_spec = len(ran) + len(skipped)
-        # determine the configuration spec
-        manip_spec = configs[_spec]
-
-        click.echo(f"\n>>> configuration {i_spec}:")
-        for k, v in manip_spec.items():
-            print(f"\t- {k}: {aka_or_name(v) or v}")
-        print()
-
-        # instantiate the config
-        manip_config = spec_to_ManipulatorConfig(manip_spec, votes)
-
-        # configure additional options
-        manip_config.multiproc = multi
-        manip_config.print_found = print_found
-        manip_config.minimal_n_stop = stop_n
-
-        # Check if result was already computed
-        if exporter.result_exists(dataset, _spec, manip_config) and not force:
-            skipped.append(_spec)
-            continue
-
-        # Preamble
-        click.echo(
-            f"> Original outcome according to config: {manip_config.true_outcome}\n"
-        )
-        click.echo("> Running search...")
-
-        start = datetime.now()
-        # run
-        results = list(manip.search_manips(manip_config))
-        end = datetime.now()
-
-        click.echo(f"Found {len(results)} manipulations for {_spec} on {dataset} data")
-
-        # export results
-        exporter(dataset, _spec, manip_config, results, ExecInfo(start, end))
-
-        # preview results
-        if len(results) > 0 and preview:
-            preview_results(results)
-
-        ran.append(_spec)
+    # specs with the same scf test the same elections, they share the outcome cache
+    scf_caches = {}
+
+    # one pool of workers for all the specs, the ballots are shared once
+    pool = workers.SearchPool(chunksize=chunksize) if multi else None
+
+    # preempted jobs are sent SIGTERM: exit cleanly so the checkpoint is saved
+    # NOTE: set after the pool is created, the workers keep the default handler
+    signal.signal(signal.SIGTERM, lambda signum, _: sys.exit(128 + signum))
+
+    with pool or contextlib.nullcontext():
+        for _spec in _specs:
+            i_spec = len(ran) + len(skipped)
+            # determine the configuration spec
+            manip_spec = configs[_spec]
+
+            click.echo(f"\n>>> configuration {i_spec}:")
+            for k, v in manip_spec.items():
+                print(f"\t- {k}: {aka_or_name(v) or v}")
+            print()
+
+            # instantiate the config
+            outcome_cache = None
+            if scf_cache:
+                outcome_cache = scf_caches.setdefault(
+                    manip_spec["scf"], manip.OutcomeCache(scf_cache)
+                )
+            manip_config = spec_to_ManipulatorConfig(
+                manip_spec, votes, outcome_cache=outcome_cache
+            )
+
+            # configure additional options
+            manip_config.multiproc = multi
+            manip_config.print_found = print_found
+            manip_config.minimal_n_stop = stop_n
+            manip_config.max_results = max_results
+
+            # Check if result was already computed
+            if exporter.result_exists(dataset, _spec, manip_config) and not force:
+                skipped.append(_spec)
+                continue
+
+            # Preamble
+            click.echo(
+                f"> Original outcome according to config: {manip_config.true_outcome}\n"
+            )
+            click.echo("> Running search...")
+
+            start = datetime.now()
+            # run, the results go to disk as they are found
+            sink = exporter.sink(dataset, _spec, manip_config)
+            if stv_tree and manip_config.scf is stv.stv:
+                # NOTE: the elimination tree search is not checkpointed
+                found = sink.write_through(stvtree.search_manips(manip_config))
+            elif checkpoint_every:
+                path = exporter.checkpoint_path(dataset, _spec, manip_config)
+                ckpt = checkpoint.load(path, manip_config) if resume else None
+                if ckpt is not None:
+                    click.echo(f"> Resuming from {ckpt.cursor} (coalition, candidate)")
+                    start -= ckpt.elapsed
+                found = checkpoint.search_manips(
+                    manip_config,
+                    path,
+                    interval=checkpoint_every,
+                    pool=pool,
+                    sink=sink,
+                    ckpt=ckpt,
+                )
+            else:
+                found = sink.write_through(manip.search_manips(manip_config, pool=pool))
+            with contextlib.closing(found):
+                for _ in found:
+                    pass
+            end = datetime.now()
+
+            click.echo(
+                f"Found {sink.tally.count} manipulations for {_spec} on {dataset} data"
+            )
+
+            # export results
+            exporter(dataset, _spec, manip_config, sink, ExecInfo(start, end))
+
+            # preview results
+            if sink.tally.count > 0 and preview:
+                preview_results(iter_results(sink.path))
+
+            ran.append(_spec)
 
     print("-" * 21, "SUMMARY", "-" * 21)
     if ran:
@@ -176,18 +298,136 @@ def result(res_dir):
 
     click.echo(f"------ Viewing results from {res_dir} ------")
 
-    res_pickle = os.path.join(res_dir, ResultsExporter.pickle_name)
     res_summary = os.path.join(res_dir, ResultsExporter.summary_name)
 
     summary = load_summary(res_summary)
 
-    manip_results: List[manip.ManipResult] = load_result(res_pickle)
-
-    preview_results(manip_results)
+    preview_results(load_results(res_dir))
 
     print(summary)
 
 
+# === Catalog queries ===
+
+
+def catalog_path(out_dir: str) -> str:
+    path = os.path.join(out_dir, ResultsExporter.catalog_name)
+    if not os.path.exists(path):
+        raise click.ClickException(f"No catalog in {out_dir}, run a scheme first")
+    return path
+
+
+def echo_rows(rows):
+    "Print the rows tab separated, with a header"
+    if not rows:
+        click.echo("(no rows)")
+        return
+    click.echo("\t".join(rows[0].keys()))
+    for row in rows:
+        click.echo("\t".join("" if v is None else str(v) for v in row))
+
+
+def out_dir_option(f):
+    return click.option(
+        "-o",
+        "--out-dir",
+        type=click.Path(file_okay=False, dir_okay=True),
+        default="./results",
+    )(f)
+
+
+def run_filters(f):
+    "Options selecting runs by their columns in the catalog"
+    for col in reversed(catalog.GROUP_BY):
+        f = click.option(f"--{col.replace('_', '-')}", col, default=None)(f)
+    return f
+
+
+@cli.group(help="Query the catalog of the runs (without loading the results)")
+def query():
+    pass
+
+
+@query.command("runs", help="list the runs")
+@out_dir_option
+@run_filters
+@click.option("--latest/--all", default=False, help="only the last run of each spec")
+def query_runs(out_dir, latest, **filters):
+    echo_rows(catalog.runs(catalog_path(out_dir), latest, **filters))
+
+
+@query.command("results", help="list the results of a run")
+@out_dir_option
+@click.argument("run_id", type=int)
+@click.option("--min-n", type=int, default=None)
+@click.option("--max-n", type=int, default=None)
+@click.option("--limit", type=int, default=None)
+def query_results(out_dir, run_id, min_n, max_n, limit):
+    echo_rows(catalog.results(catalog_path(out_dir), run_id, min_n, max_n, limit))
+
+
+@query.command("stats", help="aggregate the runs")
+@out_dir_option
+@run_filters
+@click.option(
+    "--by",
+    multiple=True,
+    type=click.Choice(catalog.GROUP_BY),
+    help="group the runs by these columns",
+)
+@click.option("--latest/--all", default=True, help="only the last run of each spec")
+def query_stats(out_dir, by, latest, **filters):
+    echo_rows(catalog.stats(catalog_path(out_dir), by, latest, **filters))
+
+
+@query.command("sql", help="run a read only SQL query")
+@out_dir_option
+@click.argument("sql")
+def query_sql(out_dir, sql):
+    try:
+        rows = catalog.query(catalog_path(out_dir), sql)
+    except sqlite3.Error as e:
+        raise click.ClickException(str(e))
+    echo_rows(rows)
+
+
+# === Synthetic data ===
+
+
+@cli.command(help="generate a synthetic election as a PrefLib file")
+@click.option("-m", "--model", type=click.Choice(list(synthetic.MODELS)), default="ic")
+@click.option("-n", "--voters", type=int, default=10_000, show_default=True)
+@click.option("-a", "--alts", type=int, default=5, show_default=True)
+@click.option("--phi", type=float, default=0.5, show_default=True, help="mallows")
+@click.option("--alpha", type=float, default=0.1, show_default=True, help="urn")
+@click.option(
+    "--truncation",
+    type=float,
+    default=0.0,
+    help="fraction of the voters ranking only some alternatives",
+)
+@click.option(
+    "--tie-rate",
+    type=float,
+    default=0.0,
+    help="probability of an alternative tied with the one before",
+)
+@click.option("--seed", type=int, default=None)
+@click.option(
+    "-o",
+    "--out",
+    type=click.Path(file_okay=True, dir_okay=False),
+    required=True,
+)
+def generate(model, voters, alts, phi, alpha, truncation, tie_rate, seed, out):
+    params = {"mallows": {"phi": phi}, "urn": {"alpha": alpha}}.get(model, {})
+    votes = synthetic.generate(
+        model, voters, alts, truncation, tie_rate, seed, **params
+    )
+    synthetic.write_preflib(out, votes)
+    click.echo(f"{len(votes)} distinct ballots of {voters} voters written to {out}")
+
+
 # === Info ===
 
 
@@ -3,8 +3,7 @@
 from datetime import timedelta
 import streamlit as st
 import os
-from export import load_result, load_summary, ResultsExporter, parse_time_delta
-import configparser
+from export import load_index, load_results, ResultsExporter, parse_time_delta
 import pandas as pd
 import altair as alt
 
@@ -12,59 +11,114 @@ st.title("Manipulation results")
 
 DIR = os.getenv("RESULTS_DIR") or "./results"
 
+# results shown per page
+PAGE_SIZE = 20
+
+
+def index_stamp(out_dir: str) -> float:
+    "Changes when the exporter updates the index"
+    path = os.path.join(out_dir, ResultsExporter.index_name)
+    return os.path.getmtime(path) if os.path.exists(path) else 0
+
+
+@st.cache_data
+def cached_index(out_dir: str, stamp: float):
+    return load_index(out_dir)
+
+
+@st.cache_resource
+def cached_results(scheme_dir: str, mtime: float):
+    # the results are read on demand (see resultstore.py), cheap to keep around
+    return load_results(scheme_dir)
+
+
+def show_results(dataset_name: str, scheme: str, scheme_dir: str, meta: dict):
+    count = int(meta["summary"]["results"]["count"])
+    results = cached_results(scheme_dir, meta["mtime"])
+
+    n_pages = (count + PAGE_SIZE - 1) // PAGE_SIZE
+    page = 1
+    if n_pages > 1:
+        page = st.number_input(
+            f"page (of {n_pages})",
+            min_value=1,
+            max_value=n_pages,
+            value=1,
+            key=f"page-{dataset_name}-{scheme}",
+        )
+    start = (page - 1) * PAGE_SIZE
+    for i in range(start, min(start + PAGE_SIZE, count)):
+        result = results[i]
+        label = f"Manipulation on '{dataset_name}' with '{scheme}' [{i}]"
+        with st.expander(label=label):
+            st.markdown(
+                """
+            - From: {}
+            - To: {}
+            - n: {}
+            - Original Outcome: {}
+            - New Outcome: {}
+            """.format(
+                    result.from_ord,
+                    result.to_ord,
+                    result.n,
+                    result.orig_outcome,
+                    result.new_outcome,
+                )
+            )
+            # the new profile is rebuilt only when asked for
+            if st.checkbox("New profile", key=f"votes-{dataset_name}-{scheme}-{i}"):
+                st.dataframe(
+                    pd.DataFrame(
+                        {
+                            "ballot": [str(p.ballot) for p in result.new_votes],
+                            "count": [p.count for p in result.new_votes],
+                        }
+                    )
+                )
+
 
 def main():
-    dataset_name = st.selectbox("dataset", options=os.listdir(DIR))
+    if st.sidebar.button("Rescan results"):
+        # e.g. for results written without updating the index
+        cached_index.clear()
+    index = cached_index(DIR, index_stamp(DIR))
 
-    dataset_dir = os.path.join(DIR, dataset_name)
-    schemes = os.listdir(dataset_dir)
+    dataset_name = st.selectbox("dataset", options=sorted(index))
+    if dataset_name is None:
+        st.warning(f"No results in {DIR}")
+        return
 
-    metas = {}
+    metas = index[dataset_name]
 
     summary_table = st.container()
 
-    for scheme in sorted(schemes):
+    for scheme, meta in sorted(metas.items()):
         scheme_dir = os.path.join(DIR, dataset_name, scheme)
-        summary = load_summary(os.path.join(scheme_dir, ResultsExporter.summary_name))
-        results = load_result(os.path.join(scheme_dir, ResultsExporter.pickle_name))
-
-        summary_meta = configparser.ConfigParser()
-        summary_meta.read_string(summary)
-        metas[scheme] = summary_meta
-
-        st.header(f"Scheme: {scheme} ({'NOT FOUND' if len(results)==0 else  'FOUND'})")
-
-        st.markdown(f"```\n{summary}```")
-
-        if len(results) > 0:
-            for i, result in enumerate(results):
-                with st.expander(
-                    label=f"Manipulation on '{dataset_name}' with '{scheme}' [{i}]"
-                ):
-                    st.markdown(
-                        """
-                    - From: {}
-                    - To: {}
-                    - n: {}
-                    - Original Outcome: {}
-                    - New Outcome: {}
-                    """.format(
-                            result.from_ord,
-                            result.to_ord,
-                            result.n,
-                            result.orig_outcome,
-                            result.new_outcome,
-                        )
-                    )
-                    st.markdown("#### New profile")
-                    for p in result.new_votes:
-                        st.write(p)
+        summary = meta["summary"]
+        count = int(summary["results"]["count"])
+
+        st.header(f"Scheme: {scheme} ({'NOT FOUND' if count == 0 else 'FOUND'})")
+
+        st.markdown(
+            "```\n{}```".format(
+                "".join(
+                    f"[{name}]\n" + "".join(f"{k}\t=\t{v}\n" for k, v in sec.items())
+                    for name, sec in summary.items()
+                )
+            )
+        )
+
+        if count > 0:
+            show_results(dataset_name, scheme, scheme_dir, meta)
         else:
             st.warning("No manipulations found")
 
-    ev_time_y = [parse_time_delta(m["execution"]["dur"]) for m in metas.values()]
+    ev_time_y = [
+        parse_time_delta(m["summary"]["execution"]["dur"]) for m in metas.values()
+    ]
     ev_time_x = list(metas.keys())
-    ev_results = [m["results"]["count"] for m in metas.values()]
+    ev_results = [int(m["summary"]["results"]["count"]) for m in metas.values()]
 
     time_df = pd.DataFrame(
         {
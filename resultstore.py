@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Columnar on-disk store of search results.
+
+A store is a directory with:
+
+- `results.bin`: one fixed size record per result (see `RECORD`): the coalition
+  (position in the truthful List[Profile]), the manipulated ballot, the number of
+  switchers and the original and new outcomes, as ids in the tables below
+- `ballots.jsonl` and `outcomes.jsonl`: the distinct ballots and outcomes, one json
+  list per line, the id is the line number
+- `election.npy`: the truthful election as (ballot id, count) rows
+
+All files are only appended to, so results are written one at a time and a store
+can be cut back to an earlier size (see `StoreWriter.truncate`). The records are
+memory-mapped, so reading the number of results or the i_th result does not read
+the others. The manipulated List[Profile] of a result (`ManipResult.new_votes`) is
+not stored, it is rebuilt from the truthful election when accessed.
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+import STVComputations as stv
+import manip
+from manip import LinOrd, ManipResult
+from STVComputations import Profile
+
+RECORD = np.dtype(
+    [
+        ("coalition", "<i4"),
+        ("to", "<i4"),
+        ("n", "<i8"),
+        ("orig", "<i4"),
+        ("new", "<i4"),
+    ]
+)
+
+RECORDS_NAME = "results.bin"
+BALLOTS_NAME = "ballots.jsonl"
+OUTCOMES_NAME = "outcomes.jsonl"
+ELECTION_NAME = "election.npy"
+
+# the files appended to, in the order they are written
+APPENDED = [BALLOTS_NAME, OUTCOMES_NAME, RECORDS_NAME]
+
+
+def is_store(path: str) -> bool:
+    return os.path.exists(os.path.join(path, RECORDS_NAME))
+
+
+def _read_table(path: str) -> List[list]:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+@dataclass
+class TruthfulElection:
+    "The parts of a `ManipulatorConfig` that `manip.ManipulatedVotes` reads"
+
+    trueballs: List[Profile]
+    ballot_index: Dict[stv.BallotKey, int]
+
+    @staticmethod
+    def of(votes: List[Profile]) -> "TruthfulElection":
+        ballot_index: Dict[stv.BallotKey, int] = {}
+        for i, p in enumerate(votes):
+            ballot_index.setdefault(stv.ballot_key(p.ballot), i)
+        return TruthfulElection(votes, ballot_index)
+
+
+class StoreWriter:
+    """Appends results to the store at `path` for the truthful election of the
+    config: a new store, or the existing one cut back to the given `offsets`.
+    Call `flush` before reading the store.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        conf: manip.ManipulatorConfig,
+        offsets: Optional[Dict[str, int]] = None,
+    ):
+        self.path = path
+        self.election = TruthfulElection(conf.trueballs, conf.ballot_index)
+        self.files: Dict[str, BinaryIO] = {}
+        os.makedirs(path, exist_ok=True)
+        self.truncate(offsets or {})
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def truncate(self, offsets: Dict[str, int]):
+        """Cut the appended files back to the given sizes (missing ones are emptied)
+        and (re)write the truthful election
+        """
+        self.close()
+        for name in APPENDED:
+            with open(self._file(name), "ab") as f:
+                f.truncate(offsets.get(name, 0))
+
+        ballots = _read_table(self._file(BALLOTS_NAME))
+        outcomes = _read_table(self._file(OUTCOMES_NAME))
+        self.ballots = {stv.ballot_key(b): i for i, b in enumerate(ballots)}
+        self.outcomes = {frozenset(o): i for i, o in enumerate(outcomes)}
+        self.files = {name: open(self._file(name), "ab") for name in APPENDED}
+
+        rows = [(self._ballot_id(p.ballot), p.count) for p in self.election.trueballs]
+        rows = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        np.save(self._file(ELECTION_NAME), rows)
+
+    def _intern(self, table: dict, name: str, key, value) -> int:
+        if key not in table:
+            table[key] = len(table)
+            line = json.dumps(value, default=int) + "\n"
+            self.files[name].write(line.encode())
+        return table[key]
+
+    def _ballot_id(self, ballot: LinOrd) -> int:
+        return self._intern(self.ballots, BALLOTS_NAME, stv.ballot_key(ballot), ballot)
+
+    def _outcome_id(self, outcome: Set[int]) -> int:
+        key = frozenset(outcome)
+        return self._intern(self.outcomes, OUTCOMES_NAME, key, sorted(outcome))
+
+    def append(self, result: ManipResult):
+        coalition = result.i_coalition
+        if coalition < 0:
+            # pickled by an older version
+            coalition = self.election.ballot_index[stv.ballot_key(result.from_ord)]
+        record = np.array(
+            [
+                (
+                    coalition,
+                    self._ballot_id(result.to_ord),
+                    result.n,
+                    self._outcome_id(result.orig_outcome),
+                    self._outcome_id(result.new_outcome),
+                )
+            ],
+            dtype=RECORD,
+        )
+        self.files[RECORDS_NAME].write(record.tobytes())
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def offsets(self) -> Dict[str, int]:
+        "The size of the appended files, to `truncate` back to"
+        return {name: f.tell() for name, f in self.files.items()}
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class StoredResults(Sequence[ManipResult]):
+    """The results of the store at `path`, read on demand: the records are
+    memory-mapped and the tables are read at the first access to a result.
+    NOTE: results appended after this object is created are not seen
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        records = os.path.join(path, RECORDS_NAME)
+        n = os.path.getsize(records) // RECORD.itemsize
+        self.records = (
+            np.memmap(records, dtype=RECORD, mode="r", shape=(n,))
+            if n
+            else np.empty(0, dtype=RECORD)
+        )
+        self._tables: Optional[tuple] = None
+
+    def tables(self):
+        "The ballots, the outcomes and the truthful election"
+        if self._tables is None:
+            ballots = _read_table(os.path.join(self.path, BALLOTS_NAME))
+            outcomes = _read_table(os.path.join(self.path, OUTCOMES_NAME))
+            outcomes = [set(o) for o in outcomes]
+            rows = np.load(os.path.join(self.path, ELECTION_NAME)).tolist()
+            votes = [Profile(ballots[b], count) for b, count in rows]
+            self._tables = (ballots, outcomes, TruthfulElection.of(votes))
+        return self._tables
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        coalition, to, n, orig, new = self.records[i].tolist()
+        ballots, outcomes, election = self.tables()
+        return ManipResult(
+            from_ord=election.trueballs[coalition].ballot,
+            to_ord=ballots[to],
+            n=n,
+            orig_outcome=outcomes[orig],
+            new_outcome=outcomes[new],
+            i_coalition=coalition,
+            base=election,
+        )
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Elimination order tree search for STV manipulation.
+
+Instead of testing every permutation of the manipulated ballot, for each coalition
+we explore the ways the STV rounds can go. A node of the tree is a round: the set of
+live alternatives, the prefix of the manipulated ballot decided so far and the
+interval of numbers of switchers `n` that lead there.
+
+- the manipulated ballot counts for its top live cell, when that cell is dead the
+  tree branches on the next cell the ballot ranks (the dead cells it never reaches
+  are placed at the end, they never count)
+- in a round every score is a line in `n`: the switchers add to the top cell of the
+  manipulated ballot what they take away from the top cell of the truthful one,
+  the other voters are fixed. So the round is decided the same way (same majority,
+  same alternatives eliminated) on the pieces of the interval between the points
+  where the lines cross, the tree branches on those pieces.
+- a branch ends when the election ends (majority or all the live alternatives tied),
+  the leaf tells the outcome for the whole interval, and the smallest `n` of the
+  interval is the minimal number of switchers to force that elimination order.
+
+Scores are scaled integers as in `compiled`, so pieces are exact.
+
+The ballots of the successful leaves are then tested with `manip.test_manipulation`,
+so the results are regular `ManipResult` records (one per distinct leaf ballot).
+"""
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Generator, List, Set, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+import STVComputations as stv
+import compiled
+import manip
+from manip import LinOrd, ManipResult, ManipulatorConfig
+
+
+@dataclass
+class Leaf:
+    "An end of the election, for `lo <= n <= hi` switchers to `ballot`"
+
+    ballot: LinOrd
+    lo: int
+    hi: int
+    outcome: Set[int]
+
+
+def _starts(lines: List[Tuple[int, int]], lo: int, hi: int) -> List[int]:
+    """First n of each piece of [lo, hi] where the order of the lines `(base, slope)`
+    (and their sign) does not change: lo, each crossing (a tie) and the n right after
+    """
+    starts = {lo}
+    pairs = [(a, b) for i, a in enumerate(lines) for b in lines[i + 1 :]]
+    for (b0, s0), (b1, s1) in pairs + [(l, (0, 0)) for l in lines]:
+        if s0 == s1:
+            continue
+        q, r = divmod(b1 - b0, s0 - s1)
+        starts.update([q, q + 1] if r == 0 else [q + 1])
+    return sorted(n for n in starts if lo <= n <= hi)
+
+
+class EliminationTree:
+    """The elimination tree of the i_th coalition switching to a permutation of `cells`"""
+
+    def __init__(self, conf: ManipulatorConfig, i_coalition: int, cells: LinOrd):
+        self.conf = conf
+        self.coalition = conf.trueballs[i_coalition]
+        self.cells = cells
+
+        self.ce = conf.election or compiled.CompiledElection.from_profiles(
+            conf.trueballs
+        )
+        self.col = {a: j for j, a in enumerate(self.ce.alts.tolist())}
+        # the votes of everybody but the coalition
+        self.others_counts = self.ce.counts.copy()
+        self.others_counts[i_coalition] = 0
+        self._others: Dict[FrozenSet[int], Tuple[List[int], int]] = {}
+
+    def others(self, live: FrozenSet[int]) -> Tuple[List[int], int]:
+        "Scaled scores and non exhausted votes of the other voters, by live set"
+        if live not in self._others:
+            mask = np.zeros(self.ce.n_alts, dtype=bool)
+            mask[[self.col[a] for a in live]] = True
+            scores, tot = compiled.batch_scores(
+                self.ce, self.others_counts[None, :], mask[None, :]
+            )
+            self._others[live] = (scores[0].tolist(), int(tot[0]))
+        return self._others[live]
+
+    def leaves(self) -> Generator[Leaf, None, None]:
+        alts = stv.all_alts(self.conf.trueballs) | set(
+            a for cell in self.cells for a in cell
+        )
+        yield from self._visit(
+            frozenset(alts), [], list(self.cells), 1, self.coalition.count
+        )
+
+    def _visit(
+        self, live: FrozenSet[int], prefix: LinOrd, unplaced: LinOrd, lo: int, hi: int
+    ) -> Generator[Leaf, None, None]:
+        top = [a for a in prefix[-1] if a in live] if prefix else []
+        if not top:
+            # branch on the next cell of the manipulated ballot
+            choices = [i for i, c in enumerate(unplaced) if any(a in live for a in c)]
+            for i in choices:
+                yield from self._visit(
+                    live,
+                    prefix + [unplaced[i]],
+                    unplaced[:i] + unplaced[i + 1 :],
+                    lo,
+                    hi,
+                )
+            if choices:
+                return
+
+        scale, c = self.ce.scale, self.coalition.count
+        rem_top = stv.live_top_cell(self.coalition, live)
+        others, others_tot = self.others(live)
+
+        # score lines (base, slope) in n of the live alternatives
+        order = sorted(live)
+        lines = []
+        for a in order:
+            r = scale // len(rem_top) if a in rem_top else 0
+            m = scale // len(top) if a in top else 0
+            lines.append((others[self.col[a]] + c * r, m - r))
+
+        # majority lines: 2 * score - (tot + 2) * scale, >= 0 for a majority
+        tot_base = others_tot + c * bool(rem_top)
+        tot_slope = bool(top) - bool(rem_top)
+        maj = [
+            (2 * b - (tot_base + 2) * scale, 2 * s - tot_slope * scale)
+            for b, s in lines
+        ]
+
+        def decide(n: int):
+            "the majority, else the eliminated alternatives, at n"
+            m = frozenset(a for a, (b, s) in zip(order, maj) if b + n * s >= 0)
+            if m:
+                return True, m
+            scores = [b + n * s for b, s in lines]
+            low = min(scores)
+            return False, frozenset(a for a, v in zip(order, scores) if v == low)
+
+        starts = sorted(set(_starts(lines, lo, hi)) | set(_starts(maj, lo, hi)))
+        pieces: List[Tuple[int, int, Tuple[bool, FrozenSet[int]]]] = []
+        for start, end in zip(starts, starts[1:] + [hi + 1]):
+            d = decide(start)
+            if pieces and pieces[-1][2] == d:
+                pieces[-1] = (pieces[-1][0], end - 1, d)
+            else:
+                pieces.append((start, end - 1, d))
+
+        for p_lo, p_hi, (is_maj, alts) in pieces:
+            if is_maj or alts == live:
+                yield Leaf(prefix + unplaced, p_lo, p_hi, set(alts))
+            else:
+                yield from self._visit(live - alts, prefix, unplaced, p_lo, p_hi)
+
+
+def manip_cells(conf: ManipulatorConfig, i_coalition: int) -> LinOrd:
+    "The cells permuted by the manip generator of the config"
+    if conf.manip_gen in [manip.all_permut_manip_gen, manip.class_all_permut_manip_gen]:
+        return [[x] for x in stv.all_alts(conf.trueballs)]
+    return conf.trueballs[i_coalition].ballot
+
+
+def coalition_manipulations(
+    conf: ManipulatorConfig, i_coalition: int
+) -> Generator[ManipResult, None, None]:
+    "The manipulations of the i_th coalition found by the elimination tree"
+    coalition = conf.trueballs[i_coalition]
+    tree = EliminationTree(conf, i_coalition, manip_cells(conf, i_coalition))
+
+    tested = set()
+    for leaf in tree.leaves():
+        compar = conf.comparator(
+            coalition, conf.true_outcome, leaf.outcome, conf.all_alts
+        )
+        key = stv.ballot_key(leaf.ballot)
+        if compar > 0 and key not in tested:
+            tested.add(key)
+            yield from manip.test_manipulation(conf, i_coalition, leaf.ballot)
+
+
+def search_manips(conf: ManipulatorConfig, disable_progess=False):
+    """Same as `manip.search_manips` for STV, with the elimination tree search
+    instead of the manip generator: one result (or all with `minimal_n_stop`
+    off) for each distinct ballot of the successful leaves, up to `max_results`.
+    NOTE: runs on a single process, falls back to `manip.search_manips` when the
+    scaled scores overflow int64 (see `compiled`)
+    """
+    if conf.scf not in [stv.stv, stv.stv_incremental]:
+        raise ValueError(f"The elimination tree only solves STV, not {conf.scf}")
+    ce = conf.election or compiled.CompiledElection.from_profiles(conf.trueballs)
+    if not ce.fits_int64:
+        yield from manip.search_manips(conf, disable_progess=disable_progess)
+        return
+    # the leaves are tested, not the candidates of a generator
+    conf.metrics.counts_candidates = False
+
+    found = 0
+    for i_prof in tqdm(
+        range(len(conf.trueballs)),
+        desc="outer (coalition)",
+        total=len(conf.trueballs),
+        disable=disable_progess,
+    ):
+        if conf.branch_prune and conf.branch_prune(conf, i_prof):
+            conf.metrics.coalitions_pruned += 1
+            continue
+        for result in coalition_manipulations(conf, i_prof):
+            yield result
+            found += 1
+            if found == conf.max_results:
+                return
+
+
+if __name__ == "__main__":
+    from timeit import default_timer as timer
+
+    # compare with the brute force search, NOTE: city-council ballots rank up to
+    # 11 alternatives, too many permutations to brute force
+    runs = [
+        ("./data/mayor.txt", manip.permut_manip_gen, True),
+        ("./data/mayor.txt", manip.all_permut_manip_gen, True),
+        ("./data/city-council.txt", manip.permut_manip_gen, False),
+    ]
+    for path, gen, brute in runs:
+        votes = stv.extract_data(path)
+        conf = ManipulatorConfig(
+            trueballs=votes,
+            scf=stv.stv,
+            comparator=manip.optimistic_comparator,
+            manip_gen=gen,
+        )
+        searches = [("tree", search_manips)]
+        if brute:
+            searches.append(("brute", manip.search_manips))
+        for name, search in searches:
+            start = timer()
+            results = list(search(conf, disable_progess=True))
+            print(
+                f"{path} {manip.aka_or_name(gen)} {name}: "
+                f"{timer() - start:.2f}s, {len(results)} results"
+            )
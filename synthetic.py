@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Synthetic elections, to study how the scfs and the search scale.
+
+The models draw the votes as an (n_voters, n_alts) array of strict orders of the
+alternatives 1..n_alts (best first), all the voters at once with numpy:
+
+- `impartial_culture`: uniform over all the orders
+- `mallows`: orders close to a reference one, by the repeated insertion model
+- `urn`: Pólya–Eggenberger urn, voters copying earlier voters
+- `single_peaked`: uniform over the orders single peaked on an axis
+
+`to_profiles` then truncates the orders and ties adjacent alternatives at random and
+merges them into a List[Profile], `generate` does both, and `write_preflib` saves an
+election as a PrefLib toi/soi file that `stv.extract_data` reads back.
+"""
+import gc
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+import STVComputations as stv
+from STVComputations import Profile
+
+# a seed or a generator, see np.random.default_rng
+Seed = Union[None, int, np.random.Generator]
+
+
+def impartial_culture(n_voters: int, n_alts: int, seed: Seed = None) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.random((n_voters, n_alts)).argsort(axis=1) + 1
+
+
+def mallows(
+    n_voters: int,
+    n_alts: int,
+    phi: float = 0.5,
+    reference: Optional[Sequence[int]] = None,
+    seed: Seed = None,
+) -> np.ndarray:
+    """Orders at Kendall tau distance d from `reference` (1..n_alts by default) with
+    probability proportional to `phi`^d: 0 only draws the reference, 1 is the
+    impartial culture.
+
+    The i_th alternative of the reference is inserted at position j <= i with
+    probability proportional to phi^(i - j) (repeated insertion model), for all the
+    voters at once.
+    """
+    rng = np.random.default_rng(seed)
+    ref = np.arange(1, n_alts + 1) if reference is None else np.asarray(reference)
+    cols = np.arange(n_alts)
+    orders = np.zeros((n_voters, n_alts), dtype=np.int64)
+    for i in range(n_alts):
+        weights = float(phi) ** (i - np.arange(i + 1))
+        pos = rng.choice(i + 1, size=n_voters, p=weights / weights.sum())[:, None]
+        # the positions from `pos` on move one step down
+        shifted = np.roll(orders, 1, axis=1)
+        orders = np.where(cols < pos, orders, np.where(cols == pos, i, shifted))
+    return ref[orders]
+
+
+def urn(
+    n_voters: int, n_alts: int, alpha: float = 0.1, seed: Seed = None
+) -> np.ndarray:
+    """The urn starts with one copy of each order, and every drawn order is put
+    back with `alpha` * n_alts! more copies: 0 is the impartial culture, the
+    greater `alpha` the more voters share the same orders.
+
+    So the t_th voter draws a new order with probability 1 / (1 + t * alpha), else
+    the order of one of the t voters before, all drawn at once and then the copies
+    are followed back to the voters who drew a new order.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_voters)
+    new = rng.random(n_voters) * (1 + alpha * t) < 1
+    src = np.where(new, t, (rng.random(n_voters) * t).astype(np.int64))
+    # pointer jumping: O(log n_voters) rounds
+    while True:
+        nxt = src[src]
+        if np.array_equal(nxt, src):
+            break
+        src = nxt
+    fresh = impartial_culture(int(new.sum()), n_alts, rng)
+    return fresh[(np.cumsum(new) - 1)[src]]
+
+
+def single_peaked(
+    n_voters: int,
+    n_alts: int,
+    axis: Optional[Sequence[int]] = None,
+    seed: Seed = None,
+) -> np.ndarray:
+    """Uniform over the orders single peaked on `axis` (1..n_alts by default):
+    from the worst position up, each takes the leftmost or the rightmost alternative
+    left on the axis with probability 1/2, the last one left is the peak (Walsh)
+    """
+    rng = np.random.default_rng(seed)
+    axis = np.arange(1, n_alts + 1) if axis is None else np.asarray(axis)
+    left = np.zeros(n_voters, dtype=np.int64)
+    right = np.full(n_voters, n_alts - 1, dtype=np.int64)
+    orders = np.empty((n_voters, n_alts), dtype=np.int64)
+    go_left = rng.random((n_voters, n_alts)) < 0.5
+    for k in range(n_alts - 1, 0, -1):
+        orders[:, k] = np.where(go_left[:, k], left, right)
+        left += go_left[:, k]
+        right -= ~go_left[:, k]
+    orders[:, 0] = left
+    return axis[orders]
+
+
+MODELS: Dict[str, Callable[..., np.ndarray]] = {
+    "ic": impartial_culture,
+    "mallows": mallows,
+    "urn": urn,
+    "sp": single_peaked,
+}
+
+
+def to_profiles(
+    orders: np.ndarray,
+    truncation: float = 0.0,
+    tie_rate: float = 0.0,
+    seed: Seed = None,
+) -> List[Profile]:
+    """The (merged) List[Profile] of the orders, most common ballots first.
+
+    With `truncation` that fraction of the voters only rank their first 1 to
+    n_alts - 1 alternatives (uniformly), with `tie_rate` each ranked alternative
+    is tied with the one before with that probability.
+    """
+    rng = np.random.default_rng(seed)
+    n_voters, n_alts = orders.shape
+    lengths = np.full(n_voters, n_alts)
+    if truncation and n_alts > 1:
+        cut = rng.random(n_voters) < truncation
+        lengths[cut] = rng.integers(1, n_alts, size=int(cut.sum()))
+    ranked = np.arange(n_alts) < lengths[:, None]
+
+    # tied with the alternative before
+    tied = np.zeros((n_voters, n_alts), dtype=bool)
+    if tie_rate:
+        tied[:, 1:] = rng.random((n_voters, n_alts - 1)) < tie_rate
+    cells = np.cumsum(~tied, axis=1) - 1
+    # the unranked alternatives go in a last cell, dropped below
+    cells = np.where(ranked, cells, n_alts)
+
+    # the ballot as the cell of each alternative, the same for equal ballots
+    cell_of = np.empty_like(cells)
+    np.put_along_axis(cell_of, orders - 1, cells, axis=1)
+    cell_of, counts = _unique_rows(cell_of, n_alts + 1)
+    order = np.argsort(-counts, kind="stable")
+    cell_of, counts = cell_of[order], counts[order]
+    # the alternatives by cell (then by number)
+    alts = np.argsort(cell_of, axis=1, kind="stable")
+    cells = np.take_along_axis(cell_of, alts, 1)
+    alts += 1
+
+    n_ranked = (cells < n_alts).sum(axis=1)
+    # no ties: one alternative per cell, the common case built faster
+    strict = np.all((cells == np.arange(n_alts)) | (cells == n_alts), axis=1)
+
+    # the cyclic gc would run over and over on the millions of new lists
+    gc.disable()
+    try:
+        return _build_profiles(alts, cells, n_ranked, strict, counts)
+    finally:
+        gc.enable()
+
+
+def _build_profiles(alts, cells, n_ranked, strict, counts) -> List[Profile]:
+    votes = []
+    rows = zip(alts.tolist(), cells.tolist(), n_ranked.tolist(), strict.tolist())
+    for (row_alts, row_cells, k, is_strict), count in zip(rows, counts.tolist()):
+        if is_strict:
+            votes.append(Profile([[a] for a in row_alts[:k]], count))
+            continue
+        ballot: List[List[int]] = []
+        for a, c in zip(row_alts[:k], row_cells):
+            if c < len(ballot):
+                ballot[c].append(a)
+            else:
+                ballot.append([a])
+        votes.append(Profile(ballot, count))
+    return votes
+
+
+def _unique_rows(rows: np.ndarray, base: int):
+    "The distinct rows of values in [0, base) with their counts"
+    n_cols = rows.shape[1]
+    if base**n_cols >= 2**63:
+        return np.unique(rows, axis=0, return_counts=True)
+    # one int64 key per row, much faster than comparing the rows
+    powers = base ** np.arange(n_cols, dtype=np.int64)
+    keys, counts = np.unique(rows @ powers, return_counts=True)
+    return (keys[:, None] // powers) % base, counts
+
+
+def generate(
+    model: str,
+    n_voters: int,
+    n_alts: int,
+    truncation: float = 0.0,
+    tie_rate: float = 0.0,
+    seed: Seed = None,
+    **params,
+) -> List[Profile]:
+    """An election of the given model (see `MODELS`), `params` go to the model
+    (e.g. phi= for mallows), see `to_profiles` for `truncation` and `tie_rate`
+    """
+    rng = np.random.default_rng(seed)
+    orders = MODELS[model](n_voters, n_alts, seed=rng, **params)
+    return to_profiles(orders, truncation, tie_rate, rng)
+
+
+def format_ballot(ballot: List[List[int]]) -> str:
+    "[[1], [2, 3], [4]] -> '1,{2,3},4', inverse of `stv.format_ballot`"
+    return ",".join(
+        str(cell[0]) if len(cell) == 1 else "{" + ",".join(map(str, cell)) + "}"
+        for cell in ballot
+    )
+
+
+def write_preflib(path: str, votes: List[Profile], title: Optional[str] = None):
+    "Write the election as a PrefLib file, with its metadata header"
+    alts = sorted(stv.all_alts(votes))
+    strict = all(len(cell) == 1 for p in votes for cell in p.ballot)
+    complete = all(sum(map(len, p.ballot)) == len(alts) for p in votes)
+    data_type = ("so" if strict else "to") + ("c" if complete else "i")
+    name = os.path.basename(path)
+    meta = {
+        "FILE NAME": name,
+        "TITLE": title or os.path.splitext(name)[0],
+        "DATA TYPE": data_type,
+        "NUMBER ALTERNATIVES": len(alts),
+        **{f"ALTERNATIVE NAME {a}": f"Alternative {a}" for a in alts},
+        "NUMBER VOTERS": stv.tot_votes(votes),
+        "NUMBER UNIQUE ORDERS": len(votes),
+    }
+    with open(path, "w") as f:
+        for key, value in meta.items():
+            f.write(f"# {key}: {value}\n")
+        for p in votes:
+            f.write(f"{p.count}: {format_ballot(p.ballot)}\n")
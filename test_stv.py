@@ -1,10 +1,37 @@
 from collections import OrderedDict
+from copy import deepcopy
+import catalog
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
 from typing import List, TypedDict
+import numpy as np
 import STVComputations as stv
 from STVComputations import Profile, stv_computations
 import manip
+import compiled
+import datacache
+import stvtree
+import synthetic
+import checkpoint
+import itertools as itt
+from datetime import datetime
+from export import (
+    ExecInfo,
+    ResultsExporter,
+    load_index,
+    load_result,
+    load_results,
+)
+import resultstore
+import workers
+from benchmarks import suite
 
 import unittest
+from unittest import mock
 
 
 class TestBallotFormat(unittest.TestCase):
@@ -23,6 +50,10 @@ class TestBallotFormat(unittest.TestCase):
             "{1,2},3,4,5",
             [[1, 2], [3], [4], [5]],
         ),
+        "tied_mid_spaces": (
+            " 1, {2, 3} ,4\n",
+            [[1], [2, 3], [4]],
+        ),
     }
 
     def test_format(self):
@@ -49,6 +80,134 @@ class TestProfileParsing(unittest.TestCase):
             self.assertEqual(p, expected)
 
 
+class TestStreamingParser(unittest.TestCase):
+
+    content = """\
+# FILE NAME: test.toi
+# NUMBER ALTERNATIVES: 3
+
+3: 1,2,3
+2: {1,2},3
+
+1: 3
+4: 2,{1,3}
+"""
+
+    expected = [
+        Profile([[1], [2], [3]], 3),
+        Profile([[1, 2], [3]], 2),
+        Profile([[3]], 1),
+        Profile([[2], [1, 3]], 4),
+    ]
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".toi")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_metadata(self):
+        meta = stv.read_metadata(self.path)
+        self.assertEqual(meta["NUMBER ALTERNATIVES"], "3")
+        self.assertEqual(meta["FILE NAME"], "test.toi")
+
+    def test_batches(self):
+        batches = list(stv.iter_profiles(self.path, batch_size=3))
+        self.assertEqual([len(b) for b in batches], [3, 1])
+        self.assertEqual(batches[0] + batches[1], self.expected)
+
+    def test_chunks(self):
+        # every possible split point must give back the same profiles
+        for start in range(len(self.content) + 1):
+            votes = stv._parse_chunk((self.path, 0, start, False))
+            votes += stv._parse_chunk((self.path, start, len(self.content), False))
+            self.assertEqual(votes, self.expected)
+
+    def test_parallel(self):
+        self.assertEqual(stv.extract_data(self.path, merge=False), self.expected)
+        # the files are smaller than a chunk, split them anyway to run the pool
+        with mock.patch.object(stv, "MIN_CHUNK_BYTES", 16):
+            self.assertEqual(
+                stv.extract_data(self.path, merge=False, procs=3), self.expected
+            )
+            self.assertEqual(
+                stv.extract_data("./data/city-council.txt", procs=2),
+                stv.extract_data("./data/city-council.txt"),
+            )
+
+
+class TestDataCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "mayor.txt")
+        shutil.copy("./data/mayor.txt", self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        votes = stv.extract_data(self.path)
+        sidecar = datacache.sidecar_path(self.path)
+        self.assertFalse(os.path.exists(sidecar))
+
+        # first load writes the sidecar, second load reads it
+        self.assertEqual(stv.extract_data(self.path, cache=True), votes)
+        self.assertTrue(os.path.exists(sidecar))
+        self.assertEqual(stv.extract_data(self.path, cache=True), votes)
+
+        ce = datacache.load_compiled(self.path)
+        self.assertSetEqual(compiled.stv(ce), stv.stv(votes))
+
+    def test_large_values(self):
+        # counts past int32 and a tie of 23 alternatives, scale 5354228880
+        votes = [
+            Profile([[1]], 3 * 10**9),
+            Profile([[2]], 2 * 10**9),
+            Profile([list(range(3, 26))], 1),
+        ]
+        ce = compiled.CompiledElection.from_profiles(votes)
+        back = datacache.decode(datacache.encode(ce))
+        self.assertEqual(back.scale, ce.scale)
+        self.assertListEqual(back.counts.tolist(), [3 * 10**9, 2 * 10**9, 1])
+        self.assertEqual(back.to_profiles(), votes)
+
+    def test_content_key(self):
+        before = datacache.sidecar_path(self.path)
+        with open(self.path, "a") as f:
+            f.write("\n1: 5,4\n")
+        self.assertNotEqual(datacache.sidecar_path(self.path), before)
+        self.assertEqual(
+            stv.extract_data(self.path, cache=True), stv.extract_data(self.path)
+        )
+
+
+class TestMergeProfiles(unittest.TestCase):
+    def test_merge(self):
+        ps = [
+            Profile([[1], [3, 2]], 2),
+            Profile([[2], [1]], 1),
+            Profile([[1], [2, 3]], 3),
+        ]
+        merged = stv.merge_profiles(ps)
+        self.assertEqual(
+            merged,
+            [Profile([[1], [2, 3]], 5), Profile([[2], [1]], 1)],
+        )
+        # the input profiles are untouched
+        self.assertEqual(ps[0], Profile([[1], [3, 2]], 2))
+
+    def test_extract_merged(self):
+        for f in ["./data/city-council.txt", "./data/mayor.txt"]:
+            lines = stv.extract_data(f, merge=False)
+            merged = stv.extract_data(f)
+            self.assertEqual(stv.tot_votes(lines), stv.tot_votes(merged))
+            self.assertEqual(
+                len(set(stv.ballot_key(p.ballot) for p in merged)), len(merged)
+            )
+
+
 class TestPluralityRounds(unittest.TestCase):
 
     cases = {
@@ -164,20 +323,82 @@ class TestSTVCompute(unittest.TestCase):
             ],
             "out": {2},
         },
+        "three_way_tie": {
+            "in": [
+                Profile([[2, 3], [1]], 4),
+                Profile([[2]], 4),
+                Profile([[1], [3]], 3),
+                Profile([[1], [3], [2]], 2),
+                Profile([[2, 1, 3]], 1),  # 1/3 to each, 3 and 1 tie exactly at 8
+                Profile([[1], [2], [3]], 1),
+                Profile([[2], [1], [3]], 1),
+                Profile([[3], [2]], 4),
+            ],
+            "out": {2},
+        },
     }
 
     def test_stv(self):
         for name, spec in self.cases.items():
             inp = spec["in"]
             expected = spec["out"]
+            before = deepcopy(inp)
             res = stv.stv(inp)
             self.assertSetEqual(res, expected)
 
+            # stv must leave the given profiles untouched
+            self.assertEqual(inp, before)
+
+            # check consistency with the incremental implem
+            self.assertSetEqual(stv.stv_incremental(inp), expected)
+
             # check consistency with prev implem
             p_res = stv.stv_computations(inp, len(stv.all_alts(inp)), printing=False)
 
             self.assertSetEqual(set(p_res), expected)
 
+    def test_incremental_ties(self):
+        # tie cells of 3 or more alternatives split the votes in thirds
+        for seed in range(10):
+            votes = synthetic.generate(
+                "ic", 40, 5, truncation=0.3, tie_rate=0.5, seed=seed
+            )
+            for break_on_majority in [True, False]:
+                self.assertSetEqual(
+                    stv.stv_incremental(votes, break_on_majority=break_on_majority),
+                    stv.stv(votes, break_on_majority=break_on_majority),
+                )
+
+
+class TestBallotClasses(unittest.TestCase):
+    def test_stv_classes(self):
+        # 1 then 2 are eliminated first whatever 2 more voters do
+        others = [
+            Profile([[1]], 1),
+            Profile([[2]], 5),
+            Profile([[3]], 20),
+            Profile([[4]], 21),
+        ]
+        self.assertEqual(stv.forced_eliminations(others, 2, {1, 2, 3, 4}), [1, 2])
+        # the 3 prefixes of the forced cells, times the orderings of the free ones
+        classes = list(stv.stv_ballot_classes(others, 2, [[2], [4], [1], [3]]))
+        self.assertEqual(len(classes), 3 * 2)
+        self.assertEqual(
+            classes,
+            [
+                [[4], [3], [2], [1]],
+                [[3], [4], [2], [1]],
+                [[1], [4], [3], [2]],
+                [[1], [3], [4], [2]],
+                [[1], [2], [4], [3]],
+                [[1], [2], [3], [4]],
+            ],
+        )
+        # only forced cells: one ordering
+        self.assertEqual(
+            list(stv.stv_ballot_classes(others, 2, [[2], [1]])), [[[1], [2]]]
+        )
+
 
 class TestSTVFromFile(unittest.TestCase):
     cases = {
@@ -198,6 +419,12 @@ class TestSTVFromFile(unittest.TestCase):
 
             self.assertSetEqual(res, spec["expected"])
 
+            self.assertSetEqual(stv.stv_incremental(votes), spec["expected"])
+            self.assertSetEqual(
+                stv.stv_incremental(votes, break_on_majority=False),
+                stv.stv(votes, break_on_majority=False),
+            )
+
             # check consistency with prev implem
 
             p_res = stv.stv_computations(
@@ -207,6 +434,80 @@ class TestSTVFromFile(unittest.TestCase):
             self.assertSetEqual(set(p_res), spec["expected"])
 
 
+class TestCompiledElection(unittest.TestCase):
+    """The compiled SCFs must agree with the List[Profile] ones"""
+
+    # NOTE: copied as stv_computations consumes the TestSTVCompute cases
+    profiles = [deepcopy(spec["in"]) for spec in TestSTVCompute.cases.values()] + [
+        [Profile([[1, 2, 3]], 1), Profile([[3], [1]], 1)],
+        [Profile([[1], [2, 3]], 2), Profile([[2], [3]], 1), Profile([[3]], 2)],
+    ]
+    # tie cells of 3 or more alternatives: 1/3 vote shares
+    profiles += [
+        synthetic.generate("ic", 60, 5, truncation=0.3, tie_rate=0.5, seed=seed)
+        for seed in range(5)
+    ]
+
+    files = ["./data/city-council.txt", "./data/mayor.txt", "./data/pliny.txt"]
+
+    def test_roundtrip(self):
+        for votes in self.profiles:
+            ce = compiled.CompiledElection.from_profiles(votes)
+            # NOTE: tied alternatives come back sorted
+            expected = [
+                Profile([sorted(cell) for cell in p.ballot], p.count) for p in votes
+            ]
+            self.assertEqual(ce.to_profiles(), expected)
+
+    def test_scfs(self):
+        for votes in self.profiles + [stv.extract_data(f) for f in self.files]:
+            ce = compiled.CompiledElection.from_profiles(votes)
+            self.assertSetEqual(compiled.plurality(ce), stv.plurality(votes))
+            self.assertSetEqual(compiled.stv(ce), stv.stv(votes))
+            self.assertSetEqual(
+                compiled.stv(ce, break_on_majority=False),
+                stv.stv(votes, break_on_majority=False),
+            )
+
+    def test_batch(self):
+        votes = stv.extract_data("./data/pliny.txt")
+        ce = compiled.CompiledElection.from_profiles(votes)
+        # every size of the c,b,a -> b,c,a coalition, to a new ballot
+        cand = [[2], [3], [1]]
+        ce_m = compiled.append_ballot(ce, cand)
+        ns = range(1, votes[2].count + 1)
+        counts = compiled.move_voters(ce_m, 2, ce_m.n_ballots - 1, ns)
+        for scf, batch in compiled.BATCHED.items():
+            expected = []
+            for n in ns:
+                left = votes[2].count - n
+                stayed = [Profile(votes[2].ballot, left)] if left else []
+                expected.append(scf(votes[:2] + stayed + [Profile(cand, n)]))
+            self.assertListEqual(batch(ce_m, counts), expected)
+
+    def test_overflow(self):
+        # a tie of 23 alternatives: scale lcm(1..23) = 5354228880
+        votes = [Profile([list(range(1, 24))], 10**9), Profile([[1], [2]], 3)]
+        self.assertFalse(compiled.CompiledElection.from_profiles(votes).fits_int64)
+        self.assertTrue(compiled.CompiledElection.from_profiles(votes[1:]).fits_int64)
+
+        for scf in compiled.BATCHED:
+            conf = manip.ManipulatorConfig(
+                trueballs=votes,
+                scf=scf,
+                comparator=manip.optimistic_comparator,
+                manip_gen=manip.permut_manip_gen,
+            )
+            # the List[Profile] scf is used instead
+            self.assertIsNone(conf.election)
+            self.assertIsNone(manip.PluralityTally.of(conf))
+            cand = [[2], [1]]
+            self.assertListEqual(
+                manip.manip_outcomes(conf, 1, cand, [1, 2, 3]),
+                [scf(manip.manipulated_votes(conf, 1, cand, n)) for n in [1, 2, 3]],
+            )
+
+
 ## ---- Tests for the manip module ---
 
 
@@ -418,6 +719,386 @@ class TestPlinyManipulation(unittest.TestCase):
         )
 
 
+class TestManipulatedVotes(unittest.TestCase):
+    orig_votes: List[Profile] = [
+        Profile([[1], [2], [3]], 102),
+        Profile([[2], [1], [3]], 101),
+        Profile([[3], [2], [1]], 100),
+    ]
+
+    def test_merged_into_truthful(self):
+        config = manip.ManipulatorConfig(
+            trueballs=self.orig_votes,
+            scf=stv.plurality,
+            comparator=manip.pessimistic_comparator,
+            manip_gen=manip.permut_manip_gen,
+        )
+        # switchers join the identical truthful ballot
+        self.assertEqual(
+            manip.manipulated_votes(config, 2, [[2], [1], [3]], 2),
+            [
+                Profile([[1], [2], [3]], 102),
+                Profile([[2], [1], [3]], 103),
+                Profile([[3], [2], [1]], 98),
+            ],
+        )
+        # new ballots are appended, coalition dropped when all switch
+        self.assertEqual(
+            manip.manipulated_votes(config, 2, [[2], [3], [1]], 100),
+            [
+                Profile([[1], [2], [3]], 102),
+                Profile([[2], [1], [3]], 101),
+                Profile([[2], [3], [1]], 100),
+            ],
+        )
+        # truthful ballots are untouched
+        self.assertEqual(config.trueballs[1], Profile([[2], [1], [3]], 101))
+
+    def test_view(self):
+        config = manip.ManipulatorConfig(
+            trueballs=self.orig_votes,
+            scf=stv.plurality,
+            comparator=manip.pessimistic_comparator,
+            manip_gen=manip.permut_manip_gen,
+        )
+        cases = [
+            (0, [[2], [1], [3]], 5),
+            (0, [[1], [2], [3]], 5),
+            (1, [[1], [2], [3]], 101),
+            (1, [[3], [1], [2]], 101),
+            (2, [[3], [1], [2]], 50),
+        ]
+        for i, cand, n in cases:
+            view = manip.ManipulatedVotes(config, i, cand, n)
+            votes = list(view)
+            self.assertEqual(len(view), len(votes))
+            self.assertEqual([view[j] for j in range(len(view))], votes)
+            self.assertEqual(view[-1], votes[-1])
+            self.assertEqual(stv.stv(view), stv.stv(votes))
+
+    def test_lazy_new_votes(self):
+        config = manip.ManipulatorConfig(
+            trueballs=self.orig_votes,
+            scf=stv.plurality,
+            comparator=manip.pessimistic_comparator,
+            manip_gen=manip.permut_manip_gen,
+            closed_form=False,
+        )
+        result = next(manip.search_manips(config, disable_progess=True))
+        self.assertEqual(
+            result.new_votes,
+            manip.manipulated_votes(
+                config, result.i_coalition, result.to_ord, result.n
+            ),
+        )
+        # the truthful election is not pickled with the result
+        copy = pickle.loads(pickle.dumps(result))
+        self.assertIsNone(copy.base)
+        self.assertEqual(copy, result)
+        with self.assertRaisesRegex(ValueError, "base election"):
+            copy.new_votes
+        copy.base = config
+        self.assertEqual(copy.new_votes, result.new_votes)
+
+        # results pickled by older versions hold their new_votes
+        old = manip.ManipResult(
+            result.from_ord,
+            result.to_ord,
+            result.n,
+            result.orig_outcome,
+            result.new_outcome,
+        )
+        del old.__dict__["i_coalition"], old.__dict__["base"]
+        old.__dict__["new_votes"] = result.new_votes
+        old = pickle.loads(pickle.dumps(old))
+        self.assertEqual(old.new_votes, result.new_votes)
+        self.assertEqual(old.i_coalition, -1)
+
+    def test_batched_search(self):
+        # the batched scfs find the same manipulations of the per-election ones
+        for scf in [stv.plurality, stv.stv]:
+            results = [
+                list(
+                    manip.search_manips(
+                        manip.ManipulatorConfig(
+                            trueballs=self.orig_votes,
+                            scf=scf,
+                            comparator=manip.optimistic_comparator,
+                            manip_gen=manip.permut_manip_gen,
+                            minimal_n_stop=False,
+                            batched=batched,
+                        ),
+                        disable_progess=True,
+                    )
+                )
+                for batched in [True, False]
+            ]
+            self.assertEqual(results[0], results[1])
+
+    def test_three_way_ties(self):
+        # 1/3 vote shares: the exact scores of the List[Profile] scfs agree with the
+        # compiled ones, so the batched search finds the same manipulations
+        votes = [
+            Profile([[2, 3], [1]], 4),
+            Profile([[2]], 4),
+            Profile([[1], [3]], 3),
+            Profile([[1], [3], [2]], 2),
+            Profile([[2, 1, 3]], 1),
+            Profile([[1], [2], [3]], 1),
+            Profile([[2], [1], [3]], 1),
+            Profile([[3], [2]], 4),
+        ]
+        for gen in [manip.permut_manip_gen, manip.all_permut_manip_gen]:
+            confs = [
+                manip.ManipulatorConfig(
+                    trueballs=votes,
+                    scf=stv.stv,
+                    comparator=manip.optimistic_comparator,
+                    manip_gen=gen,
+                    batched=batched,
+                )
+                for batched in [True, False]
+            ]
+            self.assertIsNotNone(confs[0].election)
+            self.assertIsNone(confs[1].election)
+            self.assertEqual(confs[0].true_outcome, {2})
+            results = [
+                list(manip.search_manips(conf, disable_progess=True)) for conf in confs
+            ]
+            self.assertEqual(results[0], results[1])
+            for r in results[0]:
+                self.assertNotEqual(r.new_outcome, r.orig_outcome)
+
+    def test_switcher_blocks(self):
+        votes = [
+            Profile([[3], [1], [2]], 180),
+            Profile([[1], [3], [2]], 170),
+            Profile([[2], [3], [1]], 160),
+            Profile([[2], [1], [3]], 140),
+        ]
+        for minimal in [True, False]:
+            conf = manip.ManipulatorConfig(
+                trueballs=votes,
+                scf=stv.stv,
+                comparator=manip.optimistic_comparator,
+                manip_gen=manip.permut_manip_gen,
+                minimal_n_stop=minimal,
+            )
+            blocks = list(manip.switcher_blocks(conf, 160))
+            self.assertEqual(sum(blocks, []), list(range(1, 161)))
+            self.assertEqual([len(b) for b in blocks], [32, 128] if minimal else [160])
+
+            results = list(manip.test_manipulation(conf, 2, [[1], [2], [3]]))
+            self.assertEqual(results[0].n, 10)
+            # only the first block is evaluated when stopping at the first success
+            self.assertEqual(conf.metrics.scf_elections, 32 if minimal else 160)
+
+    def test_bisection(self):
+        # bisection finds the same minimal manipulations of the linear scan
+        votes = self.orig_votes + [Profile([[1], [3], [2]], 7)]
+        for comp in [manip.optimistic_comparator, manip.pessimistic_comparator]:
+            results = []
+            for bisect in [True, False]:
+                conf = manip.ManipulatorConfig(
+                    trueballs=votes,
+                    scf=stv.plurality,
+                    comparator=comp,
+                    manip_gen=manip.permut_manip_gen,
+                    bisect=bisect,
+                )
+                self.assertEqual(manip.use_bisection(conf), bisect)
+                results.append(list(manip.search_manips(conf, disable_progess=True)))
+            self.assertGreater(len(results[0]), 0)
+            self.assertEqual(results[0], results[1])
+
+    def test_class_gens(self):
+        # one ballot per class finds the same (coalition, n, outcome) manipulations
+        votes = self.orig_votes + [
+            Profile([[1], [3], [2]], 7),
+            Profile([[4], [3]], 30),
+            Profile([[2], [4], [1]], 12),
+        ]
+        gens = [
+            (manip.permut_manip_gen, manip.class_permut_manip_gen),
+            (manip.all_permut_manip_gen, manip.class_all_permut_manip_gen),
+        ]
+        for scf in [stv.plurality, stv.stv]:
+            for gen, class_gen in gens:
+                found = []
+                for g in [gen, class_gen]:
+                    conf = manip.ManipulatorConfig(
+                        trueballs=votes,
+                        scf=scf,
+                        comparator=manip.pessimistic_comparator,
+                        manip_gen=g,
+                    )
+                    found.append(
+                        {
+                            (str(r.from_ord), r.n, str(sorted(r.new_outcome)))
+                            for r in manip.search_manips(conf, disable_progess=True)
+                        }
+                    )
+                self.assertGreater(len(found[0]), 0)
+                self.assertEqual(found[0], found[1])
+
+    def test_plurality_closed_form(self):
+        # the closed form solver returns the same records of the search
+        votes = self.orig_votes + [
+            Profile([[1], [3], [2]], 7),
+            Profile([[4], [3]], 30),
+            Profile([[2], [4, 1]], 12),
+        ]
+        for gen in [manip.class_permut_manip_gen, manip.class_all_permut_manip_gen]:
+            for comp in [manip.optimistic_comparator, manip.pessimistic_comparator]:
+                for stop in [True, False]:
+                    results = []
+                    for closed_form in [True, False]:
+                        conf = manip.ManipulatorConfig(
+                            trueballs=votes,
+                            scf=stv.plurality,
+                            comparator=comp,
+                            manip_gen=gen,
+                            minimal_n_stop=stop,
+                            closed_form=closed_form,
+                        )
+                        self.assertEqual(manip.use_closed_form(conf), closed_form)
+                        results.append(
+                            list(manip.search_manips(conf, disable_progess=True))
+                        )
+                    self.assertGreater(len(results[0]), 0)
+                    self.assertEqual(results[0], results[1])
+
+    def test_plurality_closed_form_ties(self):
+        # the true winners tie on 1/3 vote shares: 2 and 4 both get 4 + 1/3
+        votes = [
+            Profile([[1], [4], [2]], 3),
+            Profile([[2, 3, 4], [1]], 1),
+            Profile([[2], [1]], 4),
+            Profile([[4], [1]], 3),
+            Profile([[1, 3, 4], [2]], 3),
+        ]
+        for gen in [manip.class_permut_manip_gen, manip.class_all_permut_manip_gen]:
+            results = []
+            for closed_form in [True, False]:
+                conf = manip.ManipulatorConfig(
+                    trueballs=votes,
+                    scf=stv.plurality,
+                    comparator=manip.pessimistic_comparator,
+                    manip_gen=gen,
+                    closed_form=closed_form,
+                    batched=closed_form,
+                    bisect=False,
+                )
+                self.assertEqual(conf.true_outcome, {2, 4})
+                tally = manip.PluralityTally.of(conf)
+                top = max(tally.scores)
+                self.assertEqual(
+                    {a for a, v in zip(tally.alts, tally.scores) if v == top},
+                    conf.true_outcome,
+                )
+                results.append(list(manip.search_manips(conf, disable_progess=True)))
+            self.assertGreater(len(results[0]), 0)
+            self.assertEqual(results[0], results[1])
+
+    def test_outcome_cache(self):
+        # specs with the same scf share the cache, the second search only hits
+        cache = manip.OutcomeCache(10000)
+        confs = [
+            manip.ManipulatorConfig(
+                trueballs=self.orig_votes,
+                scf=stv.stv,
+                comparator=comp,
+                manip_gen=manip.permut_manip_gen,
+                minimal_n_stop=False,
+                batched=batched,
+                outcome_cache=cache,
+            )
+            for comp in [manip.optimistic_comparator, manip.pessimistic_comparator]
+            for batched in [True, False]
+        ]
+        for conf in confs:
+            uncached = manip.ManipulatorConfig(
+                trueballs=self.orig_votes,
+                scf=stv.stv,
+                comparator=conf.comparator,
+                manip_gen=manip.permut_manip_gen,
+                minimal_n_stop=False,
+            )
+            self.assertEqual(
+                list(manip.search_manips(conf, disable_progess=True)),
+                list(manip.search_manips(uncached, disable_progess=True)),
+            )
+        self.assertGreater(confs[0].cache_misses, 0)
+        self.assertEqual(confs[0].cache_hits, 0)
+        for conf in confs[1:]:
+            self.assertEqual(conf.cache_misses, 0)
+            self.assertGreaterEqual(conf.cache_hits, confs[0].cache_misses)
+
+    def test_outcome_cache_lru(self):
+        cache = manip.OutcomeCache(2)
+        cache.put(frozenset([1]), {1})
+        cache.put(frozenset([2]), {2})
+        self.assertEqual(cache.get(frozenset([1])), {1})
+        cache.put(frozenset([3]), {3})  # evicts the least recently used
+        self.assertIsNone(cache.get(frozenset([2])))
+        self.assertEqual(len(cache), 2)
+
+
+class TestSTVTree(unittest.TestCase):
+    votes: List[Profile] = [
+        Profile([[1], [2], [3]], 102),
+        Profile([[2], [1], [3]], 101),
+        Profile([[3], [2], [1]], 100),
+        Profile([[1], [3], [2]], 7),
+        Profile([[4], [3]], 30),
+        Profile([[2], [4, 1]], 12),
+    ]
+
+    def config(self, comp, gen):
+        return manip.ManipulatorConfig(
+            trueballs=self.votes, scf=stv.stv, comparator=comp, manip_gen=gen
+        )
+
+    def test_leaves(self):
+        # the leaves tell the stv outcome of their ballot on all their interval
+        conf = self.config(manip.optimistic_comparator, manip.all_permut_manip_gen)
+        for i in range(len(self.votes)):
+            tree = stvtree.EliminationTree(conf, i, stvtree.manip_cells(conf, i))
+            for leaf in tree.leaves():
+                for n in range(leaf.lo, leaf.hi + 1):
+                    votes = manip.manipulated_votes(conf, i, leaf.ballot, n)
+                    self.assertSetEqual(stv.stv(votes), leaf.outcome)
+
+    def test_minimal_coalitions(self):
+        # same minimal number of switchers per coalition of the brute force
+        for comp in [manip.optimistic_comparator, manip.pessimistic_comparator]:
+            for gen in [manip.permut_manip_gen, manip.all_permut_manip_gen]:
+                conf = self.config(comp, gen)
+                minimal = []
+                for search in [stvtree.search_manips, manip.search_manips]:
+                    n_min = {}
+                    for r in search(conf, disable_progess=True):
+                        k = str(r.from_ord)
+                        n_min[k] = min(n_min.get(k, r.n), r.n)
+                    minimal.append(n_min)
+                self.assertGreater(len(minimal[0]), 0)
+                self.assertEqual(minimal[0], minimal[1])
+
+    def test_metrics(self):
+        # the tree does not test candidates, their counts are left out
+        conf = self.config(manip.optimistic_comparator, manip.permut_manip_gen)
+        conf.branch_prune = TestSearchPool.prune
+        list(stvtree.search_manips(conf, disable_progess=True))
+        self.assertFalse(conf.metrics.counts_candidates)
+        self.assertGreater(conf.metrics.scf_elections, 0)
+        self.assertEqual(conf.metrics.coalitions_pruned, 1)
+        names = [line.split("\t")[0] for line in conf.metrics.summary().splitlines()]
+        self.assertNotIn("candidates", names)
+        self.assertNotIn("coalitions", names)
+        self.assertIn("scf_elections", names)
+        self.assertIn("coalitions_pruned\t=\t1", conf.metrics.summary())
+
+
 class TestPlinyManipulationParallel(unittest.TestCase):
 
     multiproc: bool = True
@@ -448,6 +1129,7 @@ class TestPlinyManipulationParallel(unittest.TestCase):
 
         # get all manips
         manips = list(manip.search_manips(config, disable_progess=True))
+        self.assertEqual(config.cache_hits + config.cache_misses, 0)
 
         # print(manips)
         # check that at least a minpulation was found
@@ -467,6 +1149,541 @@ class TestPlinyManipulationParallel(unittest.TestCase):
         )
 
 
+
+class TestSearchPool(unittest.TestCase):
+    votes: List[Profile] = [
+        Profile([[1], [2], [3]], 102),
+        Profile([[2], [1], [3]], 101),
+        Profile([[3], [2], [1]], 100),
+        Profile([[1], [3], [2]], 7),
+        Profile([[4], [3]], 30),
+        Profile([[2], [4], [1]], 12),
+    ]
+
+    def config(self, scf, gen, multiproc):
+        return manip.ManipulatorConfig(
+            trueballs=self.votes,
+            scf=scf,
+            comparator=manip.optimistic_comparator,
+            manip_gen=gen,
+            multiproc=multiproc,
+            closed_form=False,
+        )
+
+    def test_shared_pickle(self):
+        # the ballots are not pickled, they are read back from shared memory
+        conf = self.config(stv.stv, manip.permut_manip_gen, True)
+        with workers.SearchPool(processes=1) as pool:
+            conf.shared = pool.share(self.votes)
+            self.assertIs(pool.share(self.votes), conf.shared)
+            data = pickle.dumps(conf)
+            self.assertNotIn(pickle.dumps(self.votes), data)
+            copy = pickle.loads(data)
+            self.assertEqual(copy.trueballs, self.votes)
+            self.assertEqual(copy.ballot_index, conf.ballot_index)
+            np.testing.assert_array_equal(copy.election.pos, conf.election.pos)
+
+    def test_reused_pool(self):
+        # one pool for several searches finds what the serial search finds
+        specs = [
+            (stv.stv, manip.permut_manip_gen),
+            (stv.plurality, manip.all_permut_manip_gen),
+            (stv.stv, manip.all_permut_manip_gen),
+        ]
+        with workers.SearchPool(processes=2, chunksize=3) as pool:
+            for scf, gen in specs:
+                serial = self.config(scf, gen, False)
+                parallel = self.config(scf, gen, True)
+                expected = list(manip.search_manips(serial, disable_progess=True))
+                found = list(
+                    manip.search_manips(parallel, disable_progess=True, pool=pool)
+                )
+                self.assertGreater(len(found), 0)
+                self.assertEqual(found, expected)
+                self.assertEqual(
+                    [r.new_votes for r in found], [r.new_votes for r in expected]
+                )
+                self.assertIsNone(parallel.shared)
+
+    def test_exact_ballots(self):
+        # unsorted ties and unmerged ballots reach the workers as they are
+        votes = self.votes + [Profile([[3, 1], [2]], 20), Profile([[2], [1], [3]], 5)]
+        with workers.SearchPool(processes=2, chunksize=2) as pool:
+            copy = pickle.loads(pickle.dumps(pool.share(votes))).attach()
+            self.assertEqual(copy.profiles, votes)
+
+            confs = [
+                manip.ManipulatorConfig(
+                    trueballs=votes,
+                    scf=stv.stv,
+                    comparator=manip.optimistic_comparator,
+                    manip_gen=manip.permut_manip_gen,
+                    multiproc=multiproc,
+                )
+                for multiproc in [False, True]
+            ]
+            serial, parallel = [
+                list(manip.search_manips(conf, disable_progess=True, pool=pool))
+                for conf in confs
+            ]
+            self.assertGreater(len(serial), 0)
+            self.assertEqual(parallel, serial)
+
+        # counts past int32
+        big = [Profile([[1], [2]], 3 * 10**9), Profile([[2], [1]], 2 * 10**9)]
+        with workers.SearchPool(processes=1) as pool:
+            handle = pickle.loads(pickle.dumps(pool.share(big)))
+            self.assertEqual(handle.attach().profiles, big)
+            counts = handle.attach().election.counts.tolist()
+            self.assertEqual(counts, [3 * 10**9, 2 * 10**9])
+
+    def test_metrics(self):
+        # the workers count the same as the serial search
+        counts = ["candidates", "candidates_skipped", "coalitions_pruned"]
+        counts += ["scf_calls", "scf_elections"]
+        confs = [
+            self.config(stv.stv, manip.permut_manip_gen, multiproc)
+            for multiproc in [False, True]
+        ]
+        with workers.SearchPool(processes=2, chunksize=2) as pool:
+            for conf in confs:
+                conf.branch_prune = self.prune
+                list(manip.search_manips(conf, disable_progess=True, pool=pool))
+        serial, parallel = [c.metrics for c in confs]
+        for name in counts:
+            self.assertEqual(getattr(parallel, name), getattr(serial, name), name)
+        # the permutations of the ballots of the 5 coalitions not pruned, but
+        # their truthful ballot
+        self.assertEqual(serial.candidates, 4 * 6 + 2 - 5)
+        self.assertEqual(serial.candidates_skipped, 5)
+        self.assertEqual(serial.coalitions_pruned, 1)
+        self.assertEqual(sorted(serial.coalition_time), [0, 2, 3, 4, 5])
+        self.assertGreater(serial.scf_elections, serial.scf_calls)
+
+        with tempfile.TemporaryDirectory() as d:
+            info = ExecInfo(datetime.now(), datetime.now())
+            ResultsExporter(d)("toy.txt", "stv_optim_perm", confs[0], [], info)
+            metrics = load_index(d)["toy"]["stv_optim_perm"]["summary"]["metrics"]
+        self.assertEqual(metrics["candidates"], "21")
+        self.assertEqual(metrics["coalitions"], "5")
+        self.assertEqual(len(metrics["slowest_coalitions"].split()), 5)
+
+    @staticmethod
+    def prune(conf, i):
+        return i == 1
+
+    def test_flat_queue(self):
+        # the candidates of all the coalitions in one queue, results in serial order
+        serial = self.config(stv.stv, manip.all_permut_manip_gen, False)
+        serial.branch_prune = self.prune
+        expected = list(manip.search_manips(serial, disable_progess=True))
+        with workers.SearchPool(processes=2, chunksize=1) as pool:
+            self.assertEqual(pool.window, workers.WINDOW_CHUNKS * 2)
+            parallel = self.config(stv.stv, manip.all_permut_manip_gen, True)
+            parallel.branch_prune = self.prune
+            found = manip.search_manips(parallel, disable_progess=True, pool=pool)
+            self.assertEqual(
+                [(r.from_ord, r.to_ord, r.n) for r in found],
+                [(r.from_ord, r.to_ord, r.n) for r in expected],
+            )
+            # a search stopped early leaves the pool usable
+            first = manip.search_manips(parallel, disable_progess=True, pool=pool)
+            next(first)
+            first.close()
+            self.assertEqual(
+                len(list(manip.search_manips(parallel, True, pool=pool))),
+                len(expected),
+            )
+
+    def test_max_results(self):
+        # a top-k search yields the first k results of the full search
+        for multiproc in [False, True]:
+            conf = self.config(stv.stv, manip.all_permut_manip_gen, multiproc)
+            expected = list(manip.search_manips(conf, disable_progess=True))
+            self.assertGreater(len(expected), 2)
+            conf.max_results = 2
+            found = list(manip.search_manips(conf, disable_progess=True))
+            self.assertEqual(
+                [(r.from_ord, r.to_ord, r.n) for r in found],
+                [(r.from_ord, r.to_ord, r.n) for r in expected[:2]],
+            )
+            conf = self.config(stv.stv, manip.all_permut_manip_gen, multiproc)
+            first = manip.first_manipulation(conf)
+            self.assertEqual(first.to_ord, expected[0].to_ord)
+
+        # a unanimous election is not manipulable
+        conf = manip.ManipulatorConfig(
+            trueballs=[Profile([[1], [2]], 10)],
+            scf=stv.stv,
+            comparator=manip.optimistic_comparator,
+            manip_gen=manip.all_permut_manip_gen,
+        )
+        self.assertIsNone(manip.first_manipulation(conf))
+
+    def test_cancel(self):
+        # closing an imap call cancels its tasks, not the ones of the next call
+        with workers.SearchPool(processes=1) as pool:
+            calls = [pool.imap(abs, range(-100, 0)) for _ in range(2)]
+            self.assertEqual(next(calls[0]), 100)
+            calls[0].close()
+            self.assertEqual(list(calls[1]), list(range(100, 0, -1)))
+            task = workers.Cancellable(abs, pool._table.name, 0)
+            self.assertTrue(task.cancelled())
+            self.assertIsNone(task(-1))
+            self.assertTrue(workers.Cancellable(abs, pool._table.name, 1).cancelled())
+            self.assertFalse(workers.Cancellable(abs, pool._table.name, 2).cancelled())
+
+
+class TestCheckpoint(unittest.TestCase):
+    votes: List[Profile] = TestSearchPool.votes
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "spec", "checkpoint.pkl")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def config(self, multiproc=False):
+        return manip.ManipulatorConfig(
+            trueballs=self.votes,
+            scf=stv.stv,
+            comparator=manip.optimistic_comparator,
+            manip_gen=manip.all_permut_manip_gen,
+            multiproc=multiproc,
+        )
+
+    def keys(self, results):
+        return [(r.from_ord, r.to_ord, r.n) for r in results]
+
+    def test_steps(self):
+        # resuming the steps from a cursor gives the rest of the search
+        steps = list(manip.search_steps(self.config(), disable_progess=True))
+        for j in [0, 5, len(steps) // 2, len(steps) - 1]:
+            start = steps[j - 1][0] if j else (0, 0)
+            rest = manip.search_steps(self.config(), True, start=start)
+            self.assertEqual(
+                [(c, self.keys(rs)) for c, rs in rest],
+                [(c, self.keys(rs)) for c, rs in steps[j:]],
+            )
+
+    def test_resume(self):
+        expected = self.keys(manip.search_manips(self.config(), disable_progess=True))
+        self.assertGreater(len(expected), 3)
+        for multiproc in [False, True]:
+            # interrupted after 2 results, then resumed once more after 1 result
+            found = []
+            for stop in [2, 1, None]:
+                results = checkpoint.search_manips(
+                    self.config(multiproc), self.path, interval=0, resume=True
+                )
+                found.extend(self.keys(itt.islice(results, stop)))
+                results.close()
+                self.assertTrue(os.path.exists(self.path))
+            # results yielded before the interruption are yielded again on resume
+            self.assertEqual(found[:2], expected[:2])
+            self.assertEqual(found[-len(expected) :], expected)
+            os.remove(self.path)
+
+    def test_other_search(self):
+        results = checkpoint.search_manips(self.config(), self.path, interval=0)
+        next(results)
+        results.close()
+        conf = self.config()
+        self.assertIsNotNone(checkpoint.load(self.path, conf))
+        conf.minimal_n_stop = False
+        self.assertIsNone(checkpoint.load(self.path, conf))
+        # without resume the checkpoint is not read
+        self.assertEqual(
+            self.keys(checkpoint.search_manips(self.config(), self.path)),
+            self.keys(manip.search_manips(self.config(), disable_progess=True)),
+        )
+
+    def test_loaded(self):
+        # a checkpoint loaded by the caller is resumed as the one at the path
+        results = checkpoint.search_manips(self.config(), self.path, interval=0)
+        next(results)
+        results.close()
+        ckpt = checkpoint.load(self.path, self.config())
+        os.remove(self.path)
+        self.assertEqual(
+            self.keys(checkpoint.search_manips(self.config(), self.path, ckpt=ckpt)),
+            self.keys(manip.search_manips(self.config(), disable_progess=True)),
+        )
+
+
+class TestResultsSink(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.exporter = ResultsExporter(self.dir)
+        self.conf = manip.ManipulatorConfig(
+            trueballs=TestSearchPool.votes,
+            scf=stv.stv,
+            comparator=manip.optimistic_comparator,
+            manip_gen=manip.all_permut_manip_gen,
+        )
+        self.expected = list(manip.search_manips(self.conf, disable_progess=True))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def keys(self, results):
+        return [(r.from_ord, r.to_ord, r.n) for r in results]
+
+    def test_tally(self):
+        # same counts as grouping the whole list
+        results = self.expected + self.expected[:3]
+
+        def by(key):
+            return len(list(itt.groupby(results, key)))
+
+        tally = manip.ResultsTally()
+        for r in results:
+            tally.add(r)
+        self.assertEqual(tally.count, len(results))
+        self.assertEqual(tally.n_from, by(lambda r: r.from_ord))
+        self.assertEqual(tally.n_to, by(lambda r: r.to_ord))
+        self.assertEqual(tally.n_from_to, by(lambda r: (r.from_ord, r.to_ord)))
+
+    def test_export(self):
+        # a sink and a list export the same files
+        sink = self.exporter.sink("a.txt", "spec", self.conf)
+        for _ in sink.write_through(iter(self.expected)):
+            pass
+        info = ExecInfo(datetime.now(), datetime.now())
+        self.exporter("a.txt", "spec", self.conf, sink, info)
+        self.exporter("b.txt", "spec", self.conf, self.expected, info)
+        store = ResultsExporter.store_name
+        for name in [
+            os.path.join(store, resultstore.RECORDS_NAME),
+            os.path.join(store, resultstore.BALLOTS_NAME),
+            ResultsExporter.summary_name,
+        ]:
+            a, b = [os.path.join(self.dir, d, "spec", name) for d in ["a", "b"]]
+            with open(a, "rb") as fa, open(b, "rb") as fb:
+                self.assertEqual(fa.read(), fb.read())
+
+        # the stored results are the same, read on demand
+        loaded = load_results(os.path.join(self.dir, "a", "spec"))
+        self.assertIsInstance(loaded, resultstore.StoredResults)
+        self.assertEqual(len(loaded), len(self.expected))
+        self.assertEqual(loaded[-1], self.expected[-1])
+        self.assertEqual(list(loaded), self.expected)
+        self.assertEqual(loaded[1:3], self.expected[1:3])
+
+        # results pickled as a list by older versions are still read
+        the_dir = os.path.join(self.dir, "old")
+        os.makedirs(the_dir)
+        with open(os.path.join(the_dir, ResultsExporter.pickle_name), "wb") as f:
+            pickle.dump(self.expected, f)
+        self.assertEqual(load_results(the_dir), self.expected)
+
+    def test_empty(self):
+        sink = self.exporter.sink("a.txt", "spec", self.conf)
+        info = ExecInfo(datetime.now(), datetime.now())
+        self.exporter("a.txt", "spec", self.conf, sink, info)
+        self.assertEqual(len(load_results(os.path.join(self.dir, "a", "spec"))), 0)
+
+    def test_resume(self):
+        # interrupted searches leave no duplicates in the sink
+        path = self.exporter.checkpoint_path("a.txt", "spec", self.conf)
+        for stop in [2, 1, None]:
+            sink = self.exporter.sink("a.txt", "spec", self.conf)
+            results = checkpoint.search_manips(
+                self.conf, path, interval=0, resume=True, sink=sink
+            )
+            found = list(itt.islice(results, stop))
+            results.close()
+            self.assertLessEqual(len(found), stop or len(self.expected))
+        info = ExecInfo(datetime.now(), datetime.now())
+        self.exporter("a.txt", "spec", self.conf, sink, info)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(sink.tally.count, len(self.expected))
+        self.assertEqual(load_result(sink.path), self.expected)
+
+
+class TestResultsIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.dir, "results")
+        shutil.copytree("./sample_results", self.out_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_index(self):
+        # results written without the index are found
+        index = load_index(self.out_dir)
+        self.assertEqual(sorted(index), ["mayor", "pliny"])
+        self.assertEqual(len(index["pliny"]), 8)
+        meta = index["pliny"]["stv_optim_perm"]
+        self.assertEqual(meta["summary"]["results"]["count"], "2")
+        self.assertEqual(meta["summary"]["config"]["scf"], "stv")
+        self.assertTrue(
+            os.path.exists(os.path.join(self.out_dir, ResultsExporter.index_name))
+        )
+
+        # the exporter adds its results
+        conf = manip.ManipulatorConfig(
+            trueballs=TestSearchPool.votes,
+            scf=stv.stv,
+            comparator=manip.optimistic_comparator,
+            manip_gen=manip.permut_manip_gen,
+        )
+        results = list(manip.search_manips(conf, disable_progess=True))
+        exporter = ResultsExporter(self.out_dir)
+        info = ExecInfo(datetime.now(), datetime.now())
+        exporter("toy.txt", "stv_optim_perm", conf, results, info)
+        with open(os.path.join(self.out_dir, ResultsExporter.index_name)) as f:
+            written = json.load(f)
+        self.assertEqual(
+            written["toy"]["stv_optim_perm"]["summary"]["results"]["count"],
+            str(len(results)),
+        )
+
+        # removed results are dropped
+        shutil.rmtree(os.path.join(self.out_dir, "mayor"))
+        shutil.rmtree(os.path.join(self.out_dir, "pliny", "stv_optim_perm"))
+        index = load_index(self.out_dir)
+        self.assertEqual(sorted(index), ["pliny", "toy"])
+        self.assertNotIn("stv_optim_perm", index["pliny"])
+
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.exporter = ResultsExporter(self.dir)
+        self.path = os.path.join(self.dir, ResultsExporter.catalog_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def export(self, spec, comparator):
+        conf = manip.ManipulatorConfig(
+            trueballs=TestSearchPool.votes,
+            scf=stv.stv,
+            comparator=comparator,
+            manip_gen=manip.permut_manip_gen,
+        )
+        results = list(manip.search_manips(conf, disable_progess=True))
+        info = ExecInfo(datetime.now(), datetime.now())
+        self.exporter("toy.txt", spec, conf, results, info)
+        return results
+
+    def test_catalog(self):
+        optim = self.export("stv_optim_perm", manip.optimistic_comparator)
+        self.export("stv_optim_perm", manip.optimistic_comparator)
+        self.export("stv_pess_perm", manip.pessimistic_comparator)
+
+        runs = catalog.runs(self.path)
+        self.assertEqual([r["id"] for r in runs], [1, 2, 3])
+        self.assertEqual(runs[0]["count"], len(optim))
+        latest = catalog.runs(self.path, latest=True, spec="stv_optim_perm")
+        self.assertEqual([r["id"] for r in latest], [2])
+
+        rows = catalog.results(self.path, 1)
+        self.assertEqual(len(rows), len(optim))
+        self.assertEqual([r["n"] for r in rows], sorted(r.n for r in optim))
+        self.assertEqual(len(catalog.results(self.path, 1, limit=1)), 1)
+
+        stats = catalog.stats(self.path, ["spec"])
+        specs = [s["spec"] for s in stats]
+        self.assertEqual(specs, ["stv_optim_perm", "stv_pess_perm"])
+        self.assertEqual([s["runs"] for s in stats], [1, 1])
+        if optim:
+            self.assertEqual(stats[0]["min_n"], min(r.n for r in optim))
+        self.assertEqual(catalog.stats(self.path, [], latest=False)[0]["runs"], 3)
+        with self.assertRaises(ValueError):
+            catalog.stats(self.path, ["n"])
+
+        count = catalog.query(self.path, "SELECT COUNT(*) FROM runs")
+        self.assertEqual(count[0][0], 3)
+        with self.assertRaises(sqlite3.Error):
+            catalog.query(self.path, "DELETE FROM runs")
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_suite(self):
+        elections = suite.dataset_elections(["./data/pliny.txt"])
+        synthetic = suite.synthetic_elections([100, 1000], n_alts=4)
+        self.assertEqual(synthetic[1].shape, {"voters": 1000, "ballots": 24, "alts": 4})
+
+        specs = {
+            "stv_optim_perm": {
+                "scf": stv.stv,
+                "comparator": manip.optimistic_comparator,
+                "manip_gen": manip.permut_manip_gen,
+            }
+        }
+        timings = suite.run_suite(
+            elections + synthetic, specs, min_time=0.01, budget=0.05
+        )
+        benches = [t.bench for t in timings if t.election == "pliny"]
+        self.assertEqual(benches, suite.BENCHES)
+        search = [t for t in timings if t.bench == "search"][0]
+        # the whole pliny search fits in the budget
+        self.assertEqual(search.extra["results"], 2)
+        self.assertEqual(search.extra["done"], 1.0)
+        self.assertGreater(search.extra["scf_elections"], 0)
+
+        rep = suite.report(timings, timings[len(benches) :], {})
+        self.assertIn("stv", rep["scaling"])
+        with tempfile.TemporaryDirectory() as d:
+            rep = suite.load_report(suite.save_report(rep, d))
+        speedups = [s for _, _, _, s in suite.compare(rep, rep)]
+        self.assertEqual(len(speedups), len(timings))
+        self.assertTrue(all(s == 1 for s in speedups))
+
+
+class TestSynthetic(unittest.TestCase):
+    def test_strict(self):
+        orders = synthetic.impartial_culture(2000, 4, seed=0)
+        self.assertEqual(sorted(orders[0]), [1, 2, 3, 4])
+        counts = {}
+        for o in orders.tolist():
+            counts[tuple(o)] = counts.get(tuple(o), 0) + 1
+        votes = synthetic.to_profiles(orders)
+        self.assertEqual(
+            {tuple(a for (a,) in p.ballot): p.count for p in votes}, counts
+        )
+        # most common first
+        self.assertEqual(votes[0].count, max(counts.values()))
+
+    def test_models(self):
+        for model in synthetic.MODELS:
+            votes = synthetic.generate(model, 3000, 6, 0.3, 0.2, seed=1)
+            self.assertEqual(stv.tot_votes(votes), 3000)
+            self.assertEqual(stv.merge_profiles(votes), votes)
+            self.assertTrue(stv.all_alts(votes) <= set(range(1, 7)))
+            # same seed, same election
+            self.assertEqual(
+                synthetic.generate(model, 3000, 6, 0.3, 0.2, seed=1), votes
+            )
+
+    def test_model_params(self):
+        self.assertEqual(
+            synthetic.generate("mallows", 100, 4, phi=0),
+            [Profile([[1], [2], [3], [4]], 100)],
+        )
+        self.assertEqual(len(synthetic.generate("urn", 500, 4, alpha=1e6)), 1)
+
+        orders = synthetic.single_peaked(1000, 6, seed=0).tolist()
+        # the top k alternatives are contiguous on the axis
+        for o in orders:
+            for k in range(1, 7):
+                self.assertEqual(max(o[:k]) - min(o[:k]), k - 1)
+        self.assertEqual(len(set(map(tuple, orders))), 2**5)
+
+    def test_preflib(self):
+        votes = synthetic.generate("urn", 1000, 5, 0.3, 0.2, seed=2)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "urn.toi")
+            synthetic.write_preflib(path, votes)
+            self.assertEqual(stv.extract_data(path), votes)
+            meta = stv.read_metadata(path)
+        self.assertEqual(meta["DATA TYPE"], "toi")
+        self.assertEqual(meta["NUMBER VOTERS"], "1000")
+
 # class TestPlinyManipulation(TestPlinyManipulation):
 #     multiproc = True
 
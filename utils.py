@@ -43,3 +43,28 @@ def aka_or_name(v: Any) -> Optional[str]:
     elif hasattr(v, "__name__"):
         return v.__name__
     return None
+
+
+def monotone(f):
+    """Declares that `f` (an scf or a comparator) is monotone in the number of
+    voters switching to a manipulated ballot: once the manipulation succeeds,
+    more switchers still make it succeed.
+    """
+    f.__monotone__ = True
+    return f
+
+
+def is_monotone(v: Any) -> bool:
+    return getattr(v, "__monotone__", False)
+
+
+def ballot_classes(classes):
+    """Declares the generator of the ballot equivalence classes of an scf,
+    see `STVComputations.plurality_ballot_classes`
+    """
+
+    def dec(f):
+        f.__ballot_classes__ = classes
+        return f
+
+    return dec
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Long lived pool of worker processes for the manipulation search.
+
+A `SearchPool` is created once (e.g. for all the specs of a `manip_main.py run`)
+instead of once per search. The truthful ballots of each election are put once in
+shared memory (`SharedBallots`, packed as in `datacache.encode` plus the pickled
+List[Profile], so the workers see the very same ballots) and a
+`ManipulatorConfig` that refers to them is pickled without its ballots: every worker
+attaches to the shared block the first time it sees it and keeps the decoded
+ballots for all the following tasks. Tasks are sent to the pool in chunks.
+"""
+import os
+import pickle
+import threading
+from dataclasses import dataclass
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+import datacache
+from compiled import CompiledElection
+from STVComputations import Profile
+import STVComputations as stv
+
+# default number of candidates sent to a worker at once
+CHUNKSIZE = 8
+# chunks queued per worker by `SearchPool.imap`
+WINDOW_CHUNKS = 4
+# slots of the cancellation table of a pool (see `Cancellable`)
+CANCEL_SLOTS = 1024
+
+
+@dataclass(frozen=True)
+class SharedBallots:
+    """Handle of a List[Profile] stored in shared memory, cheap to pickle: the block
+    holds the compiled election (`shape` int32 matrix) then the pickled profiles
+    (`profiles_size` bytes)
+    """
+
+    name: str
+    shape: Tuple[int, int]
+    profiles_size: int
+
+    def attach(self) -> "Attached":
+        "The data of the shared block, decoded once per process"
+        if self.name not in _attached:
+            shm = SharedMemory(name=self.name)
+            mat = np.ndarray(self.shape, dtype=np.int32, buffer=shm.buf)
+            election = datacache.decode(mat)
+            with shm.buf[mat.nbytes : mat.nbytes + self.profiles_size] as data:
+                profiles = pickle.loads(data)
+            ballot_index: Dict[stv.BallotKey, int] = {}
+            for i, p in enumerate(profiles):
+                ballot_index.setdefault(stv.ballot_key(p.ballot), i)
+            _attached[self.name] = Attached(shm, election, profiles, ballot_index)
+        return _attached[self.name]
+
+
+@dataclass
+class Attached:
+    """A shared block as seen by a process: the compiled election is a view on the
+    shared memory, the profiles are unpickled from it.
+    """
+
+    shm: SharedMemory
+    election: CompiledElection
+    profiles: List[Profile]
+    ballot_index: Dict[stv.BallotKey, int]
+
+
+# the shared blocks this process is attached to, by name
+_attached: Dict[str, Attached] = {}
+
+
+@dataclass(frozen=True)
+class Cancellable:
+    """A task of the `imap` call number `seq` of a pool: the call is cancelled when
+    `seq` is written in its slot of the cancellation table (shared memory block
+    `table`), then the workers skip its tasks.
+    """
+
+    task: Callable
+    table: str
+    seq: int
+
+    def __call__(self, item):
+        if self.cancelled():
+            return None
+        return self.task(item)
+
+    def cancelled(self) -> bool:
+        if self.table not in _tables:
+            shm = SharedMemory(name=self.table)
+            _tables[self.table] = (shm, np.ndarray(CANCEL_SLOTS, np.int64, shm.buf))
+        return _tables[self.table][1][self.seq % CANCEL_SLOTS] == self.seq
+
+
+# the cancellation tables this process is attached to, by name
+_tables: Dict[str, Tuple[SharedMemory, np.ndarray]] = {}
+
+
+class SearchPool:
+    """A process pool plus the shared memory blocks of the elections it searches,
+    use it as a context manager: on exit the pool is closed and the blocks released.
+    """
+
+    def __init__(self, processes=None, chunksize: int = CHUNKSIZE):
+        # the workers must share the resource tracker of this process, else each
+        # one starts its own that unlinks (again) at exit the blocks it attached to
+        resource_tracker.ensure_running()
+        self.processes = processes or os.cpu_count() or 1
+        self.pool = Pool(self.processes)
+        self.chunksize = chunksize
+        # max number of tasks queued or running, enough to keep all the workers busy
+        self.window = WINDOW_CHUNKS * self.processes * chunksize
+        # the imap calls made so far, and the calls cancelled by slot
+        self._seq = 0
+        self._table = SharedMemory(create=True, size=CANCEL_SLOTS * 8)
+        self._cancelled = np.ndarray(CANCEL_SLOTS, np.int64, self._table.buf)
+        self._cancelled[:] = -1
+        # the shared blocks, by id of the List[Profile] they hold
+        self._shared: Dict[int, Tuple[List[Profile], SharedMemory, SharedBallots]] = {}
+
+    def share(self, votes: List[Profile]) -> SharedBallots:
+        "Put the ballots in shared memory, once for the same List[Profile]"
+        if id(votes) not in self._shared:
+            mat = datacache.encode(CompiledElection.from_profiles(votes))
+            data = pickle.dumps(votes, protocol=pickle.HIGHEST_PROTOCOL)
+            shm = SharedMemory(create=True, size=mat.nbytes + len(data))
+            np.ndarray(mat.shape, dtype=mat.dtype, buffer=shm.buf)[:] = mat
+            shm.buf[mat.nbytes : mat.nbytes + len(data)] = data
+            handle = SharedBallots(shm.name, mat.shape, len(data))
+            # NOTE: votes is kept so its id is not reused
+            self._shared[id(votes)] = (votes, shm, handle)
+        return self._shared[id(votes)][2]
+
+    def imap(self, task: Callable, items: Iterable) -> Iterator:
+        """`Pool.imap` in chunks: results come in the order of `items`, while the
+        workers take the next chunk as soon as they are free.
+        Closing the returned generator cancels the call: no more items are read and
+        the workers skip the tasks already queued.
+        NOTE: the pool reads `items` ahead of the results, at most `window` items
+        """
+        seq = self._seq
+        self._seq += 1
+        task = Cancellable(task, self._table.name, seq)
+        window = threading.Semaphore(self.window)
+        stop = threading.Event()
+
+        def feed():
+            # runs in the task thread of the pool
+            for item in items:
+                while not window.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                yield item
+
+        try:
+            for result in self.pool.imap(task, feed(), chunksize=self.chunksize):
+                window.release()
+                yield result
+        finally:
+            # a search stopped early must not hold the task thread of the pool
+            # nor the workers
+            stop.set()
+            self._cancelled[seq % CANCEL_SLOTS] = seq
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for _, shm, handle in self._shared.values():
+            _attached.pop(handle.name, None)
+            shm.close()
+            shm.unlink()
+        self._shared.clear()
+        _tables.pop(self._table.name, None)
+        del self._cancelled
+        self._table.close()
+        self._table.unlink()
+
+    def __enter__(self) -> "SearchPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()